@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+from math import pi
+from typing import List
+
+import numpy as np
+
+from projectile.core.Constants import X_INDEX, Y_INDEX, Z_INDEX
+from projectile.core.Position import Position
+from projectile.data.DataPoints import ProjectileDataPoint
+from projectile.forces.ForceContext import ForceContext
+from projectile.util import sgn, BatchRollingStatistic, haversine, spherical_to_planar_coord
+
+
+class BatchProjectile:
+    """
+    N projectiles flying through the same environment in lockstep. Follows the Euler integrator step by step, but
+    keeps the state in arrays (positions and masses of shape (N,), velocities of shape (N, 3)), so one call advances
+    the whole batch. Projectiles which hit the ground are compacted out with compact(); ids maps rows to the original
+    indices.
+    Each projectile has its own list of thrusts, which are NOT added to the environment (it is shared by the batch).
+    """
+    def __init__(self, environment: Environment, masses: List[float], positions: List[Position],
+                 thrusts: List[List[ThrustForce]] = None, cross_section=lambda axis, pitch, yaw: 0.25,
+                 drag_coef=lambda axis, pitch, yaw: 0.1, vy_corrective_change_threshold=0.1,
+                 distance_rolling_window=40, forces_writers: List[ForcesCsvWriter] = None):
+        n = len(positions)
+        if thrusts is None:
+            thrusts = [[] for _ in range(n)]
+        self.ids = np.arange(n)
+        self.environment = environment
+        self.thrust = thrusts
+        self.initial_mass = np.array(masses, "float64") + \
+            np.array([sum(t.remaining_fuel for t in th) for th in thrusts], "float64")
+        self.lost_mass = np.zeros(n)
+        self.velocities = np.zeros([n, 3])
+        self.position = Position([p.lat for p in positions], [p.lon for p in positions], [p.alt for p in positions])
+        self.cross_section = cross_section
+        self.drag_coef = drag_coef
+        self.vy_corrective_change_threshold = vy_corrective_change_threshold
+        self.forces_writers = forces_writers
+        self.crossed_the_pole = np.zeros(n, "bool")
+        self.directions = np.zeros([n, 3])
+        self.time = 0
+        self.distance_travelled = np.zeros(n)
+        self.total_velocity = np.zeros(n)
+        self.planar_velocity = np.zeros(n)
+        self.pitch = np.zeros(n)
+        self.yaw = np.zeros(n)
+        self.dt = 0
+        self.distance_stats = BatchRollingStatistic(n, distance_rolling_window)
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    def row(self, index: int) -> BatchRow:
+        return BatchRow(self, index)
+
+    def launch_at_angle(self, pitch: np.ndarray, yaw: np.ndarray, velocity: np.ndarray) -> None:
+        """Same as Projectile.launch_at_angle, one value (or a broadcastable scalar) per projectile."""
+        self.pitch = np.broadcast_to(np.array(pitch, "float64"), self.size).copy()
+        self.yaw = np.broadcast_to(np.array(yaw, "float64"), self.size).copy()
+        self.velocities[:, X_INDEX] = velocity * np.cos(self.yaw) * np.cos(self.pitch)
+        self.velocities[:, Y_INDEX] = velocity * np.sin(self.yaw) * np.cos(self.pitch)
+        self.velocities[:, Z_INDEX] = velocity * np.sin(self.pitch)
+
+    def get_forces_intensities(self) -> np.ndarray:
+        """
+        Environment forces followed by each projectile's thrusts; projectiles with fewer thrusts are padded with zeros.
+        Thrusts are evaluated one projectile at a time (they burn fuel and call user-defined lambdas), but only for
+        projectiles which still have fuel.
+        :return: intensity tensor of shape N x (n + max thrust count) x 3
+        """
+        env_forces = self.environment.get_batch_forces_intensities(self)
+        max_thrusts = max(map(len, self.thrust), default=0)
+        if max_thrusts == 0:
+            return env_forces
+        thrust_forces = np.zeros([self.size, max_thrusts, 3])
+        for i, thrusts in enumerate(self.thrust):
+            if any(t.remaining_fuel > 0 for t in thrusts):
+                context = ForceContext(self.row(i), self.environment)
+                for j, thrust in enumerate(thrusts):
+                    thrust_forces[i, j] = thrust.evaluate(context)
+        return np.concatenate([env_forces, thrust_forces], 1)
+
+    def advance(self, dt) -> None:
+        """
+        Advance all projectiles for dt seconds. Vectorized Euler.step, see there for details.
+        :param dt: time which has passed.
+        :return: nothing; state is modified.
+        """
+        self.dt = dt
+        forces = self.get_forces_intensities()
+        if self.forces_writers is not None:
+            env_count = len(self.environment.forces)
+            mass = self.mass()
+            for i, writer in enumerate(self.forces_writers):
+                if writer is not None:
+                    writer.write_values(self.time, mass[i], forces[i, :env_count + len(self.thrust[i])])
+        acc = forces.sum(1) / self.mass()[:, np.newaxis]
+        self.velocities += acc * dt
+        self.planar_velocity = np.sqrt(self.velocities[:, X_INDEX] ** 2 + self.velocities[:, Y_INDEX] ** 2)
+        self.total_velocity = np.sqrt(self.planar_velocity ** 2 + self.velocities[:, Z_INDEX] ** 2)
+        self.directions = np.sign(self.velocities)
+        movements = self.velocities * dt
+
+        self.update_angles()
+        radius = self.environment.earth_radius + self.position.alt
+        distance_m = np.sqrt(movements[:, X_INDEX] ** 2 + movements[:, Y_INDEX] ** 2)
+        distance_rad = distance_m / radius
+
+        angle = self.yaw - pi/2
+        old_lat = self.position.lat
+        old_lon = self.position.lon
+        new_lat = np.arcsin(np.sin(old_lat) * np.cos(distance_rad) +
+                            np.cos(old_lat) * np.sin(distance_rad) * np.cos(angle))
+        cos_lat = np.cos(new_lat)
+        off_pole = np.fabs(cos_lat) >= 10**-12
+        lon_change = np.where(off_pole,
+                              -np.arcsin(np.sin(angle) * np.sin(distance_rad) / np.where(off_pole, cos_lat, 1)), 0)
+        self.position.move(new_lat - old_lat, lon_change, self.velocities[:, Z_INDEX] * dt)
+        self.position.wrap_longitude()
+        self.directions[:, Y_INDEX] = np.sign(self.position.lat - old_lat)
+
+        self.time += dt
+        self.distance_travelled += distance_m
+        self.update_velocities(old_lat, old_lon, radius, distance_m)
+        self.update_angles()
+
+    def update_velocities(self, old_lat: np.ndarray, old_lon: np.ndarray, radius: np.ndarray,
+                          distance_m: np.ndarray) -> None:
+        """
+        Vectorized Projectile.update_velocities. Pole crossing checks are rare, so they go one projectile at a time.
+        """
+        old_vy = self.velocities[:, Y_INDEX].copy()
+        self.velocities[:, Y_INDEX] = (radius * (self.position.lat - old_lat)) / self.dt
+        nonzero = old_vy != 0
+        change_ratio = np.fabs(self.velocities[:, Y_INDEX])
+        change_ratio[nonzero] = np.fabs(self.velocities[nonzero, Y_INDEX] / old_vy[nonzero] - 1)
+        recovering = self.crossed_the_pole.copy()
+        crossing = np.zeros(self.size, "bool")
+        for i in np.flatnonzero(change_ratio > self.vy_corrective_change_threshold):
+            actual_distance = haversine(Position(self.position.lat[i], self.position.lon[i], 0),
+                                        Position(old_lat[i], old_lon[i], 0), radius[i])
+            if self.crossed_the_pole[i]:
+                print(f"Warning! V_y of projectile {self.ids[i]} has too extreme oscillations: {change_ratio[i]}")
+            elif actual_distance < self.distance_stats.mean[i] and \
+                    self.distance_stats.is_outlier(actual_distance, i):
+                print(f"Projectile {self.ids[i]} crossing the pole: change ratio is {change_ratio[i]}f")
+                crossing[i] = True
+                self.crossed_the_pole[i] = True
+                self.position.lon[i] = divmod((old_lon[i] + pi), (2 * pi))[1] - 2*pi
+                yaw = float(self.yaw[i])
+                self.yaw[i] = yaw - pi % (sgn(yaw-pi) * 2 * pi)
+                self.velocities[i, X_INDEX] = spherical_to_planar_coord(X_INDEX, self.total_velocity[i],
+                                                                        self.pitch[i], self.yaw[i])
+                self.velocities[i, Y_INDEX] = spherical_to_planar_coord(Y_INDEX, self.total_velocity[i],
+                                                                        self.pitch[i], self.yaw[i])
+            elif actual_distance < self.distance_stats.mean[i]:
+                print(f"Warning: Vy of projectile {self.ids[i]} has extreme correction, but we're far from poles: "
+                      f"{change_ratio[i]}")
+        self.crossed_the_pole[recovering] = False
+        self.velocities[recovering, Y_INDEX] = old_vy[recovering]
+
+        regular = ~(crossing | recovering)
+        self.distance_stats.update(distance_m, regular)
+        lon_radius = radius * np.cos(self.position.lat)
+        lon_radius = np.where(lon_radius == 0, radius * np.cos(old_lat), lon_radius)
+        lon_change = self.position.lon - old_lon
+        lon_change = np.where(np.fabs(lon_change) < pi, lon_change, lon_change + 2 * pi * np.sign(-lon_change))
+        self.velocities[regular, X_INDEX] = (lon_radius * lon_change)[regular] / self.dt
+
+    def update_angles(self) -> None:
+        """Update pitch and yaw as Projectile.update_angles does, keeping angles which velocities don't define."""
+        planar_velocity = np.sqrt(self.velocities[:, X_INDEX] ** 2 + self.velocities[:, Y_INDEX] ** 2)
+        moving = (planar_velocity != 0) | (self.velocities[:, Z_INDEX] != 0)
+        self.pitch = np.where(moving, np.arctan2(self.velocities[:, Z_INDEX], planar_velocity), self.pitch)
+        self.yaw = np.where(planar_velocity != 0, np.arctan2(self.velocities[:, Y_INDEX], self.velocities[:, X_INDEX]),
+                            self.yaw)
+
+    def mass(self) -> np.ndarray:
+        return self.initial_mass - self.lost_mass
+
+    def has_hit_ground(self) -> np.ndarray:
+        """
+        Which projectiles have hit the ground. surface_altitude is first called with a Position holding arrays; if it
+        can't handle them, it is called once per projectile.
+        :return: boolean mask
+        """
+        try:
+            surface = np.broadcast_to(self.environment.surface_altitude(self.position), self.size)
+        except (TypeError, ValueError):
+            surface = np.array([self.environment.surface_altitude(Position(self.position.lat[i], self.position.lon[i],
+                                                                           self.position.alt[i]))
+                                for i in range(self.size)])
+        return self.position.alt <= surface
+
+    def compact(self, keep: np.ndarray) -> None:
+        """
+        Remove projectiles for which keep is False from the batch.
+        :param keep: boolean mask
+        """
+        self.ids = self.ids[keep]
+        self.thrust = [t for t, k in zip(self.thrust, keep) if k]
+        if self.forces_writers is not None:
+            self.forces_writers = [w for w, k in zip(self.forces_writers, keep) if k]
+        self.initial_mass = self.initial_mass[keep]
+        self.lost_mass = self.lost_mass[keep]
+        self.velocities = self.velocities[keep]
+        self.position = self.position[keep]
+        self.crossed_the_pole = self.crossed_the_pole[keep]
+        self.directions = self.directions[keep]
+        self.distance_travelled = self.distance_travelled[keep]
+        self.total_velocity = self.total_velocity[keep]
+        self.planar_velocity = self.planar_velocity[keep]
+        self.pitch = self.pitch[keep]
+        self.yaw = self.yaw[keep]
+        self.distance_stats.compact(keep)
+
+    def get_state(self, index: int) -> ProjectileDataPoint:
+        """
+        Get state of one projectile in a convenient format for writing to file
+        :param index: row of the projectile (not its id)
+        :return: DataPoint for current projectile state
+        """
+        fuel = sum(t.remaining_fuel for t in self.thrust[index])
+        return ProjectileDataPoint(self.time, self.distance_travelled[index], self.position.lat[index],
+                                   self.position.lon[index], self.position.alt[index],
+                                   self.velocities[index, X_INDEX], self.velocities[index, Y_INDEX],
+                                   self.velocities[index, Z_INDEX], self.pitch[index], self.yaw[index], fuel)
+
+
+class BatchRow:
+    """
+    Single projectile of a BatchProjectile, looking like a Projectile. Passed to lambdas which don't know how to work
+    with the whole batch, such as thrusts or forces without get_batch. Reads and writes go to the batch arrays.
+    """
+    def __init__(self, batch: BatchProjectile, index: int):
+        self.batch = batch
+        self.index = index
+        self.position = BatchRowPosition(batch.position, index)
+        self.velocities = batch.velocities[index]  # a view, so writes go through
+        self.directions = batch.directions[index]
+        self.environment = batch.environment
+        self.cross_section = batch.cross_section
+        self.drag_coef = batch.drag_coef
+        self.thrust = batch.thrust[index]
+        self.fuel_in_state = False
+
+    @property
+    def time(self) -> float:
+        return self.batch.time
+
+    @property
+    def dt(self) -> float:
+        return self.batch.dt
+
+    @property
+    def pitch(self) -> float:
+        return self.batch.pitch[self.index]
+
+    @property
+    def yaw(self) -> float:
+        return self.batch.yaw[self.index]
+
+    @property
+    def lost_mass(self) -> float:
+        return self.batch.lost_mass[self.index]
+
+    @lost_mass.setter
+    def lost_mass(self, value: float) -> None:
+        self.batch.lost_mass[self.index] = value
+
+    @property
+    def distance_travelled(self) -> float:
+        return self.batch.distance_travelled[self.index]
+
+    @property
+    def total_velocity(self) -> float:
+        return self.batch.total_velocity[self.index]
+
+    @property
+    def planar_velocity(self) -> float:
+        return self.batch.planar_velocity[self.index]
+
+    def mass(self) -> float:
+        return self.batch.initial_mass[self.index] - self.batch.lost_mass[self.index]
+
+
+class BatchRowPosition:
+    """Position of a single BatchRow."""
+    def __init__(self, position: Position, index: int):
+        self.batch_position = position
+        self.index = index
+
+    @property
+    def lat(self):
+        return self.batch_position.lat[self.index]
+
+    @property
+    def lon(self):
+        return self.batch_position.lon[self.index]
+
+    @property
+    def alt(self):
+        return self.batch_position.alt[self.index]
@@ -3,32 +3,44 @@ from typing import List
 
 import numpy as np
 
+from projectile.core.AtmosphereTable import AtmosphereTable
 from projectile.core.Constants import DEBUG, R, StandardAtmosphere
 from projectile.core.Position import Position
 from projectile.core.Projectile import Projectile
+from projectile.data.BinaryIO import is_binary, ForcesBinaryReader
 from projectile.data.CsvReaders import ForcesCsvReader
 from projectile.forces.CentrifugalForce import CentrifugalForce
 from projectile.forces.CoriolisForce import CoriolisForce
 from projectile.forces.DragForce import DragForce
 from projectile.forces.Force import Force
+from projectile.forces.ForceContext import ForceContext
 from projectile.forces.NewtonianGravity import NewtonianGravity
-from projectile.data.Plotter import simple_force_plot
+from projectile.data.Plotter import plot_forces
 
 
 class Environment:
     """
     Environment inside which projectile is launched. Defines all properties related to the earth (or any desired planet)
     It contains a list of forces which are applied to every projectile flying in this environment.
+    Density, pressure and temperature are looked up in the atmosphere table, if there is one (see tabulate_atmosphere)
+    and the altitude is inside it; otherwise they're calculated from the atmosphere's layers.
     """
 
     def __init__(self, earth_radius=6378137, earth_angular_velocity=7.2921159e-5, surface_altitude=lambda pos: 0,
-                 std_gravity_acc=9.80665, atmosphere=StandardAtmosphere()):
+                 std_gravity_acc=9.80665, atmosphere=StandardAtmosphere(), atmosphere_table: AtmosphereTable = None,
+                 slow_force_interval=0.0):
+        """
+        :param slow_force_interval: update interval (s) of gravity, Coriolis and centrifugal force; see Force
+        """
         self.earth_radius = earth_radius
         self.earth_angular_velocity = earth_angular_velocity
         self.surface_altitude = surface_altitude
         self.std_gravity = std_gravity_acc
         self.atmosphere = atmosphere
-        self.forces: List[Force] = [NewtonianGravity(), DragForce(), CoriolisForce(), CentrifugalForce()]
+        self.atmosphere_table = atmosphere_table
+        self.atmosphere_top = 150000  # there's no atmosphere (density is 0) above this altitude
+        self.forces: List[Force] = [NewtonianGravity(update_interval=slow_force_interval), DragForce(),
+                                    CoriolisForce(slow_force_interval), CentrifugalForce(slow_force_interval)]
 
     def add_force(self, force: Force) -> None:
         self.forces.append(force)
@@ -40,11 +52,25 @@ class Environment:
                 return
         print(f"Non-existing force {type(force).__name__}!")
 
+    def tabulate_atmosphere(self, step=10.0) -> AtmosphereTable:
+        """
+        Sample this environment's atmosphere into a table which is used from now on. The table can be passed to other
+        environments with the same atmosphere (e.g. in worker processes) instead of being built again.
+        :param step: distance between samples (m)
+        :return: the table
+        """
+        self.atmosphere_table = None
+        self.atmosphere_table = AtmosphereTable.build(self, step)
+        return self.atmosphere_table
+
     # noinspection PyPep8Naming
     def density(self, altitude: float) -> float:
         """Works up to 86km; above that, things start falling apart (literally, air molecules start falling apart)"""
-        if altitude > 150000:
+        if altitude > self.atmosphere_top:
             return 0
+        table = self.atmosphere_table
+        if table is not None and table.bottom <= altitude <= table.top:
+            return table.density(altitude)
         h = altitude
         rho_b = self.atmosphere.mass_density(h)
         T = self.atmosphere.base_temp(h)
@@ -57,40 +83,106 @@ class Environment:
         else:
             return rho_b * ((T / (T + L * (h-h_b))) ** (1 + ((g_0 * M) / (R * L))))
 
-    def pressure(self, altitude: float) -> float:
-        rho = self.density(altitude)
-        temp = self.atmosphere.base_temp(altitude) + (altitude-self.atmosphere.atmosphere_layer_start(altitude)) \
-             * self.atmosphere.temp_lapse_rate(altitude)
-        return rho / self.atmosphere.molar_mass(altitude) * R * temp
+    def pressure(self, altitude: float, density: float = None) -> float:
+        """
+        :param altitude: altitude
+        :param density: atmosphere density at the altitude, if it's already known
+        """
+        table = self.atmosphere_table
+        if table is not None and table.bottom <= altitude <= min(table.top, self.atmosphere_top):
+            return table.pressure(altitude)
+        rho = self.density(altitude) if density is None else density
+        return rho / self.atmosphere.molar_mass(altitude) * R * self.temperature(altitude)
+
+    def temperature(self, altitude: float) -> float:
+        table = self.atmosphere_table
+        if table is not None and table.bottom <= altitude <= table.top:
+            return table.temperature(altitude)
+        return self.atmosphere.base_temp(altitude) + (altitude-self.atmosphere.atmosphere_layer_start(altitude)) \
+            * self.atmosphere.temp_lapse_rate(altitude)
+
+    def densities(self, altitudes: np.ndarray) -> np.ndarray:
+        """Atmosphere density for each of the altitudes."""
+        table = self.atmosphere_table
+        if table is None:
+            return np.array([self.density(altitude) for altitude in altitudes], "float64")
+        inside = table.covers(altitudes) & (altitudes <= self.atmosphere_top)
+        densities = table.density(np.clip(altitudes, table.bottom, table.top))
+        for i in np.flatnonzero(~inside):
+            densities[i] = self.density(altitudes[i])
+        return densities
 
     def get_forces_intensities(self, projectile) -> np.array:
         """
         Returns a matrix of all forces acting on the projectile. Matrix is of shape n x 3, where n is number of forces
-        in this environment.
+        in this environment. All forces share the same ForceContext.
+        Forces with an update interval are evaluated only when their last evaluation for this projectile is at least
+        that old (in either direction, integrator stages can go back in time). Otherwise their intensity per unit of
+        mass is extrapolated linearly from the last two evaluations; they're all proportional to mass. Indices of such
+        forces are left in projectile.reused_forces, so they can be marked when the intensities are written.
         :param projectile: projectile on which forces act
         :return: intensity matrix
         """
-        intensities = np.zeros([len(self.forces), 3], "float128")
+        intensities = np.zeros([len(self.forces), 3])
         if DEBUG:
             print(f"Position: {projectile.position.lat}, {projectile.position.lon}, {projectile.position.alt}")
-        i = 0
-        for force in self.forces:
-            intensities[i] = np.array([force.get_x(projectile, self), force.get_y(projectile, self),
-                                       force.get_z(projectile, self)])
-            i += 1
+        context = ForceContext(projectile, self)
+        time = projectile.time
+        samples = projectile.force_samples
+        reused = []
+        for i, force in enumerate(self.forces):
+            if force.update_interval > 0:
+                sample = samples.get(i)
+                if sample is not None and sample[7] and abs(time - sample[0]) < force.update_interval:
+                    last_time, ax, ay, az, sx, sy, sz, _ = sample
+                    elapsed, mass = time - last_time, context.mass
+                    intensities[i] = ((ax + sx * elapsed) * mass, (ay + sy * elapsed) * mass,
+                                      (az + sz * elapsed) * mass)
+                    reused.append(i)
+                    continue
+                intensities[i] = force.evaluate(context)
+                samples[i] = self.force_sample(sample, time, intensities[i] / context.mass)
+            else:
+                intensities[i] = force.evaluate(context)
+        projectile.reused_forces = reused
         if DEBUG:
             print(intensities)
             print("\n")
 
         return intensities
 
+    @staticmethod
+    def force_sample(previous: tuple, time: float, acceleration: np.ndarray) -> tuple:
+        """
+        Evaluation of a slow force, as kept by get_forces_intensities: time, intensity per unit of mass, its rate of
+        change since the previous evaluation and whether that rate is known. Until it is (i.e. on the first evaluation),
+        the force isn't extrapolated.
+        """
+        ax, ay, az = acceleration.tolist()
+        if previous is None or previous[0] == time:
+            return time, ax, ay, az, 0.0, 0.0, 0.0, False
+        elapsed = time - previous[0]
+        return time, ax, ay, az, (ax - previous[1]) / elapsed, (ay - previous[2]) / elapsed, \
+            (az - previous[3]) / elapsed, True
+
+    def get_batch_forces_intensities(self, batch) -> np.ndarray:
+        """
+        Returns intensities of all forces in this environment for every projectile in the batch. Tensor is of shape
+        N x n x 3, where N is number of projectiles in the batch and n is number of forces in this environment.
+        :param batch: BatchProjectile on which forces act
+        :return: intensity tensor
+        """
+        intensities = np.zeros([batch.size, len(self.forces), 3])
+        for i, force in enumerate(self.forces):
+            intensities[:, i] = force.get_batch(batch, self)
+        return intensities
+
     def create_projectile(self, mass: float, initial_position: Position, cross_section=lambda axis, pitch, yaw: 0.25,
-                          drag_coef=lambda axis, pitch, yaw: 0.05, forces_writer=None) -> Projectile:
+                          drag_coef=lambda axis, pitch, yaw: 0.05, forces_writer=None, integrator=None,
+                          cartesian=False) -> Projectile:
         return Projectile(self, mass, [0, 0, 0], initial_position, cross_section, drag_coef,
-                          forces_writer=forces_writer)
+                          forces_writer=forces_writer, integrator=integrator, cartesian=cartesian)
 
     def plot_all_forces(self, forces_filename: str) -> None:
-        i = 0
-        for force in self.forces:
-            simple_force_plot(ForcesCsvReader(forces_filename), i, type(force).__name__)
-            i += 1
+        reader = ForcesBinaryReader if is_binary(forces_filename) else ForcesCsvReader
+        plot_forces(reader(forces_filename), [type(force).__name__ for force in self.forces])
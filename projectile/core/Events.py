@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+from math import cos, pi, atan2, sqrt
+from typing import List, Callable
+
+import numpy as np
+
+from projectile.core.Position import Position
+from projectile.data.DataPoints import ProjectileDataPoint, PROJECTILE_COLUMNS
+from projectile.data.Sinks import SummarySink
+from projectile.data.TrajectoryBuffer import TrajectoryBuffer, ForcesBuffer
+
+"""
+Events are moments of the flight which usually fall between two steps: impact, apogee, burnout of a thrust and crossing
+of an altitude. EventDetector watches the flight step by step and locates each event inside the step where it happened,
+by bisection on a cubic Hermite interpolation of the trajectory between the two samples (dense output). Position is
+interpolated using velocities at both ends of the step, so impact point is accurate even with long steps.
+"""
+
+ALTITUDE, Z_SPEED = PROJECTILE_COLUMNS.index("altitude"), PROJECTILE_COLUMNS.index("Vz")  # in values of records
+
+
+class Event:
+    """
+    Something which happened during the flight.
+    """
+    IMPACT = "impact"
+    APOGEE = "apogee"
+    BURNOUT = "burnout"
+    ALTITUDE = "altitude"
+
+    def __init__(self, kind: str, data: ProjectileDataPoint, detail=None):
+        """
+        :param kind: IMPACT, APOGEE, BURNOUT or ALTITUDE
+        :param data: (interpolated) state of the projectile at the moment of the event
+        :param detail: index of the thrust for BURNOUT, altitude for ALTITUDE, None otherwise
+        """
+        self.kind = kind
+        self.data = data
+        self.detail = detail
+
+    @property
+    def time(self) -> float:
+        return self.data.time
+
+    def __str__(self) -> str:
+        detail = "" if self.detail is None else f" {self.detail}"
+        return f"{self.kind}{detail} at {self.data.time:.4f}s: lat {self.data.latitude}, lon {self.data.longitude}, " \
+               f"alt {self.data.altitude:.3f}"
+
+
+class FlightResult:
+    """
+    Outcome of a flight: all events in order in which they happened, the last state of the projectile and, if they were
+    recorded, the whole trajectory and intensities of forces. Without the trajectory, statistics of the records may be
+    there instead.
+    """
+    def __init__(self, events: List[Event], final: ProjectileDataPoint, trajectory: TrajectoryBuffer = None,
+                 forces: ForcesBuffer = None, statistics: SummarySink = None):
+        self.events = events
+        self.final = final
+        self.trajectory = trajectory
+        self.forces = forces
+        self.statistics = statistics
+
+    def of_kind(self, kind: str) -> List[Event]:
+        return [e for e in self.events if e.kind == kind]
+
+    @property
+    def impact(self) -> Event:
+        impacts = self.of_kind(Event.IMPACT)
+        return impacts[0] if impacts else None
+
+    @property
+    def apogee(self) -> Event:
+        """Highest of the apogees, if there are several (e.g. skipping on the atmosphere)"""
+        apogees = self.of_kind(Event.APOGEE)
+        return max(apogees, key=lambda e: e.data.altitude) if apogees else None
+
+    @property
+    def burnouts(self) -> List[Event]:
+        return self.of_kind(Event.BURNOUT)
+
+    def crossings(self, altitude: float) -> List[Event]:
+        return [e for e in self.of_kind(Event.ALTITUDE) if e.detail == altitude]
+
+    @property
+    def end(self) -> ProjectileDataPoint:
+        """Impact point, or the last state if the projectile hasn't hit the ground"""
+        impact = self.impact
+        return self.final if impact is None else impact.data
+
+    @property
+    def max_altitude(self) -> float:
+        altitudes = [e.data.altitude for e in self.of_kind(Event.APOGEE)] + [self.end.altitude]
+        if self.trajectory is not None and len(self.trajectory) > 0:
+            altitudes.append(float(self.trajectory.column("altitude").max()))
+        elif self.statistics is not None:
+            altitudes.append(self.statistics.max_altitude)
+        return max(altitudes)
+
+    @property
+    def max_speed(self) -> float:
+        """Highest speed among the records of the trajectory (or their statistics), None if it wasn't recorded"""
+        if self.trajectory is None or len(self.trajectory) == 0:
+            return None if self.statistics is None else self.statistics.max_speed
+        speeds = np.sqrt(sum(self.trajectory.column(axis) ** 2 for axis in ("Vx", "Vy", "Vz")))
+        return float(speeds.max())
+
+    def summary(self) -> dict:
+        """Flight time, range, impact (or last) position, highest altitude and speed"""
+        end = self.end
+        return {"flight_time": float(end.time), "range": float(end.planar_distance), "latitude": float(end.latitude),
+                "longitude": float(end.longitude), "max_altitude": float(self.max_altitude), "max_speed": self.max_speed}
+
+    def __str__(self) -> str:
+        return "\n".join(str(e) for e in self.events)
+
+
+class EventDetector:
+    """
+    Finds events in each step of a flight. Call start() before the first step and step() after each one. Steps are
+    given as values of records, and data points are only built for steps in which something happens.
+    """
+    def __init__(self, environment: Environment, altitudes: List[float] = (), tolerance=1e-9):
+        """
+        :param environment: environment in which the projectile is flying; gives earth radius and surface altitude
+        :param altitudes: altitudes whose crossing (in either direction) should be reported
+        :param tolerance: how precisely (s) are events located
+        """
+        self.environment = environment
+        self.altitudes = list(altitudes)
+        self.tolerance = tolerance
+        self.events = []
+        self.previous = None
+        self.previous_fuel = None
+
+    def start(self, projectile: Projectile) -> None:
+        self.previous = projectile.state_values()
+        self.previous_fuel = [t.remaining_fuel for t in projectile.thrust]
+
+    def step(self, projectile: Projectile, values: tuple) -> List[Event]:
+        """
+        Look for events in the step which the projectile has just done. Nothing after an impact is reported.
+        :param projectile: projectile after the step
+        :param values: state of the projectile after the step, as values of a record (see Projectile.state_values)
+        :return: events which happened during the step, ordered by time; also appended to events
+        """
+        apogee = self.previous[Z_SPEED] > 0 >= values[Z_SPEED]
+        burnouts = [i for i, (thrust, fuel) in enumerate(zip(projectile.thrust, self.previous_fuel))
+                    if fuel > 0 >= thrust.remaining_fuel]
+        crossings = [altitude for altitude in self.altitudes
+                     if (self.previous[ALTITUDE] - altitude) * (values[ALTITUDE] - altitude) < 0 or
+                     values[ALTITUDE] == altitude != self.previous[ALTITUDE]]
+        hit_ground = projectile.has_hit_ground()
+        events = []
+        if apogee or burnouts or crossings or hit_ground:
+            events = self.locate(projectile, ProjectileDataPoint(*self.previous), ProjectileDataPoint(*values),
+                                 apogee, burnouts, crossings, hit_ground)
+        self.events += events
+        self.previous = values
+        self.previous_fuel = [t.remaining_fuel for t in projectile.thrust]
+        return events
+
+    def locate(self, projectile: Projectile, a: ProjectileDataPoint, b: ProjectileDataPoint, apogee: bool,
+               burnouts: List[int], crossings: List[float], hit_ground: bool) -> List[Event]:
+        """Events found by step between the states a and b, located inside the step and ordered by time."""
+        interpolation = HermiteInterpolation(a, b, self.environment.earth_radius)
+        events = []
+        if apogee:
+            time = self.bisect(interpolation.vertical_speed, a.time, b.time)
+            events.append(Event(Event.APOGEE, interpolation.at(time)))
+        for i in burnouts:
+            fuel = self.previous_fuel[i]
+            flow_rate = projectile.thrust[i].fuel_flow(a.time)
+            time = b.time if flow_rate <= 0 else min(b.time, a.time + fuel / flow_rate)
+            events.append(Event(Event.BURNOUT, interpolation.at(time), i))
+        for altitude in crossings:
+            time = self.bisect(lambda t: (interpolation.altitude(t) - altitude) * (a.altitude - altitude),
+                               a.time, b.time)
+            events.append(Event(Event.ALTITUDE, interpolation.at(time), altitude))
+        if hit_ground:
+            time = b.time
+            if a.altitude > self.surface_altitude(a):
+                time = self.bisect(lambda t: self.height(interpolation.at(t)), a.time, b.time)
+            impact = Event(Event.IMPACT, interpolation.at(time))
+            events = [e for e in events if e.time <= impact.time] + [impact]
+        events.sort(key=lambda e: e.time)
+        return events
+
+    def surface_altitude(self, data: ProjectileDataPoint) -> float:
+        return self.environment.surface_altitude(Position(data.latitude, data.longitude, data.altitude))
+
+    def height(self, data: ProjectileDataPoint) -> float:
+        return data.altitude - self.surface_altitude(data)
+
+    def bisect(self, function: Callable[[float], float], start: float, end: float) -> float:
+        """
+        Find where the function changes sign from positive to non-positive.
+        :param function: function which is positive at start and not positive at end
+        :return: time of the sign change, to within tolerance
+        """
+        while end - start > self.tolerance:
+            middle = (start + end) / 2
+            if middle <= start or middle >= end:  # interval is as small as floats can make it
+                break
+            if function(middle) > 0:
+                start = middle
+            else:
+                end = middle
+        return end
+
+    def result(self, projectile: Projectile, trajectory: TrajectoryBuffer = None, forces: ForcesBuffer = None,
+               statistics: SummarySink = None) -> FlightResult:
+        """Everything found so far, the current state of the projectile and the given records of the flight."""
+        return FlightResult(list(self.events), projectile.get_state(), trajectory, forces, statistics)
+
+
+class HermiteInterpolation:
+    """
+    Trajectory between two samples. Latitude, longitude, altitude and distance are cubic Hermite polynomials which match
+    values and rates of change (given by the velocities) at both samples; velocities and fuel are linear.
+    """
+    def __init__(self, a: ProjectileDataPoint, b: ProjectileDataPoint, earth_radius: float):
+        self.a = a
+        self.b = b
+        self.h = b.time - a.time
+        self.earth_radius = earth_radius
+        self.b_longitude = b.longitude  # b's longitude on the same side of the antimeridian as a's
+        if b.longitude - a.longitude > pi:
+            self.b_longitude -= 2 * pi
+        elif b.longitude - a.longitude < -pi:
+            self.b_longitude += 2 * pi
+
+    def rates(self, data: ProjectileDataPoint) -> (float, float, float, float):
+        """Rates of change of latitude, longitude, altitude and distance"""
+        radius = self.earth_radius + data.altitude
+        cos_lat = cos(data.latitude)
+        lon_rate = data.x_speed / (radius * cos_lat) if cos_lat != 0 else 0
+        return data.y_speed / radius, lon_rate, data.z_speed, sqrt(data.x_speed ** 2 + data.y_speed ** 2)
+
+    def cubic(self, s: float, y0: float, y1: float, d0: float, d1: float) -> float:
+        return (2*s**3 - 3*s**2 + 1) * y0 + (s**3 - 2*s**2 + s) * self.h * d0 + (-2*s**3 + 3*s**2) * y1 + \
+               (s**3 - s**2) * self.h * d1
+
+    def fraction(self, time: float) -> float:
+        return 0 if self.h == 0 else (time - self.a.time) / self.h
+
+    def altitude(self, time: float) -> float:
+        return self.cubic(self.fraction(time), self.a.altitude, self.b.altitude, self.a.z_speed, self.b.z_speed)
+
+    def vertical_speed(self, time: float) -> float:
+        """Derivative of the altitude polynomial"""
+        s, a, b = self.fraction(time), self.a, self.b
+        if self.h == 0:
+            return b.z_speed
+        return (6*s**2 - 6*s) * (a.altitude - b.altitude) / self.h + (3*s**2 - 4*s + 1) * a.z_speed + \
+            (3*s**2 - 2*s) * b.z_speed
+
+    def at(self, time: float) -> ProjectileDataPoint:
+        """Interpolated state at the given time"""
+        a, b = self.a, self.b
+        if time == b.time:
+            return b
+        s = self.fraction(time)
+        a_rates, b_rates = self.rates(a), self.rates(b)
+        latitude = self.cubic(s, a.latitude, b.latitude, a_rates[0], b_rates[0])
+        longitude = self.cubic(s, a.longitude, self.b_longitude, a_rates[1], b_rates[1])
+        longitude = (longitude + pi) % (2 * pi) - pi
+        altitude = self.cubic(s, a.altitude, b.altitude, a_rates[2], b_rates[2])
+        distance = self.cubic(s, a.planar_distance, b.planar_distance, a_rates[3], b_rates[3])
+        vx, vy, vz = (a.x_speed + (b.x_speed - a.x_speed) * s, a.y_speed + (b.y_speed - a.y_speed) * s,
+                      a.z_speed + (b.z_speed - a.z_speed) * s)
+        fuel = a.remaining_fuel + (b.remaining_fuel - a.remaining_fuel) * s
+        return ProjectileDataPoint(time, distance, latitude, longitude, altitude, vx, vy, vz,
+                                   atan2(vz, sqrt(vx ** 2 + vy ** 2)), atan2(vy, vx), fuel)
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+from math import cos, sin, pi, asin, sqrt
+
+import numpy as np
+
+from projectile.core.Constants import X_INDEX, Y_INDEX, Z_INDEX
+from projectile.core.Position import compensated_add
+from projectile.util import sgn, fp_eq, horizontal_speed
+
+"""
+Integrators advance a projectile through time; Projectile.advance delegates each step to one of them. Euler is the
+original, fixed-step scheme. Others work on the projectile's state vector and its equations of motion
+(Projectile.derivatives); while they're stepping, fuel is part of that state, so thrusts don't burn it by themselves,
+and a thrust which is on at the start of a step stays on until its end.
+"""
+
+
+class Integrator:
+    """
+    Defines contract for integrators. Subclass this to introduce new integration schemes.
+    """
+    def __init__(self):
+        self.accepted_steps = 0
+        self.evaluations = 0
+
+    def step(self, projectile: Projectile, dt: float, limit: float = None) -> float:
+        """
+        Advance the projectile by one step.
+        :param projectile: projectile to advance
+        :param dt: step size
+        :param limit: longest allowed step; only integrators which pick their own step size need to respect it
+        :return: size of the step which was taken
+        """
+        raise ValueError("Undefined integrator!")
+
+    def report(self) -> str:
+        return f"{type(self).__name__}: {self.accepted_steps} steps, {self.evaluations} evaluations"
+
+
+class Euler(Integrator):
+    """
+    First-order explicit Euler step on latitude/longitude/altitude, with thrusts burning their own fuel. Cheap, but
+    needs a small dt.
+    """
+    def step(self, projectile: Projectile, dt: float, limit: float = None) -> float:
+        projectile.fuel_in_state = False
+        projectile.dt = dt  # save this - forces may need this
+        if projectile.cartesian:
+            return self.cartesian_step(projectile, dt)
+        # calculate forces based on previous iteration's state
+        forces = projectile.environment.get_forces_intensities(projectile)
+        self.evaluations += 1
+        # if there's a ForcesWriter, we're writing these intensities to file (so they can be plot later)
+        projectile.write_forces(projectile.time, projectile.mass(), forces)
+        acc = forces.sum(0) / projectile.mass()
+        projectile.velocities += acc * dt
+        # velocity in plane parallel to earth surface - 'distance travelled'
+        projectile.planar_velocity = sqrt(projectile.velocities[X_INDEX] ** 2 + projectile.velocities[Y_INDEX] ** 2)
+        # real, total velocity, taking z-axis into account as well
+        projectile.total_velocity = sqrt(projectile.planar_velocity ** 2 + projectile.velocities[Z_INDEX] ** 2)
+        # this is useful for forces acting in opposite (or same) direction
+        projectile.directions = np.sign(projectile.velocities)
+        movements = projectile.velocities * dt
+
+        # update pitch and yaw based on new velocities: we're using these angles (i.e. yaw) for calculating new position
+        projectile.update_angles()
+        position = projectile.position
+        radius = projectile.environment.earth_radius + position.alt
+        distance_m = np.sqrt(movements[X_INDEX] ** 2 + movements[Y_INDEX] ** 2)
+        distance_rad = distance_m / radius  # distance travelled in radians
+
+        angle = projectile.yaw - pi/2  # we're using formula which expects true course angle, not mathematical
+        old_lat = position.lat
+        old_lon = position.lon
+        # Formula source: http://www.edwilliams.org/avform.htm#LL
+        new_lat = asin(sin(old_lat) * cos(distance_rad) + cos(old_lat) * sin(distance_rad) * cos(angle))
+        lon_change = 0
+        if not fp_eq(cos(new_lat), 0):  # if we're on a pole, just don't do anything (this is _very_ rare)
+            lon_change = -asin(sin(angle) * sin(distance_rad) / cos(new_lat))
+        # we're calculating z-movement in the usual way
+        position.move(new_lat - old_lat, lon_change, projectile.velocities[Z_INDEX] * dt)
+        position.wrap_longitude()
+        projectile.directions[Y_INDEX] = sgn(position.lat - old_lat)
+
+        projectile.time += dt
+        projectile.distance_travelled += distance_m
+        # now that we've moved, recalculate x/y/z speeds: we've changed a local tangent plane, so they've changed too
+        projectile.update_velocities(old_lat, old_lon, radius, distance_m)
+        # lastly, update angles so in the next iteration forces will use angles based on new (recalculated) speeds
+        projectile.update_angles()
+        self.accepted_steps += 1
+        return dt
+
+    def cartesian_step(self, projectile: Projectile, dt: float) -> float:
+        """The same step (velocity first, then position) in Earth-centred coordinates."""
+        if projectile.ecef_position is None:
+            projectile.init_ecef()
+        forces = projectile.environment.get_forces_intensities(projectile)
+        self.evaluations += 1
+        projectile.write_forces(projectile.time, projectile.mass(), forces)
+        acc = projectile.local_basis.T @ (forces.sum(0) / projectile.mass())
+        projectile.ecef_velocity = projectile.ecef_velocity + acc * dt
+        movement = projectile.ecef_velocity * dt
+        distance_m = horizontal_speed(projectile.ecef_position, movement)
+        projectile.ecef_position, projectile.ecef_error = compensated_add(projectile.ecef_position,
+                                                                          projectile.ecef_error, movement)
+        projectile.time += dt
+        projectile.distance_travelled += distance_m
+        projectile.update_from_ecef()
+        self.accepted_steps += 1
+        return dt
+
+
+class StateIntegrator(Integrator):
+    """
+    Base for integrators working on the state vector. Takes care of the bookkeeping around a step: evaluating the
+    derivative at its start (or reusing the one from the end of the previous step), writing forces and putting the
+    projectile into the new state.
+    """
+    def __init__(self):
+        super().__init__()
+        self.last = None  # (time, state, derivative, forces) at the end of the last step, if it's known
+        self.last_forces = None
+
+    def evaluate(self, projectile: Projectile, time: float, state: np.ndarray) -> np.ndarray:
+        self.evaluations += 1
+        derivative, self.last_forces = projectile.derivatives(time, state)
+        return derivative
+
+    def begin(self, projectile: Projectile) -> (float, np.ndarray, np.ndarray):
+        """
+        Start a step: evaluate the derivative at the current state and write the forces.
+        :return: time, state and its derivative
+        """
+        projectile.fuel_in_state = True
+        for thrust in projectile.thrust:
+            thrust.burning = thrust.remaining_fuel > 0
+        time = projectile.time
+        state = projectile.get_state_vector()
+        if self.last is not None and self.last[0] == time and np.array_equal(self.last[1], state):
+            derivative, forces = self.last[2], self.last[3]
+        else:
+            derivative = self.evaluate(projectile, time, state)
+            forces = self.last_forces
+        projectile.write_forces(time, projectile.mass(), forces)
+        return time, state, derivative
+
+    def finish(self, projectile: Projectile, time: float, h: float, state: np.ndarray, increment: np.ndarray,
+               burning_out: list = (), derivative: np.ndarray = None) -> float:
+        """
+        End a step: put the projectile into the new state. Position is moved by the increment rather than set to the
+        new state, so the small increments aren't lost to rounding (see Position).
+        :param state: state at the start of the step
+        :param increment: change of the state during the step
+        :param burning_out: thrusts which have run out of fuel at the end of the step
+        :param derivative: derivative at the new state, if the last stage has evaluated it; it's reused by the next step
+        :return: step size
+        """
+        new_state = state + increment
+        new_state[[7 + i for i in burning_out]] = 0
+        new_state[7:] = np.maximum(new_state[7:], 0)  # fuel can go slightly negative when running out mid-step
+        new_state[0:3] = projectile.move_position(state, increment)
+        projectile.dt = h
+        projectile.set_state_vector(time + h, new_state)
+        self.last = None if derivative is None else (projectile.time, new_state, derivative, self.last_forces)
+        self.accepted_steps += 1
+        return h
+
+    @staticmethod
+    def until_burnout(state: np.ndarray, derivative: np.ndarray, dt: float) -> (float, list):
+        """
+        Burnout is a discontinuity in thrust; a fixed-step scheme which steps over it is only first order accurate. This
+        finds the time until the first thrust runs out of fuel at the current flow rates, so the step can end there.
+        :return: step size (dt, or less if a thrust burns out sooner) and indices of thrusts burning out at its end
+        """
+        h, burning_out = dt, []
+        for i, (fuel, rate) in enumerate(zip(state[7:], derivative[7:])):
+            if rate < 0 and fuel > 0 and fuel + rate * h <= 0:
+                h, burning_out = fuel / -rate, []
+            if rate < 0 and fuel > 0 and fuel + rate * h <= 0:
+                burning_out.append(i)
+        return float(h), burning_out
+
+
+class RungeKutta4(StateIntegrator):
+    """
+    Classic fixed-step 4th order Runge-Kutta. Four force evaluations per step, but dt can be 10-50 times larger than
+    with Euler for the same accuracy. Steps end at burnouts, but other jumps in thrust (fuel flow or guidance switching
+    at fixed times) still make the step which contains them first order, so keep dt short while they happen.
+    """
+    def step(self, projectile: Projectile, dt: float, limit: float = None) -> float:
+        time, state, k1 = self.begin(projectile)
+        dt, burning_out = self.until_burnout(state, k1, dt)
+        k2 = self.evaluate(projectile, time + dt/2, state + dt/2 * k1)
+        k3 = self.evaluate(projectile, time + dt/2, state + dt/2 * k2)
+        k4 = self.evaluate(projectile, time + dt, state + dt * k3)
+        return self.finish(projectile, time, dt, state, dt/6 * (k1 + 2*k2 + 2*k3 + k4), burning_out)
+
+
+class VelocityVerlet(StateIntegrator):
+    """
+    Fixed-step velocity Verlet (kick-drift-kick): half a step of acceleration, a full step of movement with the
+    midpoint velocities, then the other half of acceleration evaluated at the new position. Two force evaluations per
+    step, second order, and symplectic for position-dependent forces (gravity, centrifugal), so energy doesn't drift
+    during long coasts. Velocity-dependent forces (drag, Coriolis, thrust following the path) are evaluated with a
+    predicted end-of-step velocity, otherwise they would make the scheme first order.
+    """
+    POSITION = [0, 1, 2, 6]
+    VELOCITY = [3, 4, 5]
+
+    def step(self, projectile: Projectile, dt: float, limit: float = None) -> float:
+        time, state, start = self.begin(projectile)
+        dt, burning_out = self.until_burnout(state, start, dt)
+        increment = np.zeros_like(state)
+        increment[self.VELOCITY] = dt/2 * start[self.VELOCITY]  # kick
+        increment[self.POSITION] = dt * projectile.position_derivatives(state + increment)[self.POSITION]  # drift
+        predicted = state + increment
+        predicted[self.VELOCITY] = state[self.VELOCITY] + dt * start[self.VELOCITY]
+        predicted[7:] += dt * start[7:]
+        end = self.evaluate(projectile, time + dt, predicted)
+        increment[self.VELOCITY] += dt/2 * end[self.VELOCITY]  # kick
+        increment[7:] = dt/2 * (start[7:] + end[7:])
+        return self.finish(projectile, time, dt, state, increment, burning_out)
+
+
+class DormandPrince(StateIntegrator):
+    """
+    Adaptive, error-controlled Dormand-Prince 5(4) integrator. Each step is done with a 5th order Runge-Kutta formula,
+    and the embedded 4th order one gives an error estimate which decides whether the step is accepted and how long the
+    next one should be. Ballistic coast gets long steps, boost and re-entry get short ones.
+    Tolerances are absolute: metres for position (latitude and longitude are scaled by the earth radius), m/s for
+    velocities and kg for fuel; and relative to the size of each state component.
+    Projectile.derivatives works in latitude/longitude, so steps get very short close to the poles, unless the
+    projectile is in cartesian mode.
+    """
+    # Butcher tableau. Source: https://en.wikipedia.org/wiki/Dormand%E2%80%93Prince_method
+    C = [0, 1/5, 3/10, 4/5, 8/9, 1, 1]
+    A = [[],
+         [1/5],
+         [3/40, 9/40],
+         [44/45, -56/15, 32/9],
+         [19372/6561, -25360/2187, 64448/6561, -212/729],
+         [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+         [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]]  # 5th order solution, so the last stage is reused (FSAL)
+    E = [71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40]  # difference between 5th and 4th order
+
+    def __init__(self, atol=1e-4, rtol=1e-9, max_dt=5.0, min_dt=1e-6, safety=0.9, max_factor=5.0, min_factor=0.2):
+        """
+        :param atol: absolute tolerance (m, m/s, kg)
+        :param rtol: relative tolerance
+        :param max_dt: longest allowed step (s); keeps the output reasonably dense
+        :param min_dt: shortest allowed step (s); steps this short are accepted regardless of the error
+        :param safety: safety factor for the step size controller
+        :param max_factor: how much the step can grow at once
+        :param min_factor: how much the step can shrink at once
+        """
+        super().__init__()
+        self.atol = atol
+        self.rtol = rtol
+        self.max_dt = max_dt
+        self.min_dt = min_dt
+        self.safety = safety
+        self.max_factor = max_factor
+        self.min_factor = min_factor
+        self.next_dt = None
+        self.rejected_steps = 0
+
+    def step(self, projectile: Projectile, dt: float, limit: float = None) -> float:
+        """
+        Do one accepted step.
+        :param projectile: projectile to advance
+        :param dt: suggested step size; used only for the first step, later ones are picked by the controller
+        :param limit: longest allowed size of this step, if it should be shorter than max_dt
+        :return: size of the step which was taken
+        """
+        time, state, derivative = self.begin(projectile)
+        proposed = min(self.next_dt if self.next_dt is not None else dt, self.max_dt)
+        h = proposed if limit is None else min(proposed, limit)
+        h, burning_out = self.until_burnout(state, derivative, h)
+        limit = h if burning_out else limit
+        scale = np.ones(len(state))
+        if not projectile.cartesian:
+            scale[0:2] = 1 / projectile.environment.earth_radius
+
+        while True:
+            stages = [derivative]
+            for i in range(1, 7):
+                stage_state = state + h * sum(a * k for a, k in zip(self.A[i], stages))
+                stages.append(self.evaluate(projectile, time + self.C[i] * h, stage_state))
+            new_state = stage_state  # 7th stage is evaluated at the 5th order solution
+            increment = h * sum(a * k for a, k in zip(self.A[6], stages))
+            error = h * sum(e * k for e, k in zip(self.E, stages))
+            tolerance = self.atol * scale + self.rtol * np.maximum(np.fabs(state), np.fabs(new_state))
+            error_norm = float(np.sqrt(np.mean((error / tolerance) ** 2)))
+            if error_norm <= 1 or h <= self.min_dt:
+                break
+            self.rejected_steps += 1
+            h = max(h * max(self.min_factor, self.safety * error_norm ** -0.2), self.min_dt)
+
+        factor = self.max_factor if error_norm == 0 else min(self.max_factor, self.safety * error_norm ** -0.2)
+        self.next_dt = min(h * max(self.min_factor, factor), self.max_dt)
+        if limit is not None and h == limit:  # step was cut short by the limit or burnout, not by the error
+            self.next_dt = max(self.next_dt, proposed)
+        else:
+            burning_out = []
+        return self.finish(projectile, time, h, state, increment, burning_out, stages[6])
+
+    def report(self) -> str:
+        return f"Dormand-Prince: {self.accepted_steps} accepted and {self.rejected_steps} rejected steps, " \
+               f"{self.evaluations} evaluations"
+
+
+def create_integrator(name: str, atol=1e-4, rtol=1e-9, max_dt=5.0) -> Integrator:
+    """
+    Create integrator by its name.
+    :param name: "euler", "rk4", "verlet" or "dopri5"
+    :param atol: absolute tolerance, for adaptive integrators
+    :param rtol: relative tolerance, for adaptive integrators
+    :param max_dt: longest step, for adaptive integrators
+    :return: integrator
+    """
+    if name == "euler":
+        return Euler()
+    if name == "rk4":
+        return RungeKutta4()
+    if name == "verlet":
+        return VelocityVerlet()
+    if name == "dopri5":
+        return DormandPrince(atol, rtol, max_dt)
+    raise ValueError(f"Unknown integrator {name}!")
@@ -1,11 +1,19 @@
-import os
+import copy
 from typing import Union, List
 
+from projectile.core.Constants import Z_INDEX
 from projectile.core.Environment import Environment
+from projectile.core.Events import EventDetector, Event, FlightResult
+from projectile.core.Integrators import Integrator, Euler, create_integrator
+from projectile.core.KeplerCoast import KeplerCoast
 from projectile.core.Position import Position
 from projectile.core.Projectile import Projectile
+from projectile.data.BinaryIO import ProjectileBinaryWriter, ForcesBinaryWriter
 from projectile.data.CsvWriters import ProjectileCsvWriter, ForcesCsvWriter
-from projectile.data.KmlWriter import convert_csv_to_kmz
+from projectile.data.KmlWriter import KmzWriter
+from projectile.data.LodKmzWriter import LodKmzWriter
+from projectile.data.Sinks import BackgroundSink, Tee, Decimator, SummarySink, DecimationPolicy, TimeInterval
+from projectile.data.TrajectoryBuffer import TrajectoryBuffer, ForcesBuffer
 from projectile.forces.ThrustForce import follow_path, ThrustForce
 from projectile.util import spherical_to_planar_coord
 
@@ -14,7 +22,11 @@ class Launcher:
     """
     Utility class for launching projectiles. Takes care of setting up environment, projectiles and file I/O with
     specified values and/or sensible defaults and flying the projectile (main loop).
+    All output files are optional; without them, the flight is only kept in memory and returned by launch(). The same
+    launcher can launch any number of flights (e.g. inside a solver), thrusts are refueled for each of them.
     """
+    WRITE_CHUNK = 4096  # records are kept in a TrajectoryBuffer and passed to the sinks this many at a time
+    KMZ_INTERVAL = 0.1  # time between two records in the KMZ (s)
 
     def default_thrust_direction(self, axis: int, force: float, pr: Projectile) -> float:
         """
@@ -32,8 +44,48 @@ class Launcher:
             spherical_to_planar_coord(axis, force, self.pitch + 0.17, self.yaw)
         return follow_path(axis, force, pr)
 
-    def __init__(self, pitch, yaw, csv_filename, kmz_filename, forces_csv_filename=None, dt=0.01, keep_csv=True,
-                 environment: Environment = None, thrust: Union[ThrustForce, List[ThrustForce]] = None):
+    def __init__(self, pitch, yaw, csv_filename=None, kmz_filename=None, forces_csv_filename=None, dt=0.01,
+                 keep_csv=True, environment: Environment = None, thrust: Union[ThrustForce, List[ThrustForce]] = None,
+                 integrator: Union[str, Integrator] = "euler", atol=1e-4, rtol=1e-9, max_dt=5.0, cartesian=False,
+                 event_altitudes: List[float] = (), kepler_coast=False, coast_output_dt=1.0, output_format="csv",
+                 record_forces=False, verbose=True, keep_trajectory=True, decimation: DecimationPolicy = None,
+                 forces_decimation: DecimationPolicy = None, kmz_tolerance: float = None, kmz_lod=False,
+                 background_output=False):
+        """
+        :param csv_filename: projectile CSV file, None not to write one
+        :param kmz_filename: KMZ file (without extension), None not to write one
+        :param forces_csv_filename: forces CSV file, None not to write one
+        :param keep_csv: whether to write the projectile CSV; KMZ doesn't need it, it's written alongside
+        :param integrator: Integrator, or its name: "euler", "rk4" and "verlet" do fixed dt steps; "dopri5" does
+        adaptive Dormand-Prince steps (dt is then the first step size, and the longest step which may end below ground).
+        Integrators given by name are created anew for each flight.
+        :param atol: absolute tolerance of the adaptive integrator (m, m/s, kg)
+        :param rtol: relative tolerance of the adaptive integrator
+        :param max_dt: longest step of the adaptive integrator (s)
+        :param cartesian: propagate position and velocity in Earth-centred Cartesian coordinates (see Projectile)
+        :param event_altitudes: altitudes whose crossings are reported as events, besides impact, apogee and burnouts
+        :param kepler_coast: solve unpowered flight above the atmosphere analytically instead of stepping through it
+        (see KeplerCoast); needs cartesian
+        :param coast_output_dt: interval between records in the CSV during such coast (s)
+        :param output_format: "csv", or "binary" to write projectile and forces files in the binary format (see
+        BinaryIO); file names are used as they are given
+        :param record_forces: keep intensities of forces in the result (see FlightResult.forces)
+        :param verbose: print integrator's report after each flight
+        :param keep_trajectory: keep all records in the result; otherwise they're dropped once they've passed through
+        the sinks and the result only has their statistics (see SummarySink), so memory use doesn't grow with the flight
+        :param decimation: which records are written to the projectile file (see Sinks), all of them if None. States
+        at events are then added to the records and always written, as is the impact.
+        :param forces_decimation: which evaluations are written to the forces file; tolerances of ErrorBounded are
+        given by column names of forces binary files (e.g. "0.Fx")
+        :param kmz_tolerance: simplify the path in the KMZ to within this distance (m), see KmlWriter
+        :param kmz_lod: write the KMZ as tiles with levels of detail (see LodKmzWriter), for long flights
+        :param background_output: pass records and forces to the sinks and the forces file on threads of their own
+        (see BackgroundSink), while the flight goes on
+        """
+        if kepler_coast and not cartesian:
+            raise ValueError("Kepler coast needs cartesian propagation")
+        if output_format not in ("csv", "binary"):
+            raise ValueError(f"Unknown output format {output_format}")
         self.pitch = pitch
         self.yaw = yaw
         self.dt = dt
@@ -45,44 +97,155 @@ class Launcher:
         self.environment = environment
         self.forces_csv_filename = forces_csv_filename
         self.thrust = thrust
+        self.integrator_args = (integrator, atol, rtol, max_dt) if isinstance(integrator, str) else None
+        if isinstance(integrator, str):
+            integrator = create_integrator(integrator, atol, rtol, max_dt)
+        self.integrator = integrator
+        self.cartesian = cartesian
+        self.event_altitudes = event_altitudes
+        self.kepler_coast = kepler_coast
+        self.coast_output_dt = coast_output_dt
+        self.output_format = output_format
+        self.record_forces = record_forces
+        self.verbose = verbose
+        self.keep_trajectory = keep_trajectory
+        self.decimation = decimation
+        self.forces_decimation = forces_decimation
+        self.kmz_tolerance = kmz_tolerance
+        self.kmz_lod = kmz_lod
+        self.background_output = background_output
+        self.launched = False
 
     def launch(self, mass: float, position: Position, velocity=0, cross_section=lambda axis, pitch, yaw: 20,
-               drag_coeff=lambda axis, pitch, yaw: 0.1):
+               drag_coeff=lambda axis, pitch, yaw: 0.1, sinks: list = ()) -> FlightResult:
         """
-        Launch the projectile and fly it until it crashes.
+        Launch the projectile and fly it until it crashes. Last record in the CSV is the impact point, located between
+        the last two steps (see Events). All records are also kept in the result's trajectory, and intensities of
+        forces in its forces if record_forces is set.
+        Records pass in chunks through the sinks of the flight (see Sinks): the projectile file, the KMZ (decimated) and
+        the given ones, so each output is written in the same single pass.
         :param mass: projectile mass
-        :param position: initial position
+        :param position: initial position; it's copied, so it can be used for other flights
         :param velocity: initial velocity
         :param cross_section: cross section area
         :param drag_coeff: drag coefficient
-        :return:
+        :param sinks: more sinks which get all records of this flight
+        :return: events of the flight
         """
+        thrusts = [] if self.thrust is None else self.thrust if isinstance(self.thrust, list) else [self.thrust]
+        if self.launched:  # thrusts of the previous flight are still in the environment
+            self.environment.forces = [f for f in self.environment.forces if all(f is not th for th in thrusts)]
+            for th in thrusts:
+                th.refuel()
+            if self.integrator_args is not None:
+                self.integrator = create_integrator(*self.integrator_args)
+        self.launched = True
+        projectile = self.environment.create_projectile(mass, copy.deepcopy(position), cross_section, drag_coeff,
+                                                        None, self.integrator, self.cartesian)
+        projectile.launch_at_angle(self.pitch, self.yaw, velocity)
+        for th in thrusts:
+            projectile.add_thrust(th)
+
+        binary = self.output_format == "binary"
+        forces = forces_writer = None
+        if self.forces_csv_filename is not None or self.record_forces:
+            # created once thrusts are in the environment, binary files name them
+            names = [type(f).__name__ for f in self.environment.forces]
+            forces = ForcesBuffer(names)
+            projectile.forces_writer = forces
         if self.forces_csv_filename is not None:
-            forces_writer = ForcesCsvWriter(self.forces_csv_filename)
+            if binary:
+                forces_writer = ForcesBinaryWriter(self.forces_csv_filename, names)
+            else:
+                forces_writer = ForcesCsvWriter(self.forces_csv_filename)
+            if self.forces_decimation is not None:  # policies keep state, each flight needs its own
+                forces_writer = Decimator(forces_writer, copy.deepcopy(self.forces_decimation), forces.columns)
             forces_writer.write_header()
-        else:
-            forces_writer = None
-        projectile = self.environment.create_projectile(mass, position, cross_section, drag_coeff, forces_writer)
-        projectile.launch_at_angle(self.pitch, self.yaw, velocity)
-        if self.thrust is not None:
-            if isinstance(self.thrust, list):
-                for th in self.thrust:
-                    projectile.add_thrust(th)
+        pinned = set() if self.decimation is not None else None  # times of records at events
+        files = []
+        if self.csv_filename is not None and self.keep_csv:
+            writer = ProjectileBinaryWriter(self.csv_filename) if binary else ProjectileCsvWriter(self.csv_filename)
+            if self.decimation is not None:
+                writer = Decimator(writer, copy.deepcopy(self.decimation), pinned=pinned)
+            files.append(writer)
+        if self.kmz_filename is not None:
+            if self.kmz_lod:
+                kmz = LodKmzWriter(self.kmz_filename + ".kmz")
             else:
-                projectile.add_thrust(self.thrust)
-
-        writer = ProjectileCsvWriter(self.csv_filename)
-        writer.write_header()
-        while True:
-            projectile.advance(self.dt)
-            data = projectile.get_state()
-            writer.write_data(data)
-            if projectile.has_hit_ground():
-                break
-        writer.close()
+                kmz = KmzWriter(self.kmz_filename + ".kmz", tolerance=self.kmz_tolerance,
+                                earth_radius=self.environment.earth_radius)
+            files.append(Decimator(kmz, TimeInterval(self.KMZ_INTERVAL), pinned=pinned))
+        sinks = files + list(sinks)
+        statistics = None
+        if not self.keep_trajectory:
+            statistics = SummarySink()
+            sinks.append(statistics)
+        output = Tee(sinks)
+        if self.background_output:
+            output = BackgroundSink(output)
+            if forces_writer is not None:
+                forces_writer = BackgroundSink(forces_writer)
+        output.write_header()
+        trajectory = TrajectoryBuffer()
+        detector = EventDetector(self.environment, self.event_altitudes)
+        detector.start(projectile)
+        coast = KeplerCoast(self.environment, self.coast_output_dt) if self.kepler_coast else None
+        try:
+            while True:
+                self.write_new(trajectory, output, forces, forces_writer, self.WRITE_CHUNK)
+                if coast is not None and coast.applicable(projectile):
+                    if any(self.record(projectile, data.values(), detector, trajectory, pinned)
+                           for data in coast.coast(projectile)):
+                        break
+                    continue
+                # when descending, don't step much further than where we expect the ground to be
+                limit = None
+                if projectile.velocities[Z_INDEX] < 0:
+                    height = projectile.position.alt - self.environment.surface_altitude(projectile.position)
+                    limit = max(self.dt, height / -projectile.velocities[Z_INDEX])
+                projectile.advance(self.dt, limit)
+                if self.record(projectile, projectile.state_values(), detector, trajectory, pinned):
+                    break
+            self.write_new(trajectory, output, forces, forces_writer)
+        except BaseException:
+            if self.background_output:  # don't leave the threads waiting for rows which won't come
+                output.stop()
+                if forces_writer is not None:
+                    forces_writer.stop()
+            raise
+        output.close()
         if forces_writer is not None:
             forces_writer.close()
+        if self.verbose and not isinstance(self.integrator, Euler):
+            print(self.integrator.report())
+        return detector.result(projectile, trajectory if self.keep_trajectory else None,
+                               forces if self.record_forces else None, statistics)
+
+    def write_new(self, trajectory: TrajectoryBuffer, output: Tee, forces: ForcesBuffer, forces_writer,
+                  min_rows=1) -> None:
+        """Pass records and forces which haven't been written yet to the sinks and the forces file, min_rows or more."""
+        trajectory.write_new(output, min_rows, self.keep_trajectory)
+        if forces_writer is not None:
+            forces.write_new(forces_writer, min_rows, self.record_forces)
 
-        convert_csv_to_kmz(self.csv_filename, self.kmz_filename)
-        if not self.keep_csv:
-            os.remove(self.csv_filename)
+    @staticmethod
+    def record(projectile: Projectile, values: tuple, detector: EventDetector, trajectory: TrajectoryBuffer,
+               pinned: set = None) -> bool:
+        """
+        Look for events since the last record and add the new one to the trajectory; an impact is added instead of it.
+        :param values: values of the new record (see Projectile.state_values); written straight into the trajectory
+        :param pinned: if given, states at events are added to the trajectory too, and times of all events to pinned
+        :return: whether the projectile has hit the ground
+        """
+        events = detector.step(projectile, values)
+        if events:
+            if pinned is not None:
+                for event in events:
+                    if event.time < values[0] and event.kind != Event.IMPACT:
+                        trajectory.append_point(event.data)
+                    pinned.add(event.time)
+            if events[-1].kind == Event.IMPACT:
+                trajectory.append_point(events[-1].data)
+                return True
+        trajectory.append(values)
+        return False
@@ -1,14 +1,64 @@
+from math import pi
+
 import numpy as np
 
 
+def compensated_add(total, error, value):
+    """
+    One step of Kahan summation: add value to total, taking the rounding error of previous additions into account.
+    Works on scalars and numpy arrays alike.
+    :return: new total and its rounding error
+    """
+    corrected = value - error
+    new_total = total + corrected
+    return new_total, (new_total - total) - corrected
+
+
 class Position:
     """
-    Class representing a position in the environment. A latitude/longitude/altitude float128 triplet.
+    Class representing a position in the environment. A latitude/longitude/altitude float64 triplet, either of scalars
+    or of arrays (one element per projectile).
+    Forces such as Coriolis generate pretty small movement which would be lost as a rounding error if increments were
+    simply added to the position, so move() uses compensated (Kahan) summation: rounding error of each addition is
+    kept in lat_error/lon_error/alt_error and fed back into the next one, which gives about twice the float64
+    precision over a flight. Assigning coordinates directly is fine, a stale error term is smaller than one ulp.
     """
-    def __init__(self, lat, lon, alt):
-        # this is CRUCIAL - forces such as Coriolis generate pretty small movement which is lost as a rounding error
-        # when doing operations with position
-        data = np.array([lat, lon, alt], "float128")
-        self.lat = data[0]
-        self.lon = data[1]
-        self.alt = data[2]
+    def __init__(self, lat, lon, alt, dtype="float64"):
+        """
+        :param dtype: "float64", or "float128" to store long doubles, as positions used to (slower, for reference only)
+        """
+        if dtype == "float64" and np.ndim(lat) == 0:  # plain floats are the fastest to use with the math module
+            self.lat, self.lon, self.alt = float(lat), float(lon), float(alt)
+        else:
+            data = np.array([lat, lon, alt], dtype)
+            self.lat = data[0]
+            self.lon = data[1]
+            self.alt = data[2]
+        self.lat_error = self.lat * 0
+        self.lon_error = self.lon * 0
+        self.alt_error = self.alt * 0
+
+    def move(self, dlat, dlon, dalt) -> None:
+        """Add increments to each coordinate, keeping track of the rounding error."""
+        self.lat, self.lat_error = compensated_add(self.lat, self.lat_error, dlat)
+        self.lon, self.lon_error = compensated_add(self.lon, self.lon_error, dlon)
+        self.alt, self.alt_error = compensated_add(self.alt, self.alt_error, dalt)
+
+    def wrap_longitude(self) -> None:
+        """Bring longitude back to [-pi, pi) after crossing the antimeridian. Leaves it untouched otherwise."""
+        if np.ndim(self.lon) == 0:
+            if not -pi <= self.lon < pi:
+                turns = (self.lon + pi) // (2 * pi)
+                self.lon, self.lon_error = compensated_add(self.lon, self.lon_error, -2 * pi * turns)
+        else:
+            turns = np.floor_divide(self.lon + pi, 2 * pi)
+            if turns.any():
+                self.lon, self.lon_error = compensated_add(self.lon, self.lon_error, -2 * pi * turns)
+
+    def __getitem__(self, index):
+        """Position of selected projectiles, if this position holds arrays."""
+        selected = Position.__new__(Position)
+        selected.lat, selected.lon, selected.alt = self.lat[index], self.lon[index], self.alt[index]
+        selected.lat_error, selected.lon_error, selected.alt_error = \
+            self.lat_error[index], self.lon_error[index], self.alt_error[index]
+        return selected
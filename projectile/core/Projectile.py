@@ -1,24 +1,35 @@
 from __future__ import annotations
 
-from math import cos, sin, pi, atan2, asin, sqrt, fabs
+from math import cos, sin, tan, pi, atan2, sqrt, fabs
 from typing import List
 
 import numpy as np
 
 from projectile.core.Constants import X_INDEX, Y_INDEX, Z_INDEX
-from projectile.core.Position import Position
-from projectile.data.DataPoints import ProjectileDataPoint, ForcesDataPoint
-from projectile.util import sgn, RollingStatistic, haversine, fp_eq, spherical_to_planar_coord
+from projectile.core.Integrators import Integrator, Euler
+from projectile.core.Position import Position, compensated_add
+from projectile.data.DataPoints import ProjectileDataPoint
+from projectile.util import sgn, RollingStatistic, haversine, spherical_to_planar_coord, lla_to_ecef, ecef_to_lla, \
+    enu_basis, horizontal_speed
 
 
 class Projectile:
     """
     Projectile which flies through the environment. Most of the interesting stuff is here.
+    By default, position is latitude/longitude/altitude and velocities live in the local tangent plane, which moves
+    with the projectile (see update_velocities). In cartesian mode, position and velocity are propagated in
+    Earth-centred, Earth-fixed (rotating, so Coriolis and centrifugal forces still apply) Cartesian coordinates instead,
+    and latitude/longitude/altitude and tangent plane velocities are derived from them after each step, for forces and
+    output. There's no pole crossing to detect, so steps can be long anywhere. Cartesian mode is exact geometry and is
+    the reference; the default mode has no curvature term (the centrifugal lift of flying around the Earth), so it
+    drifts from it with range and speed. Impacts of a 37km flight are ~100m apart; a 2000km one lands 200s earlier and
+    600km short, and the near-orbital long_distance flight lands after 1437s instead of 3707s, 4300km away.
     """
     def __init__(self, environment: Environment, mass: float, initial_velocities: List[float],
                  initial_position: Position, cross_section=lambda axis, pitch, yaw: 0.25,
                  drag_coef=lambda axis, pitch, yaw: 0.1, vy_corrective_change_threshold=0.1,
-                 distance_rolling_window=40, forces_writer: ForcesCsvWriter = None):
+                 distance_rolling_window=40, forces_writer: ForcesCsvWriter = None, integrator: Integrator = None,
+                 cartesian=False):
         if initial_position is None:
             initial_position = Position(44.869389, 20.640221, 0)
         self.initial_mass = mass
@@ -29,6 +40,7 @@ class Projectile:
         self.environment = environment
         self.vy_corrective_change_threshold = vy_corrective_change_threshold
         self.forces_writer = forces_writer
+        self.integrator = integrator if integrator is not None else Euler()
         self.crossed_the_pole = False
         self.directions = np.zeros(3)
         self.time = 0
@@ -40,7 +52,16 @@ class Projectile:
         self.yaw = 0
         self.dt = 0
         self.thrust = []
+        self.added_fuel = 0
+        self.fuel_in_state = False  # whether fuel is burned by the integrator (True) or by thrusts themselves (False)
         self.distance_stats = RollingStatistic(distance_rolling_window)
+        self.cartesian = cartesian
+        self.ecef_position = None  # Earth-centred state, used in cartesian mode; set up before the first step
+        self.ecef_error = np.zeros(3)  # rounding error of ecef_position, see Position
+        self.ecef_velocity = None
+        self.local_basis = None  # tangent plane axes at the current position, see enu_basis
+        self.force_samples = {}  # last evaluations of slow forces, see Environment.get_forces_intensities
+        self.reused_forces = []  # indices of forces which weren't evaluated by the last get_forces_intensities
 
     def launch_at_angle(self, pitch: float, yaw: float, velocity: float) -> None:
         """
@@ -77,55 +98,20 @@ class Projectile:
         added to the projectile
         """
         self.initial_mass += thrust.remaining_fuel
+        self.added_fuel += thrust.remaining_fuel
         self.environment.add_force(thrust)
         self.thrust.append(thrust)
 
-    def advance(self, dt) -> None:
+    def advance(self, dt, limit: float = None) -> float:
         """
-        Advance the projectile for dt seconds. Heart of the simulation.
-        :param dt: time which has passed.
-        :return: nothing; projectile's state is modified.
+        Advance the projectile for dt seconds. Heart of the simulation; the actual step is done by the integrator.
+        :param dt: time which has passed (adaptive integrators only take it as a suggestion)
+        :param limit: longest allowed step, for integrators which pick their own step size
+        :return: time which has actually passed; projectile's state is modified.
         """
-        self.dt = dt  # save this - forces may need this
-        forces = self.environment.get_forces_intensities(self)  # calculate forces based on previous iteration's state
-        if self.forces_writer is not None:  # if there's a ForcesWriter, we're writing these intensities to file (so
-            self.forces_writer.write_data(ForcesDataPoint(self.time, self.mass(), forces))  # they can be plot later)
-        acc = forces.sum(0) / self.mass()
-        self.velocities += acc * dt
-        # velocity in plane parallel to earth surface - 'distance travelled'
-        self.planar_velocity = sqrt(self.velocities[X_INDEX] ** 2 + self.velocities[Y_INDEX] ** 2)
-        # real, total velocity, taking z-axis into account as well
-        self.total_velocity = sqrt(self.planar_velocity ** 2 + self.velocities[Z_INDEX] ** 2)
-        self.directions = np.sign(self.velocities)  # this is useful for forces acting in opposite (or same) direction
-        movements = self.velocities * dt
-
-        # update pitch and yaw based on new velocities: we're using these angles (i.e. yaw) for calculating new position
-        self.update_angles()
-        radius = self.environment.earth_radius + self.position.alt
-        distance_m = np.sqrt(movements[X_INDEX] ** 2 + movements[Y_INDEX] ** 2)
-        distance_rad = distance_m / radius  # distance travelled in radians
-
-        angle = self.yaw - pi/2  # we're using formula which expects true course angle, not mathematical
-        old_lat = self.position.lat
-        old_lon = self.position.lon
-        # Formula source: http://www.edwilliams.org/avform.htm#LL
-        self.position.lat = asin(sin(self.position.lat) * cos(distance_rad) +
-                                 cos(self.position.lat) * sin(distance_rad) * cos(angle))
-        self.directions[Y_INDEX] = sgn(self.position.lat - old_lat)
-        if not fp_eq(cos(self.position.lat), 0):  # if we're on a pole, just don't do anything (this is _very_ rare)
-            self.position.lon = \
-                divmod(self.position.lon - asin(sin(angle) * sin(distance_rad) / cos(self.position.lat)) + pi,
-                       2 * pi)[1] - pi
-        self.position.alt += self.velocities[Z_INDEX] * dt  # we're calculating z-movement in the usual way
-
-        self.time += dt
-        self.distance_travelled += distance_m
-        # now that we've moved, recalculate x/y/z speeds: we've changed a local tangent plane, so they've changed too
-        self.update_velocities(old_lat, old_lon, radius, distance_m)
-        # lastly, update angles so in the next iteration forces will use angles based on new (recalculated) speeds
-        self.update_angles()
+        return self.integrator.step(self, dt, limit)
 
-    def update_velocities(self, old_lat: np.float128, old_lon: np.float128, radius: float, distance_m: float) -> None:
+    def update_velocities(self, old_lat: float, old_lon: float, radius: float, distance_m: float) -> None:
         """
         Update velocities: take a look at the old position, current position, how much it has changed and calculate the
         speed based on that. Effectively moves the local tangent plane. z-speed is not modified as it's unaffected by
@@ -184,12 +170,149 @@ class Projectile:
 
     def update_angles(self) -> None:
         """
-        Update pitch and yaw based on current velocities.
+        Update pitch and yaw based on current velocities. Angles which velocities don't define are kept: both of them
+        at rest (e.g. launched from rest, whose thrust follows the launch angles), yaw when flying straight up or down.
         :return: nothing; updates the projectile's state
         """
-        self.pitch = atan2(self.velocities[Z_INDEX],
-                           sqrt(self.velocities[X_INDEX] ** 2 + self.velocities[Y_INDEX] ** 2))
-        self.yaw = atan2(self.velocities[Y_INDEX], self.velocities[X_INDEX])
+        planar_velocity = sqrt(self.velocities[X_INDEX] ** 2 + self.velocities[Y_INDEX] ** 2)
+        if planar_velocity == 0 and self.velocities[Z_INDEX] == 0:
+            return
+        self.pitch = atan2(self.velocities[Z_INDEX], planar_velocity)
+        if planar_velocity != 0:
+            self.yaw = atan2(self.velocities[Y_INDEX], self.velocities[X_INDEX])
+
+    def init_ecef(self) -> None:
+        """
+        Set up the Earth-centred state from the current position and velocities.
+        :return: nothing; projectile's state is modified
+        """
+        self.ecef_position = lla_to_ecef(self.position.lat, self.position.lon, self.position.alt,
+                                         self.environment.earth_radius)
+        self.ecef_error = np.zeros(3)
+        self.local_basis = enu_basis(self.position.lat, self.position.lon)
+        self.ecef_velocity = self.local_basis.T @ self.velocities
+
+    def update_from_ecef(self) -> None:
+        """
+        Derive position, tangent plane velocities and everything depending on them from the Earth-centred state.
+        :return: nothing; projectile's state is modified
+        """
+        self.position.lat, self.position.lon, self.position.alt = ecef_to_lla(self.ecef_position,
+                                                                              self.environment.earth_radius)
+        self.local_basis = enu_basis(self.position.lat, self.position.lon)
+        self.velocities[:] = self.local_basis @ self.ecef_velocity
+        self.planar_velocity = sqrt(self.velocities[X_INDEX] ** 2 + self.velocities[Y_INDEX] ** 2)
+        self.total_velocity = sqrt(self.planar_velocity ** 2 + self.velocities[Z_INDEX] ** 2)
+        self.directions = np.sign(self.velocities)
+        self.update_angles()
+
+    def get_state_vector(self) -> np.ndarray:
+        """
+        State as seen by multi-stage integrators: latitude, longitude, altitude, Vx, Vy, Vz, distance travelled and
+        remaining fuel of each thrust. In cartesian mode, first six are Earth-centred position and velocity instead.
+        :return: state vector
+        """
+        if self.cartesian:
+            if self.ecef_position is None:
+                self.init_ecef()
+            position, velocities = self.ecef_position, self.ecef_velocity
+        else:
+            position, velocities = [self.position.lat, self.position.lon, self.position.alt], self.velocities
+        return np.array([*position, *velocities, self.distance_travelled, *[t.remaining_fuel for t in self.thrust]],
+                        "float64")
+
+    def set_state_vector(self, time: float, state: np.ndarray) -> None:
+        """
+        Inverse of get_state_vector: put the projectile into the given state, along with everything derived from it.
+        :param time: time of the state
+        :param state: state vector
+        :return: nothing; projectile's state is modified
+        """
+        self.time = time
+        self.distance_travelled = state[6]
+        for i, thrust in enumerate(self.thrust):
+            thrust.remaining_fuel = state[7 + i]
+        self.lost_mass = self.added_fuel - sum(state[7:])
+        if self.cartesian:
+            self.ecef_position = state[0:3].copy()
+            self.ecef_velocity = state[3:6].copy()
+            self.update_from_ecef()
+            return
+        self.position.lat, self.position.lon, self.position.alt = state[0], state[1], state[2]
+        self.velocities[:] = state[3:6]
+        self.planar_velocity = sqrt(self.velocities[X_INDEX] ** 2 + self.velocities[Y_INDEX] ** 2)
+        self.total_velocity = sqrt(self.planar_velocity ** 2 + self.velocities[Z_INDEX] ** 2)
+        self.directions = np.sign(self.velocities)
+        self.update_angles()
+
+    def move_position(self, state: np.ndarray, increment: np.ndarray) -> np.ndarray:
+        """
+        Move position from the one in the state vector by the position part of the increment, keeping track of the
+        rounding error (see Position).
+        :param state: state vector
+        :param increment: change of the state vector
+        :return: position part of the new state vector
+        """
+        if self.cartesian:
+            self.ecef_position, self.ecef_error = compensated_add(state[0:3], self.ecef_error, increment[0:3])
+            return self.ecef_position
+        position = self.position
+        position.lat, position.lon, position.alt = state[0], state[1], state[2]
+        position.move(increment[0], increment[1], increment[2])
+        position.wrap_longitude()  # longitude can go past the antimeridian
+        return np.array([position.lat, position.lon, position.alt])
+
+    def derivatives(self, time: float, state: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Time derivative of the state vector, i.e. the equations of motion which Euler integrator discretizes. Velocities
+        live in the local tangent plane: Vy moves the projectile along the meridian and Vx along the parallel. As dt goes
+        to zero, update_velocities leaves Vx unchanged, but the great-circle latitude formula of the Euler step takes
+        away vx^2 * tan(lat) / 2r from Vy every second, so that term is here as well.
+        In cartesian mode, it's just Newton's second law, with forces rotated from the tangent plane.
+        Leaves the projectile in the given state; fuel_in_state should be set so thrusts don't burn fuel.
+        :param time: time
+        :param state: state vector
+        :return: derivative of the state vector and the forces intensity matrix it was calculated from
+        """
+        self.set_state_vector(time, state)
+        forces = self.environment.get_forces_intensities(self)
+        derivative = self.position_derivatives(state)
+        acceleration = forces.sum(0) / self.mass()
+        if self.cartesian:
+            derivative[3:6] = self.local_basis.T @ acceleration
+        else:
+            derivative[3:6] = acceleration
+            derivative[4] -= state[3] ** 2 * tan(state[0]) / (2 * (self.environment.earth_radius + state[2]))
+        for i, thrust in enumerate(self.thrust):
+            derivative[7 + i] = -thrust.flow_rate(time)
+        return derivative, forces
+
+    def position_derivatives(self, state: np.ndarray) -> np.ndarray:
+        """
+        Kinematic part of derivatives(): how latitude, longitude, altitude and distance change given the velocities in
+        the state. Other components are left at zero. Doesn't evaluate forces and doesn't modify the projectile.
+        :param state: state vector
+        :return: partially filled derivative of the state vector
+        """
+        derivative = np.zeros_like(state)
+        if self.cartesian:
+            derivative[0:3] = state[3:6]
+            derivative[6] = horizontal_speed(state[0:3], state[3:6])
+            return derivative
+        radius = self.environment.earth_radius + state[2]
+        derivative[0] = state[4] / radius
+        derivative[1] = state[3] / (radius * cos(state[0]))
+        derivative[2] = state[5]
+        derivative[6] = sqrt(state[3] ** 2 + state[4] ** 2)
+        return derivative
+
+    def write_forces(self, time: float, mass: float, forces: np.ndarray) -> None:
+        """
+        Write forces intensities to forces writer, if there is one. Forces which the last evaluation extrapolated are
+        marked as reused; intensities are always written right after the evaluation which produced them.
+        """
+        if self.forces_writer is not None:
+            self.forces_writer.write_values(time, mass, forces, self.reused_forces)
 
     def mass(self) -> float:
         return self.initial_mass - self.lost_mass
@@ -202,9 +325,15 @@ class Projectile:
         Get state in a convenient format for writing to file
         :return: DataPoint for current projectile state
         """
-        fuel = 0
-        if self.thrust is not None:
-            fuel = np.sum(list(map(lambda t: t.remaining_fuel, self.thrust)))
-        return ProjectileDataPoint(self.time, self.distance_travelled, self.position.lat, self.position.lon, self.position.alt,
-                                   self.velocities[X_INDEX], self.velocities[Y_INDEX], self.velocities[Z_INDEX],
-                                   self.pitch, self.yaw, fuel)
+        return ProjectileDataPoint(*self.state_values())
+
+    def state_values(self) -> tuple:
+        """
+        Values of the current state in the order of PROJECTILE_COLUMNS, as get_state has them. Used for each step of a
+        flight, which is written straight into a trajectory row without building a data point.
+        """
+        velocities = self.velocities
+        return (self.time, self.distance_travelled, self.position.lat, self.position.lon, self.position.alt,
+                velocities[X_INDEX], velocities[Y_INDEX], velocities[Z_INDEX], self.pitch, self.yaw,
+                sum(t.remaining_fuel for t in self.thrust))
+
@@ -0,0 +1,295 @@
+import csv
+import itertools
+import math
+import os
+import time
+from functools import lru_cache
+from typing import Callable, List, Dict
+
+from joblib import Parallel, delayed, effective_n_jobs
+
+from projectile.core.AtmosphereTable import AtmosphereTable
+from projectile.core.Environment import Environment
+from projectile.core.Launcher import Launcher
+from projectile.core.Position import Position
+from projectile.core.Projectile import Projectile
+from projectile.forces.ThrustForce import ThrustForce, follow_path
+from projectile.util import spherical_to_planar_coord
+
+"""
+Declarative parameter sweeps. A sweep is a flight function, a base set of its parameters and a list of overrides, one
+per flight (see grid). Parameters are plain values and the flight function is defined at module level, so workers are
+sent the function's name and a few dicts instead of closures which would have to be cloudpickled.
+Flights are sent to workers in chunks, so short flights don't each pay for a dispatch. Worker processes stay up between
+chunks (and sweeps), and keep what they've built for earlier flights, e.g. the atmosphere table (see shared_atmosphere).
+When costs of the flights are known, even roughly (see Sweep.prerun_costs and Sweep.history_costs), the longest flights
+are sent first, each on its own, and short ones are grouped into chunks of similar cost which fill the gaps at the end.
+Each idle worker takes the next chunk, so no worker is left with a long flight once the others are done.
+"""
+
+
+def grid(**values) -> List[Dict]:
+    """
+    Overrides for every combination of the given values, e.g. grid(pitch=[30, 45], yaw=[0, 90]) for 4 flights.
+    :param values: values of each parameter
+    """
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def parse_values(text: str) -> list:
+    """
+    Values of a parameter given on the command line: comma separated (1,2,5) or a range, start:stop:step with the stop
+    excluded as in range() (8:82:2). Values which aren't numbers are kept as text (extension=.bz2).
+    """
+    def number(value: str):
+        return int(value) if value.lstrip("-").isdigit() else float(value)
+
+    def value(text: str):
+        try:
+            return number(text)
+        except ValueError:
+            return text
+
+    if ":" in text:
+        try:
+            start, stop, step = (number(part) for part in text.split(":"))
+        except ValueError:
+            return [text]
+        if step == 0:
+            raise ValueError(f"Step of the range {text} is 0")
+        count = math.ceil((stop - start) / step - 1e-9)  # 1:1.3:0.1 has 3 values, though 0.3 / 0.1 > 3
+        return [start + i * step for i in range(count)]
+    return [value(part) for part in text.split(",")]
+
+
+@lru_cache()
+def shared_atmosphere() -> AtmosphereTable:
+    """Atmosphere table of the default environment, built once per process and used by all its flights."""
+    return Environment().tabulate_atmosphere()
+
+
+def long_range_fuel_flow(t: float):  # not very realistic-see long_distance scenario for a better multi-engine sim
+    if t < 1:
+        return 1000
+    if t < 3:
+        return 500
+    return 100
+
+
+class LongRangeGuidance:
+    """
+    Thrust direction of long range flights: launch direction for 1.2s, then along the path.
+    """
+    def __init__(self, pitch: float, yaw: float):
+        """
+        :param pitch: launch pitch (rad)
+        :param yaw: launch yaw (rad)
+        """
+        self.pitch = pitch
+        self.yaw = yaw
+
+    def __call__(self, axis: int, force: float, pr: Projectile):
+        if pr.time < 1.2:
+            return spherical_to_planar_coord(axis, force, self.pitch, self.yaw)
+        return follow_path(axis, force, pr)
+
+
+def long_range_environment() -> Environment:
+    """Environment of long range flights: ground at 80m, atmosphere table shared by the flights of the process."""
+    return Environment(surface_altitude=lambda pos: 80, atmosphere_table=shared_atmosphere())
+
+
+def long_range_thrust(pitch: float, yaw: float) -> ThrustForce:
+    """Single engine of long range flights, launched with the given pitch and yaw (rad)."""
+    return ThrustForce(5000, long_range_fuel_flow, 150, 250000, 15, LongRangeGuidance(pitch, yaw))
+
+
+LONG_RANGE = {"pitch": 45, "yaw": 0, "latitude": 0, "longitude": 15, "altitude": 80, "mass": 10000, "dt": 0.01,
+              "directory": None, "extension": ""}
+
+
+def long_range_flight(parameters: Dict) -> Dict:
+    """
+    Flight of the vary_* scenarios: a rocket launched from 80m above the ground with a single engine (see
+    LONG_RANGE for the parameters). Angles are in degrees. If a directory is given, projectile CSV, KMZ and forces CSV
+    are written to its csv, kml and forces subdirectories, named after the flight; extension (e.g. .bz2) compresses
+    the CSVs.
+    :return: summary of the flight (see FlightResult)
+    """
+    p = parameters
+    pitch, yaw = math.radians(p["pitch"]), math.radians(p["yaw"])
+    env = long_range_environment()
+    thrust = long_range_thrust(pitch, yaw)
+    files = [None, None, None]
+    if p["directory"] is not None:
+        name = p["name"]
+        files = [f"{p['directory']}csv/{name}.csv{p['extension']}", f"{p['directory']}kml/{name}",
+                 f"{p['directory']}forces/{name}.csv{p['extension']}"]
+    launcher = Launcher(pitch, yaw, *files, dt=p["dt"], environment=env, thrust=thrust)
+    result = launcher.launch(p["mass"], Position(math.radians(p["latitude"]), math.radians(p["longitude"]),
+                                                 p["altitude"]))
+    return result.summary()
+
+
+def fly_chunk(flight: Callable[[Dict], Dict], chunk: List[tuple]) -> List[Dict]:
+    """
+    Fly a chunk of flights in a worker; each result has the flight's overrides, summary, processor time (cpu_time,
+    which doesn't count time the worker had to wait for a core) and worker's process id.
+    """
+    results = []
+    for parameters, overrides in chunk:
+        start, wall_start = time.process_time(), time.perf_counter()
+        summary = flight(parameters)
+        results.append({**overrides, **summary, "cpu_time": time.process_time() - start,
+                        "wall_time": time.perf_counter() - wall_start, "worker": os.getpid()})
+    return results
+
+
+def read_results(filename: str) -> List[Dict]:
+    """Results of a sweep written by Sweep.write_results, with numbers as floats."""
+    def value(text: str):
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+    with open(filename, newline="") as file:
+        return [{name: value(text) for name, text in row.items()} for row in csv.DictReader(file)]
+
+
+class Sweep:
+    """
+    Flies a flight function once for each override of its base parameters, in parallel, and collects the summaries.
+    Each flight is named after the values of its overrides (e.g. 30_90), or by a "name" override. Costs of flights, if
+    given to run, are only compared with each other, so any unit will do.
+    """
+    def __init__(self, flight: Callable[[Dict], Dict], base: Dict, overrides: List[Dict]):
+        """
+        :param flight: module-level function which flies a flight from its parameters and returns its summary
+        :param base: parameters shared by all flights
+        :param overrides: parameters of each flight which differ from the base
+        """
+        self.flight = flight
+        self.base = base
+        self.overrides = overrides
+        self.results = []
+        self.wall_time = 0.0
+        self.workers = 1
+
+    def flights(self) -> List[tuple]:
+        """Parameters and overrides of each flight."""
+        flights = []
+        for overrides in self.overrides:
+            name = "_".join(str(value) for value in overrides.values())
+            flights.append(({**self.base, "name": name, **overrides}, overrides))
+        return flights
+
+    def run(self, n_jobs=-1, chunk_size: int = None, costs: List[float] = None) -> List[Dict]:
+        """
+        Fly all flights.
+        :param n_jobs: number of worker processes (see joblib)
+        :param chunk_size: largest number of flights sent to a worker at once; by default about four chunks per worker
+        without costs, so that workers which get short flights take more chunks
+        :param costs: estimated cost of each flight; flights are then sent longest first (see chunks)
+        :return: result of each flight, in the order of the overrides (see fly_chunk)
+        """
+        flights = self.flights()
+        self.workers = min(effective_n_jobs(n_jobs), max(len(flights), 1))
+        chunks = self.chunks(len(flights), chunk_size, costs)
+        start = time.perf_counter()
+        results = Parallel(self.workers, batch_size=1)(delayed(fly_chunk)(self.flight, [flights[i] for i in chunk])
+                                                       for chunk in chunks)
+        self.wall_time = time.perf_counter() - start
+        self.results = [None] * len(flights)
+        for chunk, chunk_results in zip(chunks, results):
+            for i, result in zip(chunk, chunk_results):
+                self.results[i] = result
+        return self.results
+
+    def chunks(self, count: int, chunk_size: int = None, costs: List[float] = None) -> List[List[int]]:
+        """
+        Indices of the flights of each chunk, in the order in which chunks are sent. Without costs, chunks follow the
+        order of the overrides. With them, flights are taken longest first and a chunk is closed once it costs an
+        eighth of a worker's share of the sweep, so long flights go alone and first.
+        """
+        if costs is None:
+            if chunk_size is None:
+                chunk_size = max(1, math.ceil(count / (4 * self.workers)))
+            return [list(range(i, min(i + chunk_size, count))) for i in range(0, count, chunk_size)]
+        target = sum(costs) / (8 * self.workers)
+        chunks, chunk, cost = [], [], 0.0
+        for i in sorted(range(count), key=lambda i: -costs[i]):
+            chunk.append(i)
+            cost += costs[i]
+            if cost >= target or len(chunk) == chunk_size:
+                chunks.append(chunk)
+                chunk, cost = [], 0.0
+        return chunks + [chunk] if chunk else chunks
+
+    def prerun_costs(self, coarse: Dict = None, n_jobs=-1) -> List[float]:
+        """
+        Estimate the cost of each flight by a cheap pre-run of it: its flight time (or processor time if the flight
+        function doesn't return one) with coarse parameters.
+        :param coarse: parameters of the pre-run which override those of each flight; by default a time step of 0.5s
+        and no output files, which costs about 2% of vary_pitch
+        """
+        if coarse is None:
+            coarse = {"dt": 0.5, "directory": None}
+        prerun = Sweep(self.flight, self.base, [{**overrides, **coarse} for overrides in self.overrides])
+        return [result.get("flight_time", result["cpu_time"]) for result in prerun.run(n_jobs)]
+
+    def history_costs(self, results: List[Dict]) -> List[float]:
+        """
+        Estimate the cost of each flight from results of an earlier sweep (see read_results): processor time of the
+        flight whose overridden parameters were the closest, each parameter scaled by the range of its values.
+        """
+        if not self.overrides:
+            return []
+        names = [name for name in self.overrides[0] if results and all(name in result for result in results)]
+        if not names:
+            raise ValueError("Earlier results don't have any of the swept parameters")
+        spans = {}
+        for name in names:
+            values = [result[name] for result in results if isinstance(result[name], (int, float))]
+            spans[name] = max(values) - min(values) if values else 0.0
+            if spans[name] == 0:
+                spans[name] = 1.0
+
+        def distance(overrides: Dict, result: Dict) -> float:
+            total = 0.0
+            for name in names:
+                if isinstance(result[name], (int, float)) and isinstance(overrides[name], (int, float)):
+                    total += ((overrides[name] - result[name]) / spans[name]) ** 2
+                else:
+                    total += str(overrides[name]) != str(result[name])
+            return total
+
+        return [min(results, key=lambda result: distance(overrides, result))["cpu_time"]
+                for overrides in self.overrides]
+
+    def report(self) -> str:
+        """
+        Number of flights, total processor time of all flights and time of the sweep, compared with the ideal time
+        (all workers busy until the end), and how busy each worker was.
+        """
+        work = sum(result["cpu_time"] for result in self.results)
+        ideal = work / self.workers
+        lines = [f"{len(self.results)} flights on {self.workers} workers: {work:.1f}s of flights in "
+                 f"{self.wall_time:.1f}s (ideal {ideal:.1f}s), speedup "
+                 f"{work / self.wall_time if self.wall_time else 0:.2f}"]
+        workers = {}
+        for result in self.results:
+            workers.setdefault(result["worker"], []).append(result["wall_time"])
+        for i, times in enumerate(workers.values()):
+            utilisation = sum(times) / self.wall_time if self.wall_time else 0
+            lines.append(f"worker {i + 1}: {len(times)} flights, busy {sum(times):.1f}s, utilisation {utilisation:.0%}")
+        return "\n".join(lines)
+
+    def write_results(self, filename: str) -> None:
+        """Write results (see run) to a CSV file, one line per flight."""
+        columns = list(dict.fromkeys(column for result in self.results for column in result))
+        with open(filename, "w", newline="") as file:
+            writer = csv.DictWriter(file, columns)
+            writer.writeheader()
+            writer.writerows(self.results)
@@ -0,0 +1,272 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from struct import pack, unpack
+from typing import Text, List
+
+import numpy as np
+
+from projectile.data.CsvWriters import ProjectileCsvWriter, ForcesCsvWriter
+from projectile.data.DataPoints import ProjectileDataPoint, ForcesDataPoint, PROJECTILE_COLUMNS, forces_columns
+from projectile.data.ZipIO import open_file, is_compressed
+
+"""
+Binary columnar format for flight data: a small header followed by rows of little-endian float64 values, all of the same
+width. Header is the magic string, length of the JSON description which follows, and the JSON description itself:
+kind of the file ("projectile" or "forces"), names of the columns and, in forces files, names of the forces. It's padded
+so that rows start at a multiple of 64 bytes. Number of rows isn't stored, it follows from the file size; rows are
+appended in chunks without going back to the header, and a file cut short by a crash is still readable.
+Projectile files have the same columns as the CSV files. Forces files have one row per evaluation instead of one per
+force: time, mass, Fx, Fy and Fz of each force, then reused (0 or 1) of each force.
+Readers memory-map the rows, so a whole column is a numpy array without reading the file.
+Files whose names end with .gz, .bz2 or .xz are compressed as they're written and decompressed as they're read (see
+ZipIO.open_file). Those can't be memory-mapped: chunks are decompressed one at a time, and the whole matrix (data) is
+only decompressed into memory when it's asked for.
+"""
+
+MAGIC = b"PROJBIN1"
+PROJECTILE = "projectile"
+FORCES = "forces"
+
+
+def is_binary(filename: Text) -> bool:
+    """Whether the file is in the binary format (rather than CSV)."""
+    with open_file(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def read_header(file, filename: Text) -> (dict, int):
+    """
+    Description of a binary file and offset of its first row; the file is left at that offset.
+    :param file: file open for reading at its start
+    """
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{filename} is not a binary flight data file")
+    length = unpack("<I", file.read(4))[0]
+    return json.loads(file.read(length).decode()), len(MAGIC) + 4 + length
+
+
+def binary_kind(filename: Text) -> str:
+    """Kind of a binary file (PROJECTILE or FORCES), from its header only."""
+    with open_file(filename, "rb") as file:
+        return read_header(file, filename)[0]["kind"]
+
+
+class BinaryWriter:
+    """
+    Collects rows in a preallocated buffer and writes it to the file whenever it fills up.
+    """
+    def __init__(self, filename: Text, kind: str, columns: List[str], forces: List[str] = (), chunk_rows=4096):
+        """
+        :param kind: PROJECTILE or FORCES
+        :param columns: names of the columns
+        :param forces: names of the forces, for forces files
+        :param chunk_rows: how many rows are buffered before they're written
+        """
+        self.file = open_file(filename, "wb")
+        self.kind = kind
+        self.columns = columns
+        self.forces = list(forces)
+        self.buffer = np.empty([chunk_rows, len(columns)], "<f8")
+        self.rows = 0
+
+    def write_header(self):
+        description = json.dumps({"kind": self.kind, "columns": self.columns, "forces": self.forces}).encode()
+        length = len(MAGIC) + 4 + len(description)
+        description += b" " * (-length % 64)
+        self.file.write(MAGIC + pack("<I", len(description)) + description)
+
+    def write_row(self, row) -> None:
+        self.buffer[self.rows] = row
+        self.rows += 1
+        if self.rows == len(self.buffer):
+            self.flush()
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        """Write rows of a TrajectoryBuffer (or any matrix with the right columns), after the buffered ones."""
+        self.flush()
+        self.file.write(np.ascontiguousarray(rows, "<f8").tobytes())
+
+    def flush(self) -> None:
+        """Write buffered rows to the file."""
+        self.file.write(self.buffer[:self.rows].tobytes())
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class ProjectileBinaryWriter(BinaryWriter):
+    """
+    Write projectile's state to binary file. Same columns as ProjectileCsvWriter.
+    """
+    def __init__(self, filename: Text, chunk_rows=4096):
+        super().__init__(filename, PROJECTILE, PROJECTILE_COLUMNS, chunk_rows=chunk_rows)
+
+    def write_data(self, data: ProjectileDataPoint):
+        self.write_row((data.time, data.planar_distance, data.latitude, data.longitude, data.altitude, data.x_speed,
+                        data.y_speed, data.z_speed, data.pitch, data.yaw, data.remaining_fuel))
+
+
+class ForcesBinaryWriter(BinaryWriter):
+    """
+    Write forces' intensities to binary file, one row per evaluation.
+    """
+    def __init__(self, filename: Text, force_names: List[str], chunk_rows=4096):
+        """
+        :param force_names: names of the forces, in the order in which they're in the intensity matrix
+        """
+        super().__init__(filename, FORCES, forces_columns(len(force_names)), force_names, chunk_rows)
+        self.flags = 2 + 3 * len(force_names)  # first reused column
+
+    def write_data(self, data: ForcesDataPoint):
+        self.write_values(data.time, data.mass, data.forces, data.reused)
+
+    def write_values(self, time: float, mass: float, forces: np.ndarray, reused: List[int] = ()):
+        """Same as write_data, without a data point."""
+        row = self.buffer[self.rows]
+        row[0] = time
+        row[1] = mass
+        row[2:self.flags] = forces.ravel()
+        row[self.flags:] = 0
+        for i in reused:
+            row[self.flags + i] = 1
+        self.rows += 1
+        if self.rows == len(self.buffer):
+            self.flush()
+
+
+class BinaryReader(ABC):
+    """
+    Reads a binary file. Rows are memory-mapped (or decompressed, see above); data is the matrix of all of them,
+    column() gives a single column.
+    Also reads one row at a time as data points (read()) or in chunks (chunks(), read_all()), as CSV readers do.
+    Subclasses give the data points of their kind of file (see data_point).
+    """
+    def __init__(self, filename: Text, kind: str = None):
+        """
+        :param kind: PROJECTILE or FORCES, if the file has to be of that kind
+        """
+        self.file = open_file(filename, "rb")
+        try:
+            description, self.offset = read_header(self.file, filename)
+        except ValueError:
+            self.file.close()
+            raise
+        self.kind = description["kind"]
+        if kind is not None and self.kind != kind:
+            self.file.close()
+            raise ValueError(f"{filename} is a {self.kind} file, not {kind}")
+        self.columns = description["columns"]
+        self.forces = description["forces"]
+        self.rows = None  # matrix of all rows, once they're mapped or decompressed
+        if not is_compressed(filename):
+            row_count = (os.path.getsize(filename) - self.offset) // (8 * len(self.columns))
+            if row_count > 0:
+                self.rows = np.memmap(filename, "<f8", "r", self.offset, (row_count, len(self.columns)))
+            else:
+                self.rows = np.zeros([0, len(self.columns)])
+            self.file.close()
+        self.read_lines = 0
+
+    @property
+    def data(self) -> np.ndarray:
+        """Matrix of all rows; a compressed file is decompressed the first time it's needed."""
+        if self.rows is None:
+            self.file.seek(self.offset)
+            self.rows = self.to_matrix(self.file.read())
+            self.file.close()
+        return self.rows
+
+    def to_matrix(self, data: bytes) -> np.ndarray:
+        width = 8 * len(self.columns)
+        return np.frombuffer(data[:len(data) // width * width], "<f8").reshape(-1, len(self.columns))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.data[:, self.columns.index(name)]
+
+    def chunks(self, rows=65536):
+        """Rows which haven't been read yet, as views of at most the given number of rows (as CSV readers do)."""
+        if self.rows is None:  # compressed, decompress one chunk at a time
+            self.file.seek(self.offset + self.read_lines * 8 * len(self.columns))
+            while True:
+                chunk = self.to_matrix(self.file.read(rows * 8 * len(self.columns)))
+                if len(chunk) == 0:
+                    return
+                self.read_lines += len(chunk)
+                yield chunk
+        while self.read_lines < len(self.data):
+            chunk = self.data[self.read_lines:self.read_lines + rows]
+            self.read_lines += len(chunk)
+            yield chunk
+
+    def read_all(self) -> np.ndarray:
+        """All rows which haven't been read yet."""
+        rows = self.data[self.read_lines:]
+        self.read_lines = len(self.data)
+        return rows
+
+    def read(self):
+        if self.read_lines >= len(self.data):
+            return None
+        row = self.data[self.read_lines].tolist()
+        self.read_lines += 1
+        return self.data_point(row)
+
+    @abstractmethod
+    def data_point(self, row: list):
+        """Data point of a row, as read() returns it."""
+
+    def close(self):
+        if self.rows is None:
+            self.file.close()
+        self.rows = None
+
+
+class ProjectileBinaryReader(BinaryReader):
+    """
+    Reads projectile binary file; read() returns ProjectileDataPoints like ProjectileCsvReader.
+    """
+    def __init__(self, filename: Text):
+        super().__init__(filename, PROJECTILE)
+
+    def data_point(self, row: list) -> ProjectileDataPoint:
+        return ProjectileDataPoint(*row)
+
+
+class ForcesBinaryReader(BinaryReader):
+    """
+    Reads forces binary file; read() returns ForcesDataPoints like ForcesCsvReader.
+    """
+    def __init__(self, filename: Text):
+        super().__init__(filename, FORCES)
+
+    def intensities(self) -> np.ndarray:
+        """Intensities of all forces at every evaluation, as a tensor of shape rows x forces x 3."""
+        return self.data[:, 2:2 + 3 * len(self.forces)].reshape(len(self.data), -1, 3)
+
+    def data_point(self, row: list) -> ForcesDataPoint:
+        flags = 2 + 3 * len(self.forces)
+        return ForcesDataPoint(row[0], row[1], np.array(row[2:flags]).reshape(-1, 3),
+                               [i for i, reused in enumerate(row[flags:]) if reused])
+
+
+def convert_binary_to_csv(binary_name: str, csv_name: str) -> None:
+    """
+    Write a binary file (projectile or forces) as a CSV file with the usual layout.
+    :param binary_name: binary file
+    :param csv_name: CSV file to be created
+    """
+    if binary_kind(binary_name) == PROJECTILE:
+        reader, writer = ProjectileBinaryReader(binary_name), ProjectileCsvWriter(csv_name)
+    else:
+        reader, writer = ForcesBinaryReader(binary_name), ForcesCsvWriter(csv_name)
+    writer.write_header()
+    for rows in reader.chunks():
+        writer.write_rows(rows)
+    writer.close()
+    reader.close()
@@ -1,15 +1,33 @@
-from typing import Text
+from itertools import islice
+from typing import Text, Iterator, List
+
 import numpy as np
 
 from projectile.data.DataPoints import ProjectileDataPoint, ForcesDataPoint
+from projectile.data.ZipIO import open_file
+
+"""
+Readers return one data point at a time (read()), or whole chunks of rows at once as numpy arrays (chunks() and
+read_all()). Arrays have the columns of binary files (see BinaryIO): PROJECTILE_COLUMNS for projectile files and
+forces_columns() for forces files, one row per evaluation. Chunks are parsed in bulk, a chunk at a time, so files
+larger than memory can be streamed through.
+"""
+
+CHUNK_ROWS = 65536
+
+
+def parse_lines(lines: List[str]) -> np.ndarray:
+    """Parse CSV lines into a matrix, one row per line."""
+    return np.loadtxt(lines, delimiter=",", ndmin=2)
 
 
 class ProjectileCsvReader:
     """
-    Reads projectile data file and returns ProjectileDataPoints describing projectile state at each moment.
+    Reads projectile data file and returns ProjectileDataPoints describing projectile state at each moment. Files
+    compressed by the writers (see ZipIO.open_file) are decompressed as they're read.
     """
     def __init__(self, filename: Text):
-        self.file = open(filename, "r")
+        self.file = open_file(filename, "r")
         self.read_lines = 0
 
     def read(self):
@@ -24,6 +42,26 @@ class ProjectileCsvReader:
                                    float(line[5]), float(line[6]), float(line[7]), float(line[8]), float(line[9]),
                                    float(line[10].strip()))
 
+    def chunks(self, rows=CHUNK_ROWS) -> Iterator[np.ndarray]:
+        """
+        Rows which haven't been read yet, as matrices of at most the given number of rows.
+        :param rows: number of rows in each chunk
+        """
+        if self.read_lines == 0:
+            self.file.readline()
+            self.read_lines += 1
+        while True:
+            lines = list(islice(self.file, rows))
+            if not lines:
+                return
+            self.read_lines += len(lines)
+            yield parse_lines(lines)
+
+    def read_all(self) -> np.ndarray:
+        """All rows which haven't been read yet, as a matrix."""
+        chunks = list(self.chunks())
+        return np.concatenate(chunks) if chunks else np.zeros([0, 11])
+
     def close(self):
         self.file.close()
 
@@ -31,33 +69,85 @@ class ProjectileCsvReader:
 class ForcesCsvReader:
     """
     Reads forces data file and returns ForcesDataPoint describing each force's intensity at each moment.
+    Intensities of all forces at the same moment are on consecutive lines, with force ids counting from 0.
     """
     def __init__(self, filename: Text):
-        self.file = open(filename, "r")
-        self.prev_line = None
+        self.file = open_file(filename, "r")
+        self.next_line = None  # first line of the next data point, already read from the file
         self.read_lines = 0
 
-    def read(self):
+    def skip_header(self):
         if self.read_lines == 0:
             self.file.readline()  # read header and ignore
-        if self.prev_line is None:
-            line = self.file.readline().split(",")
-        else:
-            line = self.prev_line
-        self.read_lines += 1
-        if line == [""] or line == "":
+            self.read_lines += 1
+
+    def read(self):
+        self.skip_header()
+        line = self.next_line
+        if line is None:
+            line = self.file.readline()
+            self.read_lines += 1
+        if line == "":
             return None
-        time, mass = float(line[0]), float(line[1])
-        force_i = -1
+        fields = line.split(",")
+        time, mass = float(fields[0]), float(fields[1])
         forces = []
-        while line != [""] and float(line[2]) > force_i:
-            forces.append([float(line[3]), float(line[4]), float(line[5])])
-            line = self.file.readline().split(",")
-            self.prev_line = line
-            force_i += 1
-        if line == [""] or line == "":
-            return None
-        return ForcesDataPoint(time, mass, np.array(forces))
+        reused = []
+        while line != "":
+            fields = line.split(",")
+            if forces and int(fields[2]) == 0:  # next data point
+                break
+            forces.append([float(fields[3]), float(fields[4]), float(fields[5])])
+            if len(fields) > 6 and int(fields[6]):  # files written before forces could be reused don't have this column
+                reused.append(int(fields[2]))
+            line = self.file.readline()
+            self.read_lines += 1
+        self.next_line = line
+        return ForcesDataPoint(time, mass, np.array(forces), reused)
+
+    def chunks(self, rows=CHUNK_ROWS) -> Iterator[np.ndarray]:
+        """
+        Data points which haven't been read yet, as matrices of at most the given number of rows, one row per data
+        point, with the columns of forces binary files: time, mass, Fx, Fy and Fz of each force, reused of each force.
+        :param rows: number of data points in each chunk
+        """
+        self.skip_header()
+        line = self.file.readline() if self.next_line is None else self.next_line
+        self.next_line = None
+        lines = []
+        while line != "" and (not lines or int(line.split(",")[2]) != 0):  # lines of the first data point
+            lines.append(line)
+            line = self.file.readline()
+        force_count = len(lines)
+        if line != "":
+            lines.append(line)
+        size = rows * force_count
+        while lines:
+            if len(lines) < size:
+                lines += islice(self.file, size - len(lines))
+            chunk, lines = lines[:size], lines[size:]
+            self.read_lines += len(chunk)
+            yield self.to_rows(parse_lines(chunk), force_count)
+            if not lines:
+                lines = list(islice(self.file, size))
+
+    @staticmethod
+    def to_rows(data: np.ndarray, force_count: int) -> np.ndarray:
+        """Lines of the file (one per force) as rows of data points (one per evaluation)."""
+        points = len(data) // force_count  # a data point cut short at the end of the file is left out
+        data = data[:points * force_count]
+        rows = np.zeros([points, 2 + 4 * force_count])
+        rows[:, 0] = data[::force_count, 0]
+        rows[:, 1] = data[::force_count, 1]
+        rows[:, 2:2 + 3 * force_count] = data[:, 3:6].reshape(points, -1)
+        if data.shape[1] > 6:
+            rows[:, 2 + 3 * force_count:] = data[:, 6].reshape(points, -1)
+        return rows
+
+    def read_all(self) -> np.ndarray:
+        """All data points which haven't been read yet, as a matrix (see chunks)."""
+        chunks = list(self.chunks())
+        return np.concatenate(chunks) if chunks else np.zeros([0, 2])
 
     def close(self):
         self.file.close()
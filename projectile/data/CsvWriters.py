@@ -1,23 +1,37 @@
-from typing import Text
+from typing import Text, List
+
+import numpy as np
 
 from projectile.data.DataPoints import ProjectileDataPoint, ForcesDataPoint
 from projectile.core.Constants import X_INDEX, Y_INDEX, Z_INDEX
+from projectile.data.ZipIO import open_file
 
 
 class ProjectileCsvWriter:
     """
-    Write projectile's state to CSV file.
+    Write projectile's state to CSV file, compressed as it's written if its name ends with .gz, .bz2 or .xz (see
+    ZipIO.open_file).
     """
+    FORMAT = "{:.4f},{:.2f},{},{},{},{},{},{},{},{},{:.2f}\n"
+
     def __init__(self, filename: Text):
-        self.file = open(filename, "w")
+        self.file = open_file(filename, "w")
 
     def write_header(self):
         self.file.write("time,distance,latitude,longitude,altitude,Vx,Vy,Vz,pitch,yaw,fuel\n")
 
     def write_data(self, data: ProjectileDataPoint):
-        self.file.write("{:.4f},{:.2f},{},{},{},{},{},{},{},{},{:.2f}\n"
-                        .format(data.time, data.planar_distance, data.latitude, data.longitude, data.altitude,
-                                data.x_speed, data.y_speed, data.z_speed, data.pitch, data.yaw, data.remaining_fuel))
+        self.file.write(self.FORMAT.format(data.time, data.planar_distance, data.latitude, data.longitude, data.altitude,
+                                           data.x_speed, data.y_speed, data.z_speed, data.pitch, data.yaw,
+                                           data.remaining_fuel))
+
+    def write_rows(self, rows: np.ndarray):
+        """
+        Write rows of a TrajectoryBuffer. They're converted to lists a slice at a time: thousands of lists alive at
+        once would set off the garbage collector.
+        """
+        for start in range(0, len(rows), 256):
+            self.file.write("".join(self.FORMAT.format(*row) for row in rows[start:start + 256].tolist()))
 
     def close(self):
         self.file.close()
@@ -25,20 +39,38 @@ class ProjectileCsvWriter:
 
 class ForcesCsvWriter:
     """
-    Write forces' intensities to CSV file.
+    Write forces' intensities to CSV file, compressed like ProjectileCsvWriter's.
     """
     def __init__(self, filename: Text):
-        self.file = open(filename, "w")
+        self.file = open_file(filename, "w")
 
     def write_header(self):
-        self.file.write("time,mass,force_id,Fx,Fy,Fz\n")
+        self.file.write("time,mass,force_id,Fx,Fy,Fz,reused\n")
+
+    FORMAT = "{:.4f},{:.2f},{},{},{},{},{}\n"
 
     def write_data(self, data: ForcesDataPoint):
+        self.write_values(data.time, data.mass, data.forces, data.reused)
+
+    def write_values(self, time: float, mass: float, forces: np.ndarray, reused: List[int] = ()):
+        """Same as write_data, without a data point."""
         i = 0
-        for force in data.forces:
-            self.file.write("{:.4f},{:.2f},{},{},{},{}\n".format(data.time, data.mass, i, force[X_INDEX],
-                                                                 force[Y_INDEX], force[Z_INDEX]))
+        for force in forces:
+            self.file.write(self.FORMAT.format(time, mass, i, force[X_INDEX], force[Y_INDEX], force[Z_INDEX],
+                                               int(i in reused)))
             i += 1
 
+    def write_rows(self, rows: np.ndarray):
+        """Write rows of a ForcesBuffer (one line per force of each row), a slice at a time like ProjectileCsvWriter."""
+        count = (rows.shape[1] - 2) // 4
+        flags = 2 + 3 * count
+        for start in range(0, len(rows), 256):
+            lines = []
+            for row in rows[start:start + 256].tolist():
+                for i in range(count):
+                    lines.append(self.FORMAT.format(row[0], row[1], i, row[2 + 3 * i], row[3 + 3 * i], row[4 + 3 * i],
+                                                    int(row[flags + i])))
+            self.file.write("".join(lines))
+
     def close(self):
         self.file.close()
@@ -1,7 +1,23 @@
+from typing import List
+
 import numpy as np
 
+PROJECTILE_COLUMNS = ["time", "distance", "latitude", "longitude", "altitude", "Vx", "Vy", "Vz", "pitch", "yaw",
+                      "fuel"]
+
+
+def forces_columns(force_count: int) -> List[str]:
+    """Columns of forces records kept in arrays (see BinaryIO): time, mass, Fx, Fy, Fz of each force, reused flags"""
+    columns = ["time", "mass"]
+    for i in range(force_count):
+        columns += [f"{i}.Fx", f"{i}.Fy", f"{i}.Fz"]
+    return columns + [f"{i}.reused" for i in range(force_count)]
+
 
 class ProjectileDataPoint:
+    __slots__ = ("time", "planar_distance", "latitude", "longitude", "altitude", "x_speed", "y_speed", "z_speed",
+                 "pitch", "yaw", "remaining_fuel")
+
     def __init__(self, time: float, planar_distance: float, latitude: float, longitude: float, altitude: float,
                  x_speed: float, y_speed: float, z_speed: float, pitch: float, yaw: float, remaining_fuel: float):
         self.time = time
@@ -16,9 +32,20 @@ class ProjectileDataPoint:
         self.yaw = yaw
         self.remaining_fuel = remaining_fuel
 
+    def values(self) -> tuple:
+        """Values in the order of PROJECTILE_COLUMNS"""
+        return (self.time, self.planar_distance, self.latitude, self.longitude, self.altitude, self.x_speed,
+                self.y_speed, self.z_speed, self.pitch, self.yaw, self.remaining_fuel)
+
 
 class ForcesDataPoint:
-    def __init__(self, time: float, mass: float, forces_matrix: np.ndarray):
+    __slots__ = ("time", "mass", "forces", "reused")
+
+    def __init__(self, time: float, mass: float, forces_matrix: np.ndarray, reused: List[int] = ()):
+        """
+        :param reused: indices of forces whose intensities were extrapolated from an earlier evaluation
+        """
         self.time = time
         self.mass = mass
         self.forces = forces_matrix
+        self.reused = reused
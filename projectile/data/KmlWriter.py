@@ -1,25 +1,124 @@
+import io
+import os
 import zipfile
 from datetime import datetime, timedelta
 from math import degrees
-from typing import Text
+from typing import Text, List
 
+import numpy as np
+from joblib import Parallel, delayed
+
+from projectile.data.BinaryIO import is_binary, ProjectileBinaryReader
 from projectile.data.CsvReaders import ProjectileCsvReader
 from projectile.data.DataPoints import ProjectileDataPoint
-from projectile.data.ZipIO import compress
-from projectile.util import fp_gt
+from projectile.data.LodKmzWriter import LodKmzWriter
+from projectile.data.Sinks import Decimator, TimeInterval
+from projectile.data.ZipIO import COMPRESSORS
+from projectile.util import douglas_peucker
 
 
-def convert_csv_to_kmz(csv_name: str, kml_name: str):
+def convert_csv_to_kmz(csv_name: str, kml_name: str, tolerance: float = None, lod=False):
     """
-    Converts a Projectile CSV file to KMZ file which can then be loaded to e.g. Google Earth.
+    Converts a Projectile CSV file (or binary file, see BinaryIO) to KMZ file which can then be loaded to e.g. Google
+    Earth.
     :param csv_name: filename of projectile CSV file (with extension)
     :param kml_name: filename of KMZ file to be created - WITHOUT extension
+    :param tolerance: simplify the path to within this distance (m), see KmlWriter
+    :param lod: write tiles with levels of detail instead of a single path (see LodKmzWriter); tolerance isn't used
     :return:
     """
-    kml = KmlWriter(kml_name + ".kml")
-    csv = ProjectileCsvReader(csv_name)
-    kml.convert(csv, sample_rate=10)
-    compress(kml_name + ".kml", kml_name + ".kmz", zipfile.ZIP_DEFLATED, "doc.kml", False)
+    convert_to_kmz(projectile_reader(csv_name), kml_name, tolerance, lod)
+
+
+def projectile_reader(filename: str):
+    """ProjectileBinaryReader or ProjectileCsvReader, whichever reads the file."""
+    return ProjectileBinaryReader(filename) if is_binary(filename) else ProjectileCsvReader(filename)
+
+
+def convert_to_kmz(reader, kml_name: str, tolerance: float = None, lod=False):
+    """
+    Converts projectile data points to KMZ file, like convert_csv_to_kmz.
+    :param reader: ProjectileCsvReader or ProjectileBinaryReader
+    :param kml_name: filename of KMZ file to be created - WITHOUT extension
+    :param tolerance: simplify the path to within this distance (m), see KmlWriter
+    :param lod: write tiles with levels of detail (see LodKmzWriter)
+    """
+    kmz = LodKmzWriter(kml_name + ".kmz") if lod else KmzWriter(kml_name + ".kmz", tolerance=tolerance)
+    kmz.convert(reader, sample_rate=10)
+    reader.close()
+
+
+def flight_name(filename: str) -> str:
+    """Name of a flight's file without its directory and extensions (e.g. 15 for csv/15.csv.bz2)."""
+    name = os.path.basename(filename)
+    for extension in COMPRESSORS:
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    return os.path.splitext(name)[0]
+
+
+def flight_files(directory: str) -> List[str]:
+    """
+    Projectile files of a scenario's directory (e.g. scenario_data/ld_vary_yaw/csv), ordered by the swept value when
+    they're named after it.
+    """
+    def key(name: str):
+        stem = flight_name(name)
+        try:
+            return 0, float(stem), name
+        except ValueError:
+            return 1, 0.0, name
+
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory), key=key)
+            if os.path.isfile(os.path.join(directory, name))]
+
+
+def convert_directory(directory: str, output_dir: str = None, tolerance: float = None, lod=False, n_jobs=-1) -> None:
+    """
+    Converts every projectile file of a directory to a KMZ file of the same name, in parallel.
+    :param directory: directory of projectile CSV (or binary) files, e.g. scenario_data/ld_vary_yaw/csv
+    :param output_dir: directory of the KMZ files; by default kml next to the given directory
+    :param tolerance: simplify the paths to within this distance (m), see KmlWriter
+    :param lod: write tiles with levels of detail (see LodKmzWriter)
+    :param n_jobs: number of processes (see joblib)
+    """
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(os.path.normpath(directory)), "kml")
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    for filename in flight_files(directory):
+        kml_name = os.path.join(output_dir, flight_name(filename))
+        jobs.append(delayed(convert_csv_to_kmz)(filename, kml_name, tolerance, lod))
+    Parallel(n_jobs)(jobs)
+
+
+def merge_to_kmz(directory: str, kml_name: str, tolerance: float = None, n_jobs=-1) -> None:
+    """
+    Converts every projectile file of a directory into a single KMZ file, with a folder for each flight and styles
+    shared by all of them. Flights are converted in parallel and written into the KMZ in order as they're done, all
+    starting at the same time.
+    :param directory: directory of projectile CSV (or binary) files, e.g. scenario_data/ld_vary_yaw/csv
+    :param kml_name: filename of KMZ file to be created - WITHOUT extension
+    :param tolerance: simplify the paths to within this distance (m), see KmlWriter
+    :param n_jobs: number of processes (see joblib)
+    """
+    kmz = KmzWriter(kml_name + ".kmz")
+    kmz.write_header(os.path.basename(kml_name))
+    folders = Parallel(n_jobs, return_as="generator")(delayed(flight_folder)(filename, tolerance, kmz.date)
+                                                      for filename in flight_files(directory))
+    for folder in folders:
+        kmz.file.write(folder)
+    kmz.close()
+
+
+def flight_folder(filename: str, tolerance: float, date: datetime) -> str:
+    """KML folder of the flight of a projectile file (see merge_to_kmz)."""
+    reader = projectile_reader(filename)
+    writer = KmlFolderWriter(None, tolerance=tolerance)
+    writer.date = date
+    writer.convert(reader, flight_name(filename), sample_rate=10)
+    reader.close()
+    return writer.text
 
 
 class KmlWriter:
@@ -27,8 +126,16 @@ class KmlWriter:
     Write projectile flight to a KML file which can be loaded to e.g. Google Eath
     (can be zipped and then becomes KMZ file).
     """
-    def __init__(self, filename: Text, peak_band=10, fuel_band=60, altitude_mode="absolute"):
-        self.file = open(filename, "w")
+    def __init__(self, filename: Text, peak_band=10, fuel_band=60, altitude_mode="absolute", tolerance: float = None,
+                 earth_radius=6378137):
+        """
+        :param tolerance: if given, path written by write_rows is simplified (Douglas-Peucker), each dropped point
+        being at most this far (m) from it
+        :param earth_radius: radius of the earth, for distances of simplification
+        """
+        self.file = self.open(filename)
+        self.tolerance = tolerance
+        self.earth_radius = earth_radius
         self.date = datetime.now()
         self.peak_band = peak_band
         self.fuel_band = fuel_band
@@ -37,6 +144,9 @@ class KmlWriter:
         self.wrote_fuel = False
         self.previous = None
 
+    def open(self, filename: Text):
+        return open(filename, "w")
+
     def write_header(self, name="flight"):
         self.file.write("<?xml version='1.0' encoding='UTF-8'?>\n")
         self.file.write("<kml xmlns='http://earth.google.com/kml/2.2'>\n")
@@ -91,28 +201,100 @@ class KmlWriter:
         self.file.write("</Placemark>\n")
         self.previous = data
 
+    def write_rows(self, rows: np.ndarray):
+        """
+        Write rows of a TrajectoryBuffer (columns of PROJECTILE_COLUMNS), so the writer can be used as a sink (see
+        Sinks). Same placemarks as write() without pretty, formatted a chunk at a time and written at once.
+        """
+        if len(rows) == 0:
+            return
+        if self.tolerance is not None:
+            rows = self.simplify(rows)
+        if self.previous is None:
+            self.previous = ProjectileDataPoint(*rows[0].tolist())
+            rows = rows[1:]
+        if len(rows) == 0:  # the first row only starts the path, or simplification dropped all rows
+            return
+        times = np.datetime64(self.date, "us") + np.round(rows[:, 0] * 1e6).astype("timedelta64[us]")
+        times = [t[:-7] if t.endswith(".000000") else t for t in np.datetime_as_string(times).tolist()]
+        longitudes = [degrees(self.previous.longitude)] + np.degrees(rows[:, 3]).tolist()
+        latitudes = [degrees(self.previous.latitude)] + np.degrees(rows[:, 2]).tolist()
+        altitudes = [self.previous.altitude] + rows[:, 4].tolist()
+        line = f"<LineString><extrude>1</extrude><altitudeMode>{self.altitude_mode}</altitudeMode><coordinates>"
+        placemarks = []
+        for i, (z_speed, fuel) in enumerate(zip(rows[:, 7].tolist(), rows[:, 10].tolist())):
+            styles = ""
+            if self.peak_band > z_speed > -self.peak_band or (z_speed <= 0 and not self.wrote_peak):
+                styles += "<styleUrl>#peak</styleUrl>"
+                self.wrote_peak = True
+            if 0 < fuel <= self.fuel_band or (fuel == 0 and not self.wrote_fuel):
+                styles += "<styleUrl>#fuel</styleUrl>"
+                self.wrote_fuel = True
+            placemarks.append(f"<Placemark><TimeSpan><begin>{times[i]}</begin></TimeSpan>{styles}{line}"
+                              f"{longitudes[i]},{latitudes[i]},{altitudes[i]} "
+                              f"{longitudes[i + 1]},{latitudes[i + 1]},{altitudes[i + 1]}"
+                              f"</coordinates></LineString></Placemark>\n")
+        self.file.write("".join(placemarks))
+        self.previous = ProjectileDataPoint(*rows[-1].tolist())
+
+    def simplify(self, rows: np.ndarray) -> np.ndarray:
+        """Rows left of the path by Douglas-Peucker simplification, continuing from the last row written."""
+        if self.previous is not None:
+            rows = np.concatenate([[self.previous.values()], rows])
+        radius = self.earth_radius + rows[:, 4]
+        points = np.column_stack([radius * np.cos(rows[:, 2]) * np.cos(rows[:, 3]),
+                                  radius * np.cos(rows[:, 2]) * np.sin(rows[:, 3]), radius * np.sin(rows[:, 2])])
+        kept = douglas_peucker(points, self.tolerance)
+        return rows[kept[1:]] if self.previous is not None else rows[kept]
+
     def close(self):
         self.file.write("</Document>\n")
         self.file.write("</kml>\n")
         self.file.close()
 
     def convert(self, reader: ProjectileCsvReader, name="flight", sample_rate=100, speed_factor=1):
-        dt = 1/sample_rate
-        offset = 0
+        """
+        Write records of the reader (in chunks, see CsvReaders), resampled to sample_rate records per second of flight
+        time (see TimeInterval); the last one is always written.
+        :param reader: ProjectileCsvReader or ProjectileBinaryReader
+        :param speed_factor: how many times faster than real time the flight is played
+        """
         self.write_header(name)
-        data = reader.read()
-        self.write(data)
-        new_data = reader.read()
-        while new_data is not None:
-            new_data.time -= offset
-            while new_data is not None and fp_gt(data.time + dt, new_data.time):
-                new_data = reader.read()
-            if new_data is None:
-                break
-            offset += (new_data.time - data.time) * (1 - 1/speed_factor)
-            new_data.time -= (new_data.time - data.time) * (1 - 1/speed_factor)
-
-            data = new_data
-            self.write(data)
-            new_data = reader.read()
-        self.close()
+        decimator = Decimator(self, TimeInterval(1 / sample_rate / speed_factor))
+        start = None
+        for rows in reader.chunks():
+            if speed_factor != 1:
+                start = rows[0, 0] if start is None else start
+                rows = rows.copy()
+                rows[:, 0] = start + (rows[:, 0] - start) / speed_factor
+            decimator.write_rows(rows)
+        decimator.close()
+
+
+class KmzWriter(KmlWriter):
+    """
+    KmlWriter which writes straight into doc.kml inside a KMZ file, without a KML file on the disk.
+    """
+    def open(self, filename: Text):
+        self.zip = zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED)
+        return io.TextIOWrapper(self.zip.open("doc.kml", "w"), "utf-8")
+
+    def close(self):
+        super().close()
+        self.zip.close()
+
+
+class KmlFolderWriter(KmlWriter):
+    """
+    KmlWriter which writes a flight as a KML Folder in memory (text, once it's closed), to be put into a KML file
+    together with other flights. Styles are left to that file.
+    """
+    def open(self, filename: Text):
+        return io.StringIO()
+
+    def write_header(self, name="flight"):
+        self.file.write(f"<Folder><name>{name}</name>\n")
+
+    def close(self):
+        self.file.write("</Folder>\n")
+        self.text = self.file.getvalue()
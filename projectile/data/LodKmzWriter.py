@@ -0,0 +1,187 @@
+import io
+import zipfile
+from datetime import datetime, timedelta
+from typing import Text, List
+
+import numpy as np
+
+from projectile.data.Sinks import Decimator, TimeInterval
+
+"""
+KMZ with levels of detail, for flights too long to be shown as one path. The path is cut into tiles of consecutive
+records. Tiles of the finest level have every record, tiles of each coarser level have every branching-th record of
+the level below and span branching of its tiles. Each tile is a KML file of its own with one LineString, and links
+to the tiles below it with a NetworkLink whose Region makes a viewer load them only when their area is large enough on
+the screen. doc.kml links only to tiles of the coarsest level, so a viewer starts with a few light files and loads
+detail only where it's zoomed in.
+"""
+
+
+class Tile:
+    """
+    Tile which has been written: name of its file and bounds of the records it spans. Bounds of longitude are on the
+    unwrapped longitude of the flight (see LodKmzWriter.write_rows), so a tile which crosses the antimeridian has a
+    narrow box rather than one around the whole Earth.
+    """
+    def __init__(self, name: str, rows: np.ndarray, children: List["Tile"]):
+        self.name = name
+        box = rows[:, [2, -1, 4]]  # latitude, unwrapped longitude, altitude
+        boxes = [box.min(axis=0), box.max(axis=0)]
+        for child in children:
+            boxes += [child.low, child.high]
+        self.low = np.min(boxes, axis=0)
+        self.high = np.max(boxes, axis=0)
+        self.begin = float(rows[0, 0])
+        self.end = float(rows[-1, 0])
+
+
+class Level:
+    """
+    Tile of a level which is being filled.
+    """
+    def __init__(self, index: int, stride: int):
+        """
+        :param index: 0 for the finest level
+        :param stride: level has every stride-th record
+        """
+        self.index = index
+        self.stride = stride
+        self.rows = []  # records of the tile, as lists
+        self.children = []  # tiles of the level below which are inside this tile
+        self.span = 0  # index of the tile
+        self.last = None  # last record of the previous tile, the new one continues from it
+
+
+class LodKmzWriter:
+    """
+    Writes records (see Sinks) to a KMZ with levels of detail. Tiles are written into the archive as soon as they're
+    complete, so only the tile which is being filled is kept for each level.
+    """
+    def __init__(self, filename: Text, tile_rows=1000, levels=3, branching=4, lod_pixels=256,
+                 altitude_mode="absolute", color="ff00aaff"):
+        """
+        :param tile_rows: number of records in a tile
+        :param levels: number of levels of detail
+        :param branching: number of tiles of a level inside a tile of the level above it
+        :param lod_pixels: size on the screen (pixels) above which a tile gets loaded
+        :param color: color of the path (aabbggrr)
+        """
+        self.zip = zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED)
+        self.tile_rows = tile_rows
+        self.branching = branching
+        self.lod_pixels = lod_pixels
+        self.altitude_mode = altitude_mode
+        self.color = color
+        self.levels = [Level(i, branching ** i) for i in range(levels)]
+        self.top = []  # tiles of the coarsest level
+        self.rows = 0  # number of records so far
+        self.last_longitude = None  # unwrapped longitude of the last record
+        self.date = datetime.now()
+        self.name = "flight"
+
+    def write_header(self, name="flight"):
+        self.name = name
+
+    def write_rows(self, rows: np.ndarray):
+        """
+        Add records; tiles which they complete are written. Each record gets its longitude unwrapped (continuing from
+        the last record across the antimeridian) as an extra last column, for bounds of tiles.
+        """
+        if not len(rows):
+            return
+        longitudes = rows[:, 3] if self.last_longitude is None else np.concatenate([[self.last_longitude], rows[:, 3]])
+        longitudes = np.unwrap(longitudes)[-len(rows):]
+        self.last_longitude = longitudes[-1]
+        rows = np.column_stack([rows, longitudes])
+        indices = np.arange(self.rows, self.rows + len(rows))
+        self.rows += len(rows)
+        # a tile of each level starts with a tile of the finest level, so only those starts need to be looked at
+        starts = np.flatnonzero(indices % self.tile_rows == 0).tolist()
+        bounds = sorted({0, len(rows)} | set(starts))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            for level in self.levels:
+                span = int(indices[start]) // (self.tile_rows * level.stride)
+                if span != level.span:
+                    self.finish_tile(level)
+                    level.span = span
+                part = rows[start:end][indices[start:end] % level.stride == 0]
+                level.rows += part.tolist()
+
+    def finish_tile(self, level: Level):
+        """Write the tile which is being filled at the level, and add it to the level above it."""
+        if not level.rows:
+            return
+        rows = np.array(([level.last] if level.last is not None else []) + level.rows)
+        tile = Tile(f"tile_{level.index}_{level.span}.kml", rows, level.children)
+        with io.TextIOWrapper(self.zip.open(tile.name, "w"), "utf-8") as file:
+            file.write(self.tile_kml(level, tile, rows))
+        level.last = level.rows[-1]
+        level.rows = []
+        level.children = []
+        if level.index + 1 < len(self.levels):
+            self.levels[level.index + 1].children.append(tile)
+        else:
+            self.top.append(tile)
+
+    def tile_kml(self, level: Level, tile: Tile, rows: np.ndarray) -> str:
+        coordinates = " ".join(f"{lon},{lat},{alt}" for lat, lon, alt in
+                               zip(np.degrees(rows[:, 2]).tolist(), np.degrees(rows[:, 3]).tolist(),
+                                   rows[:, 4].tolist()))
+        parts = [self.header(tile.name)]
+        parts += [self.link(child) for child in level.children]
+        region = ""
+        if level.index > 0:  # hide the coarse path once the tiles below it are loaded
+            region = self.region(tile, 0, self.lod_pixels * self.branching)
+        parts.append(f"<Placemark><name>{tile.name}</name><TimeSpan><begin>{self.time(tile.begin)}</begin>"
+                     f"<end>{self.time(tile.end)}</end></TimeSpan>{region}<styleUrl>#path</styleUrl><LineString>"
+                     f"<extrude>1</extrude><altitudeMode>{self.altitude_mode}</altitudeMode>"
+                     f"<coordinates>{coordinates}</coordinates></LineString></Placemark>\n")
+        parts.append("</Document>\n</kml>\n")
+        return "".join(parts)
+
+    def header(self, name: str) -> str:
+        return "<?xml version='1.0' encoding='UTF-8'?>\n<kml xmlns='http://www.opengis.net/kml/2.2'>\n<Document>\n" \
+               f"<name>{name}</name>\n<Style id=\"path\"><LineStyle><color>{self.color}</color><width>2</width>" \
+               f"</LineStyle><PolyStyle><color>7f{self.color[2:]}</color></PolyStyle></Style>\n"
+
+    @staticmethod
+    def region(tile: Tile, min_pixels: int, max_pixels: int) -> str:
+        """Region of the tile; west is east of east when it crosses the antimeridian, as KML allows."""
+        (south, west), (north, east) = np.degrees(tile.low[:2]), np.degrees(tile.high[:2])
+        if east - west >= 360:
+            west, east = -180.0, 180.0
+        else:
+            west, east = (west + 180) % 360 - 180, 180 - (180 - east) % 360
+        return f"<Region><LatLonAltBox><north>{north}</north><south>{south}</south><east>{east}</east>" \
+               f"<west>{west}</west><minAltitude>{tile.low[2]}</minAltitude><maxAltitude>{tile.high[2]}</maxAltitude>" \
+               f"<altitudeMode>absolute</altitudeMode></LatLonAltBox><Lod><minLodPixels>{min_pixels}</minLodPixels>" \
+               f"<maxLodPixels>{max_pixels}</maxLodPixels></Lod></Region>"
+
+    def link(self, tile: Tile, region=True) -> str:
+        region = self.region(tile, self.lod_pixels, -1) if region else ""
+        return f"<NetworkLink><name>{tile.name}</name>{region}<Link><href>{tile.name}</href>" \
+               f"<viewRefreshMode>onRegion</viewRefreshMode></Link></NetworkLink>\n"
+
+    def time(self, seconds: float) -> str:
+        return (self.date + timedelta(seconds=seconds)).isoformat()
+
+    def convert(self, reader, name="flight", sample_rate=10):
+        """
+        Write records of the reader (in chunks, see CsvReaders), resampled to sample_rate records per second of flight
+        time, as KmlWriter.convert does.
+        """
+        self.write_header(name)
+        decimator = Decimator(self, TimeInterval(1 / sample_rate))
+        for rows in reader.chunks():
+            decimator.write_rows(rows)
+        decimator.close()
+
+    def close(self):
+        """Write the last tiles and doc.kml, which links to the tiles of the coarsest level."""
+        for level in self.levels:
+            self.finish_tile(level)
+        with io.TextIOWrapper(self.zip.open("doc.kml", "w"), "utf-8") as file:
+            file.write(self.header(self.name))
+            file.write("".join(self.link(tile, False) for tile in self.top))
+            file.write("</Document>\n</kml>\n")
+        self.zip.close()
@@ -1,3 +1,5 @@
+from typing import List
+
 from projectile.data.CsvReaders import ForcesCsvReader
 import matplotlib.pyplot as plt
 import numpy as np
@@ -6,20 +8,50 @@ import numpy as np
 
 
 def extract_force(reader: ForcesCsvReader, index: int):
-    point = reader.read()
-    force_data = []
-    while point is not None:
-        force_data.append([point.time, point.mass, *point.forces[index]])
-        point = reader.read()
+    """
+    Time, mass and intensity of one force at each evaluation, as a matrix with a row per evaluation.
+    :param reader: ForcesCsvReader or ForcesBinaryReader
+    :param index: index of the force
+    """
+    data = reader.read_all()
+    force_data = np.column_stack([data[:, 0], data[:, 1], data[:, 2 + 3 * index:5 + 3 * index]])
     reader.close()
-    return np.array(force_data)
+    return force_data
 
 
-def simple_force_plot(reader: ForcesCsvReader, index: int, title: str):
-    data = extract_force(reader, index).transpose()
+def extract_forces(reader: ForcesCsvReader) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    All forces at each evaluation, read in a single pass.
+    :param reader: ForcesCsvReader or ForcesBinaryReader
+    :return: time and mass of each evaluation, intensities as a tensor of shape evaluations x forces x 3
+    """
+    data = reader.read_all()
+    reader.close()
+    count = (data.shape[1] - 2) // 4
+    return data[:, 0], data[:, 1], data[:, 2:2 + 3 * count].reshape(len(data), count, 3)
+
+
+def force_plot(time: np.ndarray, mass: np.ndarray, intensity: np.ndarray, title: str):
+    """Plot acceleration caused by a force, given its intensity (evaluations x 3)."""
     plt.title(title)
-    plt.plot(data[0], data[2]/data[1], 'r', label="X")
-    plt.plot(data[0], data[3]/data[1], 'g', label="Y")
-    plt.plot(data[0], data[4]/data[1], 'b', label="Z")
+    plt.plot(time, intensity[:, 0]/mass, 'r', label="X")
+    plt.plot(time, intensity[:, 1]/mass, 'g', label="Y")
+    plt.plot(time, intensity[:, 2]/mass, 'b', label="Z")
     plt.legend()
     plt.show()
+
+
+def simple_force_plot(reader: ForcesCsvReader, index: int, title: str):
+    data = extract_force(reader, index)
+    force_plot(data[:, 0], data[:, 1], data[:, 2:5], title)
+
+
+def plot_forces(reader: ForcesCsvReader, names: List[str]):
+    """
+    Plot each force in the file, one after another; the file is read only once.
+    :param reader: ForcesCsvReader or ForcesBinaryReader
+    :param names: titles of the plots, in the order of forces in the file
+    """
+    time, mass, intensities = extract_forces(reader)
+    for i in range(intensities.shape[1]):
+        force_plot(time, mass, intensities[:, i], names[i] if i < len(names) else f"Force {i}")
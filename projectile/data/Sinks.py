@@ -0,0 +1,309 @@
+import queue
+import threading
+from abc import ABC, abstractmethod
+from math import sqrt
+from typing import List, Dict, Set
+
+import numpy as np
+
+from projectile.data.DataPoints import PROJECTILE_COLUMNS
+
+"""
+Sinks take records of a flight in chunks, as rows of a TrajectoryBuffer (columns of PROJECTILE_COLUMNS), and do
+something with them as they come: write them to a file, pass some of them on to another sink (see Decimator) or
+collect statistics.
+A sink has write_header(), write_rows(rows) and close() methods, like projectile writers (ProjectileCsvWriter,
+ProjectileBinaryWriter and KmzWriter are all sinks). Launcher passes each chunk of records through all sinks of the
+flight, so every output is written in a single pass over the records, without reading any file back.
+"""
+
+TIME = 0  # time is the first column of projectile and forces rows
+
+
+class Tee:
+    """
+    Passes rows to each of its sinks.
+    """
+    def __init__(self, sinks: list):
+        self.sinks = list(sinks)
+
+    def write_header(self):
+        for sink in self.sinks:
+            sink.write_header()
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        for sink in self.sinks:
+            sink.write_rows(rows)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class DecimationPolicy(ABC):
+    """
+    Decides which rows a Decimator passes on. Policies keep state from one chunk to the next, so each Decimator needs
+    its own. Pinned rows (e.g. events of the flight) and the last row are always kept. Subclasses implement select.
+    """
+    def start(self, columns: List[str]) -> None:
+        """Called before the first chunk, with the names of the columns."""
+        pass
+
+    @abstractmethod
+    def select(self, rows: np.ndarray, pinned: np.ndarray) -> np.ndarray:
+        """
+        Choose rows of the next chunk. A row which may not be kept (e.g. the last one) can be held back, and has to be
+        returned by a later select or by finish.
+        :param rows: next chunk of rows
+        :param pinned: whether each of the rows has to be kept
+        :return: rows to pass on, out of these and those held back from earlier chunks
+        """
+
+    def finish(self) -> np.ndarray:
+        """Rows which are still held back once all rows have been selected, None if there are none."""
+        return None
+
+
+class EveryKth(DecimationPolicy):
+    """
+    Keeps every k-th row, starting with the first one.
+    """
+    def __init__(self, k: int):
+        self.k = k
+        self.count = 0
+        self.held = None  # last row, if it hasn't been kept
+
+    def select(self, rows: np.ndarray, pinned: np.ndarray) -> np.ndarray:
+        kept = (np.arange(self.count, self.count + len(rows)) % self.k == 0) | pinned
+        self.count += len(rows)
+        self.held = rows[-1:].copy() if len(rows) and not kept[-1] else None
+        return rows[kept]
+
+    def finish(self) -> np.ndarray:
+        return self.held
+
+
+class TimeInterval(DecimationPolicy):
+    """
+    Resamples rows to the given interval: keeps the first row at or after each multiple of the interval, counting from
+    the time of the first row. Works on the whole time column of a chunk at once.
+    """
+    def __init__(self, interval: float):
+        """
+        :param interval: time between two rows which are kept (s)
+        """
+        self.interval = interval
+        self.first_time = None
+        self.last_slot = None  # multiple of the interval just before the last row
+        self.held = None
+
+    def select(self, rows: np.ndarray, pinned: np.ndarray) -> np.ndarray:
+        if len(rows) == 0:
+            return rows
+        times = rows[:, TIME]
+        if self.first_time is None:
+            self.first_time = times[0]
+            self.last_slot = -1.0
+        slots = np.floor((times - self.first_time) / self.interval + 1e-9)
+        kept = (slots != np.concatenate([[self.last_slot], slots[:-1]])) | pinned
+        self.last_slot = slots[-1]
+        self.held = rows[-1:].copy() if not kept[-1] else None
+        return rows[kept]
+
+    def finish(self) -> np.ndarray:
+        return self.held
+
+
+class ErrorBounded(DecimationPolicy):
+    """
+    Drops rows which linear interpolation (in time) between the kept rows around them reproduces to within the
+    tolerance, in every column which has one. Each row which is kept is as far from the previous one as possible: a
+    candidate row is kept only once the next row can't be reached by a line which passes within tolerance of all rows
+    in between. Those lines are tracked as a cone of slopes from the last kept row, so each row is looked at only once.
+    Columns without a tolerance aren't bounded.
+    """
+    def __init__(self, tolerances: Dict[str, float] = None):
+        """
+        :param tolerances: largest allowed interpolation error of each column, by name; by default 1e-7 rad (~0.6m) in
+        latitude and longitude and 0.5m in altitude
+        """
+        if tolerances is None:
+            tolerances = {"latitude": 1e-7, "longitude": 1e-7, "altitude": 0.5}
+        self.tolerances = tolerances
+        self.indices = []
+        self.anchor = None  # last row which was kept
+        self.candidate = None  # last row, if it can still be the end of the line from the anchor
+        self.low = []  # slopes of lines from the anchor which pass within tolerance of all rows since it
+        self.high = []
+
+    def start(self, columns: List[str]) -> None:
+        self.indices = [columns.index(name) for name in self.tolerances]
+
+    def select(self, rows: np.ndarray, pinned: np.ndarray) -> np.ndarray:
+        kept = []
+        for row, pin in zip(rows.tolist(), pinned.tolist()):
+            kept += self.add(row, pin)
+        return np.array(kept).reshape(-1, rows.shape[1])
+
+    def add(self, row: list, pinned: bool) -> list:
+        """Take the next row; returns rows which are kept because of it."""
+        if self.anchor is None:
+            self.restart(row)
+            return [row]
+        kept = []
+        if not self.fits(row):
+            if self.candidate is not None:
+                kept.append(self.candidate)
+                self.restart(self.candidate)
+            if not self.fits(row):  # same time as the anchor
+                pinned = True
+        if pinned:
+            self.restart(row)
+            return kept + [row]
+        dt = row[TIME] - self.anchor[TIME]
+        for k, (i, tolerance) in enumerate(zip(self.indices, self.tolerances.values())):
+            self.low[k] = max(self.low[k], (row[i] - tolerance - self.anchor[i]) / dt)
+            self.high[k] = min(self.high[k], (row[i] + tolerance - self.anchor[i]) / dt)
+        self.candidate = row
+        return kept
+
+    def fits(self, row: list) -> bool:
+        """Whether the line from the anchor to the row passes within tolerance of all rows in between."""
+        dt = row[TIME] - self.anchor[TIME]
+        if dt <= 0:
+            return False
+        for k, i in enumerate(self.indices):
+            if not self.low[k] <= (row[i] - self.anchor[i]) / dt <= self.high[k]:
+                return False
+        return True
+
+    def restart(self, anchor: list) -> None:
+        self.anchor = anchor
+        self.candidate = None
+        self.low = [float("-inf")] * len(self.indices)
+        self.high = [float("inf")] * len(self.indices)
+
+    def finish(self) -> np.ndarray:
+        return None if self.candidate is None else np.array([self.candidate])
+
+
+class Decimator:
+    """
+    Passes on only some of the rows, as chosen by its policy.
+    """
+    def __init__(self, sink, policy: DecimationPolicy, columns: List[str] = PROJECTILE_COLUMNS, pinned: Set = None):
+        """
+        :param sink: sink which gets the rows which are kept
+        :param policy: which rows are kept
+        :param columns: names of the columns of the rows
+        :param pinned: times of rows which have to be kept; may be added to while the rows are coming
+        """
+        self.sink = sink
+        self.policy = policy
+        self.pinned = pinned
+        policy.start(list(columns))
+
+    def write_header(self):
+        self.sink.write_header()
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        if self.pinned:
+            pinned = np.isin(rows[:, TIME], list(self.pinned))
+        else:
+            pinned = np.zeros(len(rows), bool)
+        kept = self.policy.select(rows, pinned)
+        if len(kept):
+            self.sink.write_rows(kept)
+
+    def close(self):
+        rest = self.policy.finish()
+        if rest is not None:
+            self.sink.write_rows(rest)
+        self.sink.close()
+
+
+class SummarySink:
+    """
+    Keeps statistics of the rows which pass through it, without keeping the rows: number of records, the last record
+    and the highest altitude, speed and distance.
+    """
+    def __init__(self):
+        self.rows = 0
+        self.last = None
+        self.max_altitude = float("-inf")
+        self.max_speed = 0.0
+        self.max_distance = 0.0
+
+    def write_header(self):
+        pass
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+        self.last = rows[-1].tolist()
+        self.rows += len(rows)
+        column = PROJECTILE_COLUMNS.index
+        self.max_altitude = max(self.max_altitude, float(rows[:, column("altitude")].max()))
+        self.max_distance = max(self.max_distance, float(rows[:, column("distance")].max()))
+        speeds = (rows[:, column("Vx"):column("Vz") + 1] ** 2).sum(axis=1)
+        self.max_speed = max(self.max_speed, sqrt(float(speeds.max())))
+
+    def summary(self) -> dict:
+        last = dict(zip(PROJECTILE_COLUMNS, self.last)) if self.last is not None else {}
+        return {"records": self.rows, "flight_time": last.get("time"), "range": last.get("distance"),
+                "max_altitude": self.max_altitude, "max_speed": self.max_speed, "max_distance": self.max_distance}
+
+    def close(self):
+        pass
+
+
+class BackgroundSink:
+    """
+    Passes rows to its sink on a thread of its own, so that formatting, compressing and writing them overlaps with the
+    flight (compressors and file writes release the GIL). Rows wait in a bounded queue: once the thread is queue_size
+    chunks behind, write_rows waits for it. An error raised by the sink stops the writing; it's raised again by the
+    next write_rows or by close.
+    """
+    def __init__(self, sink, queue_size=8):
+        """
+        :param sink: sink which gets the rows, on the thread
+        :param queue_size: number of chunks which may wait for the thread
+        """
+        self.sink = sink
+        self.queue = queue.Queue(queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            method, rows = self.queue.get()
+            try:
+                if self.error is None:
+                    method(*rows)
+                elif method == self.sink.close:  # close files even after an error
+                    method()
+            except BaseException as error:
+                if self.error is None:
+                    self.error = error
+            if method == self.sink.close:
+                return
+
+    def write_header(self):
+        self.queue.put((self.sink.write_header, ()))
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        if self.error is not None:
+            raise self.error
+        self.queue.put((self.sink.write_rows, (rows.copy(),)))  # rows are usually a view of a buffer which is reused
+
+    def stop(self):
+        """Write the rows which are still queued, close the sink and wait for the thread, without raising errors."""
+        if self.thread.is_alive():
+            self.queue.put((self.sink.close, ()))
+            self.thread.join()
+
+    def close(self):
+        self.stop()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,102 @@
+from typing import List
+
+import numpy as np
+
+from projectile.data.DataPoints import ProjectileDataPoint, PROJECTILE_COLUMNS, forces_columns
+
+
+class TrajectoryBuffer:
+    """
+    Records of a flight in a growable numpy array, one row per record, with the columns of the projectile CSV. Rows are
+    written in place (the array doubles its capacity when it fills up, so appending is amortized O(1)), and whole-flight
+    columns are views of the array, not copies.
+    Rows can be passed on to a writer in chunks as the flight goes (see write_new).
+    """
+    def __init__(self, capacity=1024, columns: List[str] = PROJECTILE_COLUMNS):
+        """
+        :param capacity: number of rows allocated up front
+        :param columns: names of the columns
+        """
+        self.columns = list(columns)
+        self.data = np.empty([capacity, len(columns)])
+        self.size = 0
+        self.written = 0  # rows passed to a writer by write_new
+
+    def __len__(self) -> int:
+        return self.size
+
+    def grow(self) -> None:
+        data = np.empty([2 * len(self.data), len(self.columns)])
+        data[:self.size] = self.data[:self.size]
+        self.data = data
+
+    def append(self, row) -> None:
+        """Add a row (any sequence of values, in the order of the columns)."""
+        if self.size == len(self.data):
+            self.grow()
+        self.data[self.size] = row
+        self.size += 1
+
+    def append_point(self, data: ProjectileDataPoint) -> None:
+        self.append(data.values())
+
+    def point(self, index: int) -> ProjectileDataPoint:
+        """Row as a data point; negative indices count from the end."""
+        return ProjectileDataPoint(*self.array()[index].tolist())
+
+    def array(self) -> np.ndarray:
+        """All rows, as a view which doesn't see rows appended later."""
+        return self.data[:self.size]
+
+    def column(self, name: str) -> np.ndarray:
+        """Column of all rows, as a view which doesn't see rows appended later."""
+        return self.data[:self.size, self.columns.index(name)]
+
+    def write_new(self, writer, min_rows=1, keep=True) -> None:
+        """
+        Pass rows which haven't been written yet to the writer, if there are at least min_rows of them.
+        :param writer: writer with a write_rows method
+        :param min_rows: smallest number of rows worth a write
+        :param keep: keep written rows; otherwise they're dropped and the buffer only holds rows not yet written
+        """
+        if self.size - self.written >= min_rows:
+            writer.write_rows(self.data[self.written:self.size])
+            self.written = self.size
+            if not keep:
+                self.size = self.written = 0
+
+
+class ForcesBuffer(TrajectoryBuffer):
+    """
+    Intensities of forces at each evaluation, one row per evaluation with the columns of forces binary files (see
+    BinaryIO). Projectile writes to it as it does to forces writers.
+    """
+    def __init__(self, force_names: List[str], capacity=1024):
+        """
+        :param force_names: names of the forces, in the order in which they're in the intensity matrix
+        :param capacity: number of rows allocated up front
+        """
+        super().__init__(capacity, forces_columns(len(force_names)))
+        self.force_names = list(force_names)
+        self.flags = 2 + 3 * len(force_names)  # first reused column
+
+    def write_values(self, time: float, mass: float, forces: np.ndarray, reused: List[int] = ()):
+        if self.size == len(self.data):
+            self.grow()
+        row = self.data[self.size]
+        row[0] = time
+        row[1] = mass
+        row[2:self.flags] = forces.ravel()
+        row[self.flags:] = 0
+        for i in reused:
+            row[self.flags + i] = 1
+        self.size += 1
+
+    def intensities(self) -> np.ndarray:
+        """Intensities of all forces at every evaluation, as a view of shape rows x forces x 3."""
+        return self.data[:self.size, 2:self.flags].reshape(self.size, -1, 3)
+
+    def reused(self) -> np.ndarray:
+        """Whether the intensity was extrapolated, for all forces at every evaluation (rows x forces)."""
+        return self.data[:self.size, self.flags:] != 0
+
@@ -1,6 +1,59 @@
-from zipfile import ZipFile, ZIP_BZIP2
+from zipfile import ZipFile, ZIP_BZIP2, is_zipfile
+import bz2
+import gzip
+import io
+import lzma
 import os
 
+# compressors by file extension, at their fastest levels: flight data compresses well even so (gzip 1 writes a flight
+# CSV 4x faster than 6 for 8% more bytes, bzip2 1 is ~25% faster than 9 and xz 1 is 10x faster than 6)
+COMPRESSORS = {".gz": (gzip.open, {"compresslevel": 1}), ".bz2": (bz2.open, {"compresslevel": 1}),
+               ".xz": (lzma.open, {"preset": 1})}
+
+
+def is_compressed(filename: str) -> bool:
+    """Whether open_file (de)compresses the file."""
+    return filename.endswith(tuple(COMPRESSORS)) or zip_member(filename) is not None
+
+
+def zip_member(filename: str) -> (str, str):
+    """
+    Zip archive and name of the file inside it, if the path goes into an archive (e.g. sweep.zip/csv/15.csv) or is an
+    archive itself (as created by compress), None otherwise. Name is None for an archive itself.
+    """
+    archive = filename
+    while archive and not os.path.exists(archive):
+        archive = os.path.dirname(archive)
+    if not archive or not os.path.isfile(archive) or not is_zipfile(archive):
+        return None
+    if archive == filename:
+        return archive, None
+    return archive, os.path.relpath(filename, archive).replace(os.sep, "/")
+
+
+def open_file(filename: str, mode="r"):
+    """
+    Open a data file like open(), compressing it as it's written (or decompressing it as it's read) if its name ends
+    with .gz, .bz2 or .xz. Files inside zip archives can be read as well: the archive itself if it holds a single file
+    (as created by compress), or a path into it (e.g. sweep.zip/csv/15.csv). There's never an uncompressed copy of the
+    file on the disk, it's decompressed a chunk at a time as it's read.
+    :param filename: file to be opened
+    :param mode: "r", "w", "rb" or "wb"
+    :return: file object
+    """
+    member = zip_member(filename) if "r" in mode else None
+    if member is not None:
+        archive, name = member
+        with ZipFile(archive) as zip_file:  # member stays open after the archive is closed
+            if name is None:
+                name = next(info.filename for info in zip_file.infolist() if not info.is_dir())
+            file = zip_file.open(name)
+        return file if "b" in mode else io.TextIOWrapper(file)
+    for extension, (opener, settings) in COMPRESSORS.items():
+        if filename.endswith(extension):
+            return opener(filename, mode if "b" in mode else mode + "t", **(settings if "w" in mode else {}))
+    return open(filename, mode)
+
 
 def compress(filename: str, output: str, method=ZIP_BZIP2, name_inside_zip=None, keep_original=True):
     """
@@ -2,8 +2,12 @@ from __future__ import annotations
 
 from math import cos, sin
 
+import numpy as np
+
+from projectile.core.Constants import Y_INDEX, Z_INDEX
 from projectile.core.Projectile import Projectile
 from projectile.forces.Force import Force
+from projectile.forces.ForceContext import ForceContext
 
 
 # noinspection PyUnresolvedReferences
@@ -16,7 +20,21 @@ class CentrifugalForce(Force):
     """
     Centrifugal force acts towards the equator and upwards.
     """
-    def __init__(self):
+    def __init__(self, update_interval=0.0):
+        self.update_interval = update_interval
         super().__init__(lambda pr, env: 0,
                          lambda pr, env: intensity(pr, env) * (-sin(pr.position.lat)),
                          lambda pr, env: intensity(pr, env) * cos(pr.position.lat))
+
+    def evaluate(self, ctx: ForceContext) -> np.ndarray:
+        total = ctx.mass * ctx.env.earth_angular_velocity ** 2 * ctx.env.earth_radius * ctx.cos_lat
+        return np.array([0, total * -ctx.sin_lat, total * ctx.cos_lat])
+
+    # noinspection PyUnresolvedReferences
+    def get_batch(self, batch: BatchProjectile, env: Environment) -> np.ndarray:
+        cos_lat = np.cos(batch.position.lat)
+        total = batch.mass() * env.earth_angular_velocity ** 2 * env.earth_radius * cos_lat
+        intensities = np.zeros([batch.size, 3])
+        intensities[:, Y_INDEX] = total * -np.sin(batch.position.lat)
+        intensities[:, Z_INDEX] = total * cos_lat
+        return intensities
@@ -1,7 +1,12 @@
+from __future__ import annotations
+
 from math import sin, cos
 
+import numpy as np
+
 from projectile.core.Constants import Y_INDEX, X_INDEX, Z_INDEX
 from projectile.forces.Force import Force
+from projectile.forces.ForceContext import ForceContext
 
 
 class CoriolisForce(Force):
@@ -11,7 +16,8 @@ class CoriolisForce(Force):
     Source: https://en.wikipedia.org/wiki/Coriolis_force#Rotating_sphere
     See: https://en.wikipedia.org/wiki/Coriolis_force#/media/File:Earth_coordinates.svg
     """
-    def __init__(self):
+    def __init__(self, update_interval=0.0):
+        self.update_interval = update_interval
         super().__init__(lambda pr, env: 2 * env.earth_angular_velocity * pr.mass()
                                            * (pr.velocities[Y_INDEX] * sin(pr.position.lat) -
                                               pr.velocities[Z_INDEX] * cos(pr.position.lat)),
@@ -19,3 +25,22 @@ class CoriolisForce(Force):
                                            * (-pr.velocities[X_INDEX] * sin(pr.position.lat)),
                          lambda pr, env: 2 * env.earth_angular_velocity * pr.mass()
                                            * (pr.velocities[X_INDEX] * cos(pr.position.lat)))
+
+    def evaluate(self, ctx: ForceContext) -> np.ndarray:
+        factor = 2 * ctx.env.earth_angular_velocity * ctx.mass
+        vx, vy, vz = ctx.velocities
+        return np.array([factor * (vy * ctx.sin_lat - vz * ctx.cos_lat),
+                         factor * (-vx * ctx.sin_lat),
+                         factor * (vx * ctx.cos_lat)])
+
+    # noinspection PyUnresolvedReferences
+    def get_batch(self, batch: BatchProjectile, env: Environment) -> np.ndarray:
+        factor = 2 * env.earth_angular_velocity * batch.mass()
+        sin_lat = np.sin(batch.position.lat)
+        cos_lat = np.cos(batch.position.lat)
+        intensities = np.zeros([batch.size, 3])
+        intensities[:, X_INDEX] = factor * (batch.velocities[:, Y_INDEX] * sin_lat -
+                                            batch.velocities[:, Z_INDEX] * cos_lat)
+        intensities[:, Y_INDEX] = factor * (-batch.velocities[:, X_INDEX] * sin_lat)
+        intensities[:, Z_INDEX] = factor * (batch.velocities[:, X_INDEX] * cos_lat)
+        return intensities
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import numpy as np
+
 from projectile.core.Constants import X_INDEX, Y_INDEX, Z_INDEX
 from projectile.core.Projectile import Projectile
 from projectile.forces.Force import Force
+from projectile.forces.ForceContext import ForceContext
 
 
 # noinspection PyUnresolvedReferences
@@ -20,3 +23,25 @@ class DragForce(Force):
         super().__init__(lambda p, env: -p.directions[0] * intensity(p, env, p.velocities[X_INDEX], X_INDEX),
                          lambda p, env: -p.directions[1] * intensity(p, env, p.velocities[Y_INDEX], Y_INDEX),
                          lambda p, env: -p.directions[2] * intensity(p, env, p.velocities[Z_INDEX], Z_INDEX))
+
+    def evaluate(self, ctx: ForceContext) -> np.ndarray:
+        density = ctx.density
+        if density == 0:
+            return np.zeros(3)
+        p = ctx.projectile
+        return np.array([-p.directions[axis] * 0.5 * density * p.velocities[axis] ** 2 *
+                         p.cross_section(axis, p.pitch, p.yaw) * p.drag_coef(axis, p.pitch, p.yaw)
+                         for axis in (X_INDEX, Y_INDEX, Z_INDEX)])
+
+    # noinspection PyUnresolvedReferences
+    def get_batch(self, batch: BatchProjectile, env: Environment) -> np.ndarray:
+        """
+        Cross section and drag coefficient lambdas are called with pitch and yaw arrays, so they must be numpy-safe.
+        """
+        density = env.densities(batch.position.alt)
+        intensities = np.zeros([batch.size, 3])
+        for axis in (X_INDEX, Y_INDEX, Z_INDEX):
+            intensities[:, axis] = -batch.directions[:, axis] * 0.5 * density * batch.velocities[:, axis] ** 2 * \
+                                   batch.cross_section(axis, batch.pitch, batch.yaw) * \
+                                   batch.drag_coef(axis, batch.pitch, batch.yaw)
+        return intensities
@@ -2,8 +2,11 @@ from __future__ import annotations
 
 from typing import Callable
 
+import numpy as np
+
 from projectile.core.Constants import X_INDEX, Y_INDEX, Z_INDEX
 from projectile.core.Projectile import Projectile
+from projectile.forces.ForceContext import ForceContext
 
 
 # noinspection PyUnresolvedReferences
@@ -12,7 +15,12 @@ class Force:
     Base class for all forces. Subclass this to introduce new forces. Three lambdas need to be provided for this to
     work: first one will calculate intensity in x direction (eastward), second one in y direction (northward) and the
     last one in z direction (upward).
+    Environment asks for all three at once through evaluate(); forces which share terms between axes or can use ones
+    precomputed in the ForceContext (density, sine of latitude...) should override it.
+    Forces which change slowly (gravity, inertial forces) can set update_interval: Environment then evaluates them only
+    once per that many seconds and extrapolates their intensity in between (see Environment.get_forces_intensities).
     """
+    update_interval = 0.0  # seconds for which the intensity may be extrapolated; 0 evaluates the force every time
 
     def __init__(self, x: Callable[[Projectile, Environment], float],
                  y: Callable[[Projectile, Environment], float],
@@ -33,3 +41,25 @@ class Force:
 
     def get(self, axis) -> Callable[[Projectile, Environment], float]:
         return self.intensity[axis]
+
+    def evaluate(self, ctx: ForceContext) -> np.ndarray:
+        """
+        Intensity of the force in each direction. This default calls the three lambdas.
+        :param ctx: state of the projectile, shared by all forces
+        :return: array of 3 intensities
+        """
+        return np.array([self.get_x(ctx.projectile, ctx.env), self.get_y(ctx.projectile, ctx.env),
+                         self.get_z(ctx.projectile, ctx.env)])
+
+    def get_batch(self, batch: BatchProjectile, env: Environment) -> np.ndarray:
+        """
+        Intensities for every projectile in the batch, as a matrix of shape n x 3. This default calls evaluate() one
+        projectile at a time; forces which can be expressed with numpy operations should override it.
+        :param batch: projectiles on which the force acts
+        :param env: environment
+        :return: intensity matrix
+        """
+        intensities = np.zeros([batch.size, 3])
+        for i in range(batch.size):
+            intensities[i] = self.evaluate(ForceContext(batch.row(i), env))
+        return intensities
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from math import sin, cos, sqrt
+
+from projectile.core.Constants import X_INDEX, Y_INDEX, Z_INDEX
+
+
+# noinspection PyUnresolvedReferences
+class ForceContext:
+    """
+    State of the projectile as forces see it during one evaluation, created by Environment.get_forces_intensities and
+    passed to Force.evaluate of every force. Terms which several forces need are computed only once: mass, sine and
+    cosine of the latitude and speed up front, atmosphere density and pressure when a force first asks for them.
+    Mass is taken before thrusts burn fuel in this evaluation.
+    """
+    def __init__(self, projectile: Projectile, env: Environment):
+        self.projectile = projectile
+        self.env = env
+        self.mass = projectile.mass()
+        self.alt = projectile.position.alt
+        self.sin_lat = sin(projectile.position.lat)
+        self.cos_lat = cos(projectile.position.lat)
+        self.velocities = projectile.velocities
+        self.speed = sqrt(self.velocities[X_INDEX] ** 2 + self.velocities[Y_INDEX] ** 2 +
+                          self.velocities[Z_INDEX] ** 2)
+        self._density = None
+        self._pressure = None
+
+    @property
+    def density(self) -> float:
+        """Atmosphere density at the projectile's altitude."""
+        if self._density is None:
+            self._density = self.env.density(self.alt)
+        return self._density
+
+    @property
+    def pressure(self) -> float:
+        """Atmosphere pressure at the projectile's altitude."""
+        if self._pressure is None:
+            self._pressure = self.env.pressure(self.alt, self.density)
+        return self._pressure
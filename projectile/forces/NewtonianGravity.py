@@ -1,11 +1,29 @@
-from projectile.core.Constants import G
+from __future__ import annotations
+
+import numpy as np
+
+from projectile.core.Constants import G, Z_INDEX
 from projectile.forces.Force import Force
+from projectile.forces.ForceContext import ForceContext
 
 
 class NewtonianGravity(Force):
     """
     Defines gravity as Newton did back in the day. Acts downwards.
     """
-    def __init__(self, distance_to_earths_center=6378137, earth_mass=5.97237e24):
+    def __init__(self, distance_to_earths_center=6378137, earth_mass=5.97237e24, update_interval=0.0):
+        self.update_interval = update_interval
+        self.distance_to_earths_center = distance_to_earths_center
+        self.earth_mass = earth_mass
         super().__init__(lambda p, env: 0, lambda p, env: 0,
                          lambda p, env: -G*earth_mass*p.mass()/(distance_to_earths_center+p.position.alt)**2)
+
+    def evaluate(self, ctx: ForceContext) -> np.ndarray:
+        return np.array([0, 0, -G * self.earth_mass * ctx.mass / (self.distance_to_earths_center + ctx.alt) ** 2])
+
+    # noinspection PyUnresolvedReferences
+    def get_batch(self, batch: BatchProjectile, env: Environment) -> np.ndarray:
+        intensities = np.zeros([batch.size, 3])
+        intensities[:, Z_INDEX] = -G * self.earth_mass * batch.mass() / \
+            (self.distance_to_earths_center + batch.position.alt) ** 2
+        return intensities
@@ -1,4 +1,10 @@
+from __future__ import annotations
+
+import numpy as np
+
+from projectile.core.Constants import Z_INDEX
 from projectile.forces.Force import Force
+from projectile.forces.ForceContext import ForceContext
 
 
 class SimpleGravity(Force):
@@ -8,3 +14,12 @@ class SimpleGravity(Force):
     """
     def __init__(self):
         super().__init__(lambda pr, env: 0, lambda pr, env: 0, lambda pr, env: -9.81*pr.mass())
+
+    def evaluate(self, ctx: ForceContext) -> np.ndarray:
+        return np.array([0, 0, -9.81 * ctx.mass])
+
+    # noinspection PyUnresolvedReferences
+    def get_batch(self, batch: BatchProjectile, env: Environment) -> np.ndarray:
+        intensities = np.zeros([batch.size, 3])
+        intensities[:, Z_INDEX] = -9.81 * batch.mass()
+        return intensities
@@ -2,8 +2,11 @@ from __future__ import annotations
 
 from typing import Callable
 
+import numpy as np
+
 from projectile.core.Constants import X_INDEX, Y_INDEX, Z_INDEX
 from projectile.forces.Force import Force
+from projectile.forces.ForceContext import ForceContext
 from projectile.util import spherical_to_planar_coord
 
 
@@ -15,7 +18,9 @@ class ThrustForce(Force):
     """
     Defines thurst which moves the rocket. Main source of power. Consumes fuel to move.
     """
-    def total_intensity(self, projectile: Projectile, env: Environment) -> float:
+    def total_intensity(self, projectile: Projectile, env: Environment, ctx: ForceContext = None) -> float:
+        if projectile.fuel_in_state:  # integrator takes care of burning fuel, we're only evaluating a stage
+            return self.intensity_at(self.flow_rate(projectile.time), projectile, env, ctx) if self.burning else 0
         if self.remaining_fuel <= 0:  # we don't have fuel, don't do anything
             return 0
         if self.last_time == projectile.time:  # if we've already calculated a value for this time point, return that
@@ -30,22 +35,47 @@ class ThrustForce(Force):
         self.remaining_fuel -= burned_fuel
         projectile.lost_mass += burned_fuel
 
+        self.last_result = self.intensity_at(flow_rate, projectile, env, ctx)
+        return self.last_result
+
+    def intensity_at(self, flow_rate: float, projectile: Projectile, env: Environment,
+                     ctx: ForceContext = None) -> float:
+        """Thrust intensity for the given fuel flow rate. Doesn't consume fuel."""
+        pressure = env.pressure(projectile.position.alt) if ctx is None else ctx.pressure
         # Source: https://www.grc.nasa.gov/WWW/K-12/rocket/rockth.html
         # thrust gained from exit velocity + thrust gained from pressure difference
-        self.last_result = self.ejection_speed * flow_rate + \
-                           (self.nozzle_pressure - env.pressure(projectile.position.alt)) * self.nozzle_exit_area
-        return self.last_result
+        return self.ejection_speed * flow_rate + (self.nozzle_pressure - pressure) * self.nozzle_exit_area
+
+    def evaluate(self, ctx: ForceContext) -> np.ndarray:
+        total = self.total_intensity(ctx.projectile, ctx.env, ctx)
+        return np.array([self.direction_intensity(axis, total, ctx.projectile) for axis in (X_INDEX, Y_INDEX, Z_INDEX)])
+
+    def refuel(self) -> None:
+        """Put the thrust back into its initial state (all fuel, not burning yet), so it can be used for another flight."""
+        self.remaining_fuel = self.total_fuel
+        self.burning = self.total_fuel > 0
+        self.last_time = -1
+        self.last_result = 0
+
+    def flow_rate(self, time: float) -> float:
+        """Fuel flow rate at the specified time, or 0 if the thrust is off. Doesn't consume fuel."""
+        if not self.burning:
+            return 0
+        return self.fuel_flow(time)
 
     def __init__(self, total_fuel: float, fuel_flow: Callable[[float], float], ejection_speed: float,
                  nozzle_pressure: float, nozzle_exit_area: float,
                  direction_intensity: Callable[[int, float, Projectile], float] = follow_path):
         self.direction_intensity = direction_intensity
+        self.total_fuel = total_fuel
         self.remaining_fuel = total_fuel
         self.fuel_flow = fuel_flow
         self.ejection_speed = ejection_speed
         self.nozzle_exit_area = nozzle_exit_area
         self.nozzle_pressure = nozzle_pressure
         self.last_time = -1
+        # integrators decide this at the start of each step, so thrust doesn't cut out in the middle of it
+        self.burning = total_fuel > 0
         self.last_result = 0
         super().__init__(lambda pr, env: self.direction_intensity(X_INDEX, self.total_intensity(pr, env), pr),
                          lambda pr, env: self.direction_intensity(Y_INDEX, self.total_intensity(pr, env), pr),
@@ -1,32 +1,86 @@
 from projectile.core.Environment import Environment
 from projectile.forces.ThrustForce import ThrustForce
-from projectile.scenarios import run
-from projectile.data.KmlWriter import convert_csv_to_kmz
+from projectile.scenarios import run, init_scenario
+from projectile.core.Sweep import Sweep, grid, parse_values, long_range_flight, LONG_RANGE, read_results
+from projectile.data.BinaryIO import convert_binary_to_csv, is_binary, ForcesBinaryReader
+from projectile.data.KmlWriter import convert_csv_to_kmz, convert_directory, merge_to_kmz, flight_name
+import os
+from projectile.data.Plotter import plot_forces
 import sys
 
 """
 This script only does cmd argument parsing. Valid arguments:
 run  - start a scenario (see scenarios.py)
 plot - create a plot of forces from a Forces CSV
-kmz  - convert Projectile CSV to KMZ format
+kmz  - convert Projectile CSV to KMZ format (named after it, in the current directory), optionally simplifying the
+       path to within the given distance (m), or with levels of detail (lod)
+kmzdir - convert all Projectile CSVs of a scenario's csv directory to KMZ in parallel, into its kml directory, or
+         merge them into one KMZ next to it (merge); tolerance or lod as for kmz
+sweep - fly a sweep of long range flights (see Sweep) into scenario_data/<name>: parameter=values for each swept
+        parameter (1,2,5 or start:stop:step), other parameters of LONG_RANGE as parameter=value, and jobs=<cores> and
+        chunk=<flights sent to a worker at once>; estimate=prerun or estimate=<results.csv of an earlier sweep> sends
+        the longest flights first
+csv  - convert binary projectile or forces file to CSV (next to it, named after the flight, or to the given file)
+Files of plot and kmz may be compressed (.gz, .bz2, .xz) or inside a zip archive (e.g. sweep.zip/csv/15.csv).
 """
 
 if __name__ == '__main__':
     if len(sys.argv) < 3:
         print("USAGE: <command> <argument> [...]")
-        print("<command> is 'run', 'plot' or 'kmz'")
+        print("<command> is 'run', 'plot', 'kmz', 'kmzdir', 'sweep' or 'csv'")
         exit(1)
 
     if sys.argv[1] == "run":
         run(sys.argv[2], sys.argv[3:])
         print("Done!")
     elif sys.argv[1] == "plot":
-        env = Environment()
-        if not (len(sys.argv) > 3 and sys.argv[3] == "nothrust"):
-            env.add_force(ThrustForce(1, lambda x: 0, 0, 0, 0))
-        env.plot_all_forces(sys.argv[2])
+        if is_binary(sys.argv[2]):  # binary files name their forces
+            reader = ForcesBinaryReader(sys.argv[2])
+            plot_forces(reader, reader.forces)
+        else:
+            env = Environment()
+            if not (len(sys.argv) > 3 and sys.argv[3] == "nothrust"):
+                env.add_force(ThrustForce(1, lambda x: 0, 0, 0, 0))
+            env.plot_all_forces(sys.argv[2])
     elif sys.argv[1] == "kmz":
-        convert_csv_to_kmz(sys.argv[2], sys.argv[2].rsplit(".", 2)[1])
+        lod = len(sys.argv) > 3 and sys.argv[3] == "lod"
+        tolerance = float(sys.argv[3]) if len(sys.argv) > 3 and not lod else None
+        convert_csv_to_kmz(sys.argv[2], flight_name(sys.argv[2]), tolerance, lod)
+    elif sys.argv[1] == "kmzdir":
+        options = sys.argv[3:]
+        numbers = [float(option) for option in options if option not in ("merge", "lod")]
+        tolerance = numbers[0] if numbers else None
+        if "merge" in options:
+            scenario_dir = os.path.dirname(os.path.normpath(sys.argv[2]))
+            merge_to_kmz(sys.argv[2], os.path.join(scenario_dir, os.path.basename(scenario_dir)), tolerance)
+        else:
+            convert_directory(sys.argv[2], tolerance=tolerance, lod="lod" in options)
+    elif sys.argv[1] == "sweep":
+        settings = dict(argument.split("=", 1) for argument in sys.argv[3:])
+        jobs = int(settings.pop("jobs", -1))
+        chunk = int(settings.pop("chunk")) if "chunk" in settings else None
+        estimate = settings.pop("estimate", None)
+        values = {name: parse_values(text) for name, text in settings.items()}
+        swept = {name: value for name, value in values.items() if len(value) > 1}
+        base = {**LONG_RANGE, "directory": f"scenario_data/{sys.argv[2]}/",
+                **{name: value[0] for name, value in values.items() if len(value) == 1}}
+        init_scenario(sys.argv[2])
+        sweep = Sweep(long_range_flight, base, grid(**swept))
+        costs = None
+        if estimate == "prerun":
+            costs = sweep.prerun_costs(n_jobs=jobs)
+        elif estimate is not None:
+            costs = sweep.history_costs(read_results(estimate))
+        sweep.run(jobs, chunk, costs)
+        sweep.write_results(f"scenario_data/{sys.argv[2]}/results.csv")
+        print(sweep.report())
+    elif sys.argv[1] == "csv":
+        output = sys.argv[3] if len(sys.argv) > 3 else \
+            os.path.join(os.path.dirname(sys.argv[2]), flight_name(sys.argv[2]) + ".csv")
+        if os.path.abspath(output) == os.path.abspath(sys.argv[2]):
+            print(f"{sys.argv[2]} would be overwritten by its CSV, give another name for it")
+            exit(1)
+        convert_binary_to_csv(sys.argv[2], output)
     else:
         print(f"Invalid command {sys.argv[1]}")
         exit(1)
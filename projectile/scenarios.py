@@ -1,17 +1,23 @@
 import math
 import os
 import shutil
+from typing import List
 
-from joblib import Parallel, delayed
+import numpy as np
 
+from projectile.core.BatchLauncher import BatchLauncher
 from projectile.core.Constants import Z_INDEX
 from projectile.core.Environment import Environment
 from projectile.core.Launcher import Launcher
 from projectile.core.Position import Position
 from projectile.core.Projectile import Projectile
+from projectile.core.Sweep import Sweep, grid, long_range_flight, long_range_environment, long_range_thrust, \
+    LONG_RANGE
+from projectile.data.CsvReaders import ProjectileCsvReader
+from projectile.data.Sinks import EveryKth, TimeInterval, ErrorBounded
 from projectile.forces.CoriolisForce import CoriolisForce
 from projectile.forces.ThrustForce import follow_path, ThrustForce
-from projectile.util import spherical_to_planar_coord, Stopwatch
+from projectile.util import spherical_to_planar_coord, Stopwatch, haversine
 
 
 if not os.path.exists("scenario_data"):
@@ -38,89 +44,62 @@ def run(scenario: str, args=None) -> None:
     :return: nothing; scenario is run and its output is probably in a file
     """
 
-    def vary_latitude() -> None:
+    def long_range_sweep(name: str, overrides: List[dict], **base) -> None:
         """
-        Launch long-distance flights to the east, varying the latitude, across the same meridian. Total 170 flights.
-        :return: nothing
+        Fly long range flights (see Sweep) with the given overrides into the scenario's directories, longest first as
+        estimated by a coarse pre-run. First argument of the scenario is the number of cores.
         """
-        print(f"Running {scenario}")
-
-        def fuel_flow(t: float):  # this is not very realistic-see long_distance scenario for a better multi-engine sim
-            if t < 1:
-                return 1000
-            if t < 3:
-                return 500
-            return 100
-
-        def thrust_direction(axis: int, force: float, pr: Projectile):
-            if pr.time < 1.2:
-                return spherical_to_planar_coord(axis, force, math.pi / 4, 0)
-            if (pr.position.alt > 100000 or pr.velocities[Z_INDEX] > 4000) and pr.pitch > 0.2:
-                spherical_to_planar_coord(axis, force, pr.pitch - 0.15, pr.yaw)
-            if pr.pitch < 0.15:
-                spherical_to_planar_coord(axis, force, pr.pitch + 0.17, pr.yaw)
-            return follow_path(axis, force, pr)
-
-        csvdir, kmldir, frcdir, stopwatch = init_scenario("ld_eastward_latitude")
+        init_scenario(name)
+        stopwatch = Stopwatch()
         stopwatch.start()
-
-        def iteration(latitude: float):
-            env = Environment(surface_altitude=lambda p: 80)
-            thrust = ThrustForce(5000, fuel_flow, 150, 250000, 15, thrust_direction)
-            launcher = Launcher(math.pi / 4, 0, f"{csvdir}{latitude}.csv", f"{kmldir}{latitude}",
-                                f"{frcdir}{latitude}.csv", environment=env, thrust=thrust)
-            launcher.launch(10000, Position(math.radians(latitude), math.radians(45), 80))
-            stopwatch.lap()
-
         core_number = -1
         if args is not None and len(args) > 0:
             core_number = int(args[0])
-        Parallel(core_number)(delayed(iteration)(i) for i in range(-85, 85))
-
+        flights = Sweep(long_range_flight, {**LONG_RANGE, "directory": f"scenario_data/{name}/", **base}, overrides)
+        flights.run(core_number, costs=flights.prerun_costs(n_jobs=core_number))
+        flights.write_results(f"scenario_data/{name}/results.csv")
+        print(flights.report())
         stopwatch.stop()
 
-    def vary_yaw() -> None:
+    def vary_latitude() -> None:
         """
-        Launch long-distance flights with pi/4 pitch with varying yaws. Total 71 flights.
+        Launch long-distance flights to the east, varying the latitude, across the same meridian. Total 170 flights.
         :return: nothing
         """
         print(f"Running {scenario}")
+        long_range_sweep("ld_eastward_latitude", grid(latitude=range(-85, 85)), longitude=45)
 
-        def fuel_flow(t: float):  # this is not very realistic-see long_distance scenario for a better multi-engine sim
-            if t < 1:
-                return 1000
-            if t < 3:
-                return 500
-            return 100
+    def vary_yaw() -> None:
+        """
+        Launch long-distance flights with pi/4 pitch with varying yaws. Total 71 flights. Arguments: number of cores,
+        and gz, bz2 or xz to compress CSVs as they're written.
+        :return: nothing
+        """
+        print(f"Running {scenario}")
+        extension = ""  # CSVs are compressed as they're written with e.g. bz2 (see ZipIO.open_file)
+        if args is not None and len(args) > 1:
+            extension = "." + args[1]
+        long_range_sweep("ld_vary_yaw", grid(yaw=range(0, 359, 5)), extension=extension)
 
-        csvdir, kmldir, frcdir, stopwatch = init_scenario("ld_vary_yaw")
+    def vary_yaw_batch() -> None:
+        """
+        Same flights as vary_yaw, but flown in lockstep by a single BatchLauncher instead of one process per flight.
+        :return: nothing
+        """
+        print(f"Running {scenario}")
+        csvdir, kmldir, frcdir, stopwatch = init_scenario("ld_vary_yaw_batch")
         stopwatch.start()
 
-        def iteration(yaw: int):
-            def thrust_direction(axis: int, force: float, pr: Projectile):
-                if pr.time < 1.2:
-                    return spherical_to_planar_coord(axis, force, math.pi / 4, math.radians(yaw))
-                if (pr.position.alt > 100000 or pr.velocities[Z_INDEX] > 4000) and pr.pitch > 0.2:
-                    spherical_to_planar_coord(axis, force, pr.pitch - 0.15, pr.yaw)
-                if pr.pitch < 0.15:
-                    spherical_to_planar_coord(axis, force, pr.pitch + 0.17, pr.yaw)
-                return follow_path(axis, force, pr)
-
-            env = Environment(surface_altitude=lambda p: 80)
-            thrust = ThrustForce(5000, fuel_flow, 150, 250000, 15, thrust_direction)
-            launcher = Launcher(math.pi / 4, math.radians(yaw), f"{csvdir}{yaw}.csv", f"{kmldir}{yaw}",
-                                f"{frcdir}{yaw}.csv", environment=env, thrust=thrust)
-            launcher.launch(10000, Position(math.radians(0), math.radians(15), 80))
-            # compress("%s%d.csv" % (csvdir, yaw), "%s%d.bz2" % (csvdir, yaw), name_inside_zip="%d.csv" % yaw,
-            #         keep_original=False)
-            # compress("%s%d.csv" % (frcdir, yaw), "%s%d.bz2" % (frcdir, yaw), name_inside_zip="%d.csv" % yaw,
-            #         keep_original=False)
-            stopwatch.lap()
-
-        core_number = -1
-        if args is not None and len(args) > 0:
-            core_number = int(args[0])
-        Parallel(core_number)(delayed(iteration)(i) for i in range(0, 359, 5))
+        p = LONG_RANGE
+        yaws = range(0, 359, 5)
+        pitch = math.radians(p["pitch"])
+        thrusts = [long_range_thrust(pitch, math.radians(yaw)) for yaw in yaws]
+        launcher = BatchLauncher([pitch] * len(yaws), [math.radians(yaw) for yaw in yaws],
+                                 [f"{csvdir}{yaw}.csv" for yaw in yaws], [f"{kmldir}{yaw}" for yaw in yaws],
+                                 dt=p["dt"], environment=long_range_environment(), thrusts=thrusts)
+        launcher.launch(p["mass"], [Position(math.radians(p["latitude"]), math.radians(p["longitude"]), p["altitude"])
+                                    for _ in yaws])
+        stopwatch.stop()
 
     def vary_pitch() -> None:
         """
@@ -128,39 +107,7 @@ def run(scenario: str, args=None) -> None:
         :return: nothing
         """
         print(f"Running {scenario}")
-
-        def fuel_flow(t: float):  # this is not very realistic-see long_distance scenario for a better multi-engine sim
-            if t < 1:
-                return 1000
-            if t < 3:
-                return 500
-            return 100
-
-        csvdir, kmldir, frcdir, stopwatch = init_scenario("ld_vary_pitch")
-        stopwatch.start()
-
-        def iteration(pitch: float):
-            def thrust_direction(axis: int, force: float, pr: Projectile):
-                if pr.time < 1.2:
-                    return spherical_to_planar_coord(axis, force, math.radians(pitch), 0)
-                if (pr.position.alt > 100000 or pr.velocities[Z_INDEX] > 4000) and pr.pitch > 0.2:
-                    spherical_to_planar_coord(axis, force, pr.pitch - 0.15, pr.yaw)
-                if pr.pitch < 0.1:
-                    spherical_to_planar_coord(axis, force, pr.pitch + 0.12, pr.yaw)
-                return follow_path(axis, force, pr)
-
-            env = Environment(surface_altitude=lambda p: 80)
-            thrust = ThrustForce(5000, fuel_flow, 150, 250000, 15, thrust_direction)
-            launcher = Launcher(math.radians(pitch), 0, f"{csvdir}{pitch}.csv", f"{kmldir}{pitch}",
-                                f"{frcdir}{pitch}.csv", environment=env, thrust=thrust)
-            launcher.launch(10000, Position(math.radians(45), math.radians(45), 80))
-            stopwatch.lap()
-
-        core_number = -1
-        if args is not None and len(args) > 0:
-            core_number = int(args[0])
-        Parallel(core_number)(delayed(iteration)(i) for i in range(8, 82, 2))
-        stopwatch.stop()
+        long_range_sweep("ld_vary_pitch", grid(pitch=range(8, 82, 2)), latitude=45, longitude=45)
 
     def long_distance() -> None:
         print(f"Running {scenario}")
@@ -189,6 +136,49 @@ def run(scenario: str, args=None) -> None:
         stopwatch.stop()
         env.plot_all_forces(f"{frcdir}data.csv")
 
+    def long_distance_multirate() -> None:
+        """
+        Fly the long_distance flight with gravity, Coriolis and centrifugal force evaluated every step and with them
+        extrapolated between evaluations 0.1s and 1s apart. Prints how long each flight took and how far its impact
+        point is from the one evaluated every step. Interval(s) can be given as arguments.
+        :return: nothing; results are printed
+        """
+        print(f"Running {scenario}")
+
+        def thrust_direction(axis: int, force: float, pr: Projectile):
+            if pr.time < 1:
+                return spherical_to_planar_coord(axis, force, math.pi / 4, math.pi)
+            if (pr.position.alt > 100000 or pr.velocities[Z_INDEX] > 3500) and pr.pitch > 0.2:
+                spherical_to_planar_coord(axis, force, pr.pitch - 0.2, pr.yaw)
+            if pr.pitch < 0.15:
+                spherical_to_planar_coord(axis, force, pr.pitch + 0.1, pr.yaw)
+            return follow_path(axis, force, pr)
+        if os.path.exists("scenario_data/long_distance_multirate/"):
+            shutil.rmtree("scenario_data/long_distance_multirate/")
+        csvdir, kmldir, _, _ = init_scenario("long_distance_multirate")
+
+        intervals = [0.1, 1.0] if args is None or len(args) == 0 else [float(a) for a in args]
+        reference = None
+        for interval in [0.0] + intervals:
+            env = Environment(surface_altitude=lambda p: 80, slow_force_interval=interval)
+            thrust = [ThrustForce(4000, lambda t: 120, 150, 200000, 12, thrust_direction),
+                      ThrustForce(1800, lambda t: 150, 150, 200000, 13, thrust_direction),
+                      ThrustForce(1200, lambda t: 200, 200, 300000, 15, thrust_direction),
+                      ThrustForce(1200, lambda t: 200, 200, 300000, 15, thrust_direction)]
+            launcher = Launcher(math.pi/4, math.pi, f"{csvdir}{interval}.csv", f"{kmldir}{interval}",
+                                environment=env, thrust=thrust)
+            stopwatch = Stopwatch()
+            stopwatch.start()
+            impact = launcher.launch(10000, Position(math.radians(10), math.radians(-10), 80)).impact.data
+            stopwatch.stop()
+            if reference is None:
+                reference, reference_time = impact, stopwatch.total_time
+                continue
+            drift = haversine(Position(reference.latitude, reference.longitude, 0),
+                              Position(impact.latitude, impact.longitude, 0), env.earth_radius)
+            print(f"update interval {interval}s: {reference_time / stopwatch.total_time:.2f}x faster, impact point "
+                  f"moved by {drift:.1f}m and {impact.time - reference.time:.3f}s")
+
     def test() -> None:
         """
         Test scenario. Default for fiddling around.
@@ -221,7 +211,7 @@ def run(scenario: str, args=None) -> None:
         thrust = ThrustForce(3500, fuel_flow, 150, 200000, 12, thrust_direction)
         launcher = Launcher(0.9, 0, f"{csvdir}test.csv", f"{kmldir}test",
                             f"{frcdir}test.csv", environment=env, thrust=thrust)
-        launcher.launch(8000, Position(math.radians(60), math.radians(45), 80))
+        print(launcher.launch(8000, Position(math.radians(60), math.radians(45), 80)))
         stopwatch.stop()
         env.plot_all_forces(f"{frcdir}test.csv")
 
@@ -262,5 +252,197 @@ def run(scenario: str, args=None) -> None:
         stopwatch.stop()
         env.plot_all_forces(f"{frcdir}test.csv")
 
+    def pole_crossing_cartesian() -> None:
+        """
+        Same flight as pole_crossing, propagated in Earth-centred coordinates with adaptive steps. There's no pole
+        crossing to detect, so steps stay long when flying over the pole.
+        :return: nothing
+        """
+        print(f"Running {scenario}")
+
+        def fuel_flow(t: float):
+            if t < 1:
+                return 600
+            if t < 3:
+                return 400
+            return 100
+
+        def thrust_direction(axis: int, force: float, pr: Projectile):
+            if pr.time < 1.2:
+                return spherical_to_planar_coord(axis, force, math.pi/4, math.pi/2)
+            if (pr.position.alt > 100000 or pr.velocities[Z_INDEX] > 3500) and pr.pitch > 0.2:
+                spherical_to_planar_coord(axis, force, pr.pitch - 0.12, pr.yaw)
+            if pr.pitch < 0.15:
+                spherical_to_planar_coord(axis, force, pr.pitch + 0.17, pr.yaw)
+            return follow_path(axis, force, pr)
+
+        if os.path.exists("scenario_data/pole_crossing_cartesian/"):
+            shutil.rmtree("scenario_data/pole_crossing_cartesian/")
+        csvdir, kmldir, frcdir, stopwatch = init_scenario("pole_crossing_cartesian")
+        stopwatch.start()
+
+        env = Environment(surface_altitude=lambda p: 80)
+        env.remove_force(CoriolisForce())
+        thrust = ThrustForce(4000, fuel_flow, 150, 200000, 12, thrust_direction)
+        launcher = Launcher(math.pi/4, math.pi/2, f"{csvdir}test.csv", f"{kmldir}test",
+                            f"{frcdir}test.csv", environment=env, thrust=thrust, dt=0.1, integrator="dopri5",
+                            cartesian=True)
+        launcher.launch(8000, Position(math.radians(84), math.radians(-15), 80))
+        stopwatch.stop()
+
+    def kepler_coast() -> None:
+        """
+        Fly a sounding rocket to ~530km in Earth-centred coordinates, with each integrator stepping through the whole
+        flight and with the part above the atmosphere solved analytically (see KeplerCoast). Prints the time and number
+        of steps of each flight and how far its impact is from the stepped one.
+        :return: nothing; results are printed
+        """
+        print(f"Running {scenario}")
+        if os.path.exists("scenario_data/kepler_coast/"):
+            shutil.rmtree("scenario_data/kepler_coast/")
+        csvdir, kmldir, _, _ = init_scenario("kepler_coast")
+
+        for integrator, dt in [("dopri5", 0.05), ("rk4", 0.05)]:
+            impacts = {}
+            for coast in [False, True]:
+                name = f"{integrator}_{'coast' if coast else 'stepped'}"
+                launcher = Launcher(1.35, 0.3, f"{csvdir}{name}.csv", f"{kmldir}{name}", dt=dt,
+                                    thrust=ThrustForce(3000, lambda t: 60, 2500, 101325, 0.1), integrator=integrator,
+                                    cartesian=True, kepler_coast=coast)
+                stopwatch = Stopwatch()
+                stopwatch.start()
+                result = launcher.launch(1000, Position(math.radians(50), math.radians(15), 0), 100,
+                                         lambda axis, pitch, yaw: 0.5)
+                stopwatch.stop()
+                impacts[coast] = result.impact.data
+                print(f"{name}: {launcher.integrator.accepted_steps} steps, apogee {result.apogee.data.altitude:.0f}m")
+            stepped, coasted = impacts[False], impacts[True]
+            print(f"{integrator}: impact moved by {coasted.time - stepped.time:.4f}s, lat "
+                  f"{coasted.latitude - stepped.latitude:.2e} rad, lon {coasted.longitude - stepped.longitude:.2e} rad")
+
+    def decimation() -> None:
+        """
+        Fly the test flight writing all records and with each decimation policy (see Sinks). Prints the number of
+        records and the size of each CSV, the time of each flight and the largest error of latitude, longitude and
+        altitude interpolated from the CSV, against all records.
+        :return: nothing; results are printed
+        """
+        print(f"Running {scenario}")
+        if os.path.exists("scenario_data/decimation/"):
+            shutil.rmtree("scenario_data/decimation/")
+        csvdir, _, _, _ = init_scenario("decimation")
+
+        for name, policy in [("all", None), ("every_10th", EveryKth(10)), ("every_second", TimeInterval(1.0)),
+                             ("error_bounded", ErrorBounded())]:
+            launcher = Launcher(0.9, 0, f"{csvdir}{name}.csv", None, decimation=policy,
+                                thrust=ThrustForce(3500, lambda t: 600 if t < 1 else 300 if t < 3 else 100, 150,
+                                                   200000, 12), environment=Environment(surface_altitude=lambda p: 80))
+            stopwatch = Stopwatch()
+            stopwatch.start()
+            result = launcher.launch(8000, Position(math.radians(50), math.radians(45), 80))
+            stopwatch.stop()
+            reader = ProjectileCsvReader(f"{csvdir}{name}.csv")
+            written = reader.read_all()
+            reader.close()
+            records = result.trajectory
+            errors = [np.abs(np.interp(records.column("time"), written[:, 0], written[:, i]) - records.column(column))
+                      .max() for i, column in [(2, "latitude"), (3, "longitude"), (4, "altitude")]]
+            print(f"{name}: {len(written)} of {len(records)} records, {os.path.getsize(f'{csvdir}{name}.csv')} bytes, "
+                  f"{stopwatch.total_time:.2f}s; max error lat {errors[0]:.1e} rad, lon {errors[1]:.1e} rad, "
+                  f"alt {errors[2]:.2f}m")
+
+    def targeting() -> None:
+        """
+        Find the pitch at which the sounding rocket of kepler_coast lands at the given distance (800km by default) by
+        bisection, flying it in memory only (see Launcher). Prints each try and compares the time of a flight with and
+        without files.
+        :return: nothing; results are printed
+        """
+        print(f"Running {scenario}")
+        if os.path.exists("scenario_data/targeting/"):
+            shutil.rmtree("scenario_data/targeting/")
+        csvdir, kmldir, frcdir, _ = init_scenario("targeting")
+        target = float(args[0]) * 1000 if args else 800000
+        launcher = Launcher(1.35, 0.3, dt=0.05, thrust=ThrustForce(3000, lambda t: 60, 2500, 101325, 0.1),
+                            integrator="dopri5", verbose=False)
+
+        def fly(pitch: float) -> float:
+            launcher.pitch = pitch
+            return launcher.launch(1000, Position(math.radians(50), math.radians(15), 0), 100,
+                                   lambda axis, pitch, yaw: 0.5).impact.data.planar_distance
+
+        stopwatch = Stopwatch()
+        stopwatch.start()
+        low, high = 0.8, 1.5  # range shrinks as pitch grows
+        flights = 0
+        while high - low > 1e-6:
+            pitch = (low + high) / 2
+            distance = fly(pitch)
+            flights += 1
+            print(f"pitch {pitch:.6f}: {distance / 1000:.3f}km")
+            if distance > target:
+                low = pitch
+            else:
+                high = pitch
+        stopwatch.stop()
+        print(f"{flights} flights, {stopwatch.total_time / flights * 1000:.1f}ms each")
+        launcher.csv_filename, launcher.kmz_filename = f"{csvdir}target.csv", f"{kmldir}target"
+        launcher.forces_csv_filename = f"{frcdir}target.csv"
+        stopwatch = Stopwatch()
+        stopwatch.start()
+        fly((low + high) / 2)
+        stopwatch.stop()
+        print(f"Same flight with files: {stopwatch.total_time * 1000:.1f}ms")
+
+    def float_precision() -> None:
+        """
+        Fly the same projectile with float64 positions and with float128 positions (as they used to be), print the time
+        each flight took and how far float64 trajectories deviate from the float128 one. Also flies a float64
+        projectile which adds increments to its position without compensation, to show what Kahan summation buys.
+        :return: nothing; results are printed
+        """
+        print(f"Running {scenario}")
+
+        class UncompensatedPosition(Position):
+            def move(self, dlat, dlon, dalt) -> None:
+                self.lat += dlat
+                self.lon += dlon
+                self.alt += dalt
+
+        def fuel_flow(t: float):
+            if t < 1:
+                return 600
+            if t < 3:
+                return 300
+            return 100
+
+        def fly(position: Position) -> (list, float):
+            env = Environment(surface_altitude=lambda p: 80)
+            pr = env.create_projectile(8000, position, lambda axis, pitch, yaw: 20, lambda axis, pitch, yaw: 0.1)
+            pr.launch_at_angle(0.9, 0.3, 0)
+            pr.add_thrust(ThrustForce(3500, fuel_flow, 150, 200000, 12))
+            trajectory = []
+            stopwatch = Stopwatch()
+            stopwatch.start()
+            while True:
+                pr.advance(0.01)
+                trajectory.append((pr.position.lat, pr.position.lon, pr.position.alt))
+                if pr.has_hit_ground():
+                    break
+            stopwatch.stop()
+            return trajectory, stopwatch.total_time
+
+        lat, lon, alt = math.radians(50), math.radians(45), 80
+        reference, reference_time = fly(Position(lat, lon, alt, "float128"))
+        print(f"float128: {len(reference)} steps in {reference_time:.2f}s")
+        for name, position in [("float64", Position(lat, lon, alt)),
+                               ("float64 without compensation", UncompensatedPosition(lat, lon, alt))]:
+            trajectory, elapsed = fly(position)
+            steps = min(len(trajectory), len(reference))
+            deviations = [max(abs(float(a[i] - b[i])) for a, b in zip(trajectory[:steps], reference[:steps]))
+                          for i in range(3)]
+            print(f"{name}: {len(trajectory)} steps in {elapsed:.2f}s ({reference_time / elapsed:.1f}x faster); max "
+                  f"deviation lat {deviations[0]:.2e} rad, lon {deviations[1]:.2e} rad, alt {deviations[2]:.2e} m")
+
     #
     locals()[scenario]()  # call the appropriate method
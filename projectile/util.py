@@ -1,7 +1,9 @@
 import time
 
 from collections import deque
-from math import fabs, sqrt, sin, cos, asin
+from math import fabs, sqrt, sin, cos, asin, atan2
+
+import numpy as np
 
 from projectile.core.Constants import X_INDEX, Y_INDEX, Z_INDEX
 from projectile.core.Position import Position
@@ -49,6 +51,67 @@ def spherical_to_planar_coord(axis: int, intensity: float, pitch: float, yaw: fl
         return intensity * sin(pitch)
 
 
+def lla_to_ecef(lat: float, lon: float, alt: float, radius: float) -> np.ndarray:
+    """Latitude/longitude/altitude to Earth-centred, Earth-fixed Cartesian coordinates (spherical earth)."""
+    r = radius + alt
+    return np.array([r * cos(lat) * cos(lon), r * cos(lat) * sin(lon), r * sin(lat)])
+
+
+def ecef_to_lla(position: np.ndarray, radius: float) -> (float, float, float):
+    """Earth-centred, Earth-fixed Cartesian coordinates to latitude/longitude/altitude (spherical earth)."""
+    x, y, z = position
+    r = sqrt(x**2 + y**2 + z**2)
+    return asin(z / r), atan2(y, x), r - radius
+
+
+def enu_basis(lat: float, lon: float) -> np.ndarray:
+    """
+    Local tangent plane axes (x east, y north, z up) in Earth-centred coordinates, one per row. Multiply by this matrix
+    to convert an Earth-centred vector to the local tangent plane, and by its transpose to convert it back.
+    """
+    sin_lat, cos_lat, sin_lon, cos_lon = sin(lat), cos(lat), sin(lon), cos(lon)
+    return np.array([[-sin_lon, cos_lon, 0],
+                     [-sin_lat * cos_lon, -sin_lat * sin_lon, cos_lat],
+                     [cos_lat * cos_lon, cos_lat * sin_lon, sin_lat]])
+
+
+def horizontal_speed(position: np.ndarray, velocity: np.ndarray) -> float:
+    """Speed parallel to the earth surface, given Earth-centred position and velocity."""
+    vertical = velocity @ position / sqrt(position @ position)
+    return sqrt(max(velocity @ velocity - vertical ** 2, 0))
+
+
+def douglas_peucker(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Simplify a polyline (Douglas-Peucker): every point which is dropped is within tolerance of the segment between the
+    kept points around it. First and last point are always kept.
+    :param points: vertices of the polyline, one per row
+    :param tolerance: largest allowed distance of a dropped point from the simplified polyline
+    :return: indices of points which are kept, in order
+    """
+    keep = np.zeros(len(points), bool)
+    if len(points) == 0:
+        return np.flatnonzero(keep)
+    keep[[0, -1]] = True
+    segments = [(0, len(points) - 1)]
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+        start, direction = points[first], points[last] - points[first]
+        offsets = points[first + 1:last] - start
+        length = direction @ direction
+        if length > 0:
+            offsets -= np.outer(np.clip(offsets @ direction / length, 0, 1), direction)
+        distances = np.sqrt((offsets ** 2).sum(axis=1))
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            segments += [(first, split), (split, last)]
+    return np.flatnonzero(keep)
+
+
 class RollingStatistic:
     """Calculates rolling mean and standard deviation."""
     PRINT_WARNINGS = False
@@ -92,6 +155,59 @@ class RollingStatistic:
         return fabs(sample - self.mean) > self.stddev*stddev_threshold
 
 
+class BatchRollingStatistic:
+    """RollingStatistic for n independent series at once. Same formulas, applied to numpy arrays."""
+    def __init__(self, n, window_size, ready_threshold=5):
+        self.N = window_size
+        self.ready_threshold = ready_threshold
+        self.mean = np.zeros(n)
+        self.variance = np.zeros(n)
+        self.stddev = np.zeros(n)
+        self.elements = np.zeros([n, window_size])
+        self.count = np.zeros(n, "int64")  # total number of updates; ring buffer slot is count % N
+
+    def update(self, new: np.ndarray, mask: np.ndarray = None) -> None:
+        """
+        Add a new sample to each series.
+        :param new: array of n samples
+        :param mask: if given, only series for which mask is True are updated
+        """
+        rows = np.arange(len(self.mean)) if mask is None else np.flatnonzero(mask)
+        new = new[rows]
+        filled = np.minimum(self.count[rows], self.N)
+        slot = self.count[rows] % self.N
+        old = self.elements[rows, slot]
+        oldavg = self.mean[rows]
+        variance = self.variance[rows]
+        warming_up = filled < self.N
+
+        mean = np.where(warming_up, (oldavg * filled + new) / (filled + 1), oldavg + (new - old) / self.N)
+        warm_variance = np.where(filled >= 1,
+                                 (filled - 1) / np.maximum(filled, 1) * variance + (new - oldavg)**2 / (filled + 1),
+                                 variance)
+        full_variance = variance + (new - old) * (new - mean + old - oldavg) / (self.N - 1)
+        full_variance = np.where(full_variance > 0, full_variance, variance)
+
+        self.mean[rows] = mean
+        self.variance[rows] = np.where(warming_up, warm_variance, full_variance)
+        self.stddev[rows] = np.sqrt(self.variance[rows])
+        self.elements[rows, slot] = new
+        self.count[rows] += 1
+
+    def is_outlier(self, sample, index: int, stddev_threshold=2) -> bool:
+        if self.count[index] < self.ready_threshold:
+            return False
+        return fabs(sample - self.mean[index]) > self.stddev[index]*stddev_threshold
+
+    def compact(self, keep: np.ndarray) -> None:
+        """Drop series for which keep is False."""
+        self.mean = self.mean[keep]
+        self.variance = self.variance[keep]
+        self.stddev = self.stddev[keep]
+        self.elements = self.elements[keep]
+        self.count = self.count[keep]
+
+
 class Stopwatch:
     """Measures and prints elapsed time between start and lap/stop."""
     def __init__(self):
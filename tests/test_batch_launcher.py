@@ -0,0 +1,44 @@
+import math
+
+import pytest
+
+from projectile.core.BatchLauncher import BatchLauncher
+from projectile.core.Environment import Environment
+from projectile.core.Launcher import Launcher
+from projectile.core.Position import Position
+from projectile.core.Sweep import long_range_fuel_flow
+from projectile.forces.ThrustForce import ThrustForce, follow_path
+from projectile.util import spherical_to_planar_coord
+
+YAWS = [0, 90, 135, 300]
+
+
+def thrust(yaw: float) -> ThrustForce:
+    def direction(axis: int, force: float, pr):
+        if pr.time < 1.2:
+            return spherical_to_planar_coord(axis, force, math.pi / 4, yaw)
+        return follow_path(axis, force, pr)
+    return ThrustForce(5000, long_range_fuel_flow, 150, 250000, 15, direction)
+
+
+@pytest.fixture(scope="module")
+def batch_impacts():
+    yaws = [math.radians(yaw) for yaw in YAWS]
+    launcher = BatchLauncher([math.pi / 4] * len(yaws), yaws, dt=0.1,
+                             environment=Environment(surface_altitude=lambda pos: 80),
+                             thrusts=[thrust(yaw) for yaw in yaws])
+    return launcher.launch(10000, [Position(0, math.radians(15), 80) for _ in yaws])
+
+
+@pytest.mark.parametrize("index", range(len(YAWS)))
+def test_batch_matches_launcher(batch_impacts, index):
+    yaw = math.radians(YAWS[index])
+    launcher = Launcher(math.pi / 4, yaw, dt=0.1, environment=Environment(surface_altitude=lambda pos: 80),
+                        thrust=thrust(yaw), verbose=False)
+    impact = launcher.launch(10000, Position(0, math.radians(15), 80)).impact.data
+    batch = batch_impacts[index]
+    # tolerances of the BatchLauncher docstring
+    assert batch.latitude == pytest.approx(impact.latitude, abs=1e-7)
+    assert batch.longitude == pytest.approx(impact.longitude, abs=1e-7)
+    assert batch.altitude == pytest.approx(impact.altitude, abs=1e-3)
+    assert batch.time == pytest.approx(impact.time, abs=1e-6)
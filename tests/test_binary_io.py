@@ -0,0 +1,35 @@
+import math
+
+import pytest
+
+from projectile.core.Launcher import Launcher
+from projectile.core.Position import Position
+from projectile.data.BinaryIO import convert_binary_to_csv, BinaryReader, binary_kind, PROJECTILE, FORCES
+from projectile.forces.ThrustForce import ThrustForce
+
+
+def fly(directory, output_format: str, extension: str) -> (str, str):
+    """Short flight written in the given format; names of its projectile and forces files."""
+    projectile, forces = f"{directory}/flight{extension}", f"{directory}/forces{extension}"
+    launcher = Launcher(0.9, 0.3, projectile, None, forces, dt=0.05, output_format=output_format,
+                        thrust=ThrustForce(500, lambda t: 100, 150, 101325, 1), verbose=False)
+    launcher.launch(1000, Position(math.radians(45), math.radians(15), 0), 100)
+    return projectile, forces
+
+
+@pytest.mark.parametrize("compression", ["", ".gz"])
+def test_conversion_matches_csv_writers(tmp_path, compression):
+    csv_files = fly(tmp_path, "csv", ".csv")
+    binary_files = fly(tmp_path, "binary", ".bin" + compression)
+    for kind, csv_file, binary_file in zip((PROJECTILE, FORCES), csv_files, binary_files):
+        assert binary_kind(binary_file) == kind
+        converted = str(tmp_path / f"converted_{kind}.csv")
+        convert_binary_to_csv(binary_file, converted)
+        with open(csv_file, "rb") as expected, open(converted, "rb") as actual:
+            assert actual.read() == expected.read()
+
+
+def test_reader_base_is_abstract(tmp_path):
+    binary_file = fly(tmp_path, "binary", ".bin")[0]
+    with pytest.raises(TypeError):
+        BinaryReader(binary_file)
@@ -0,0 +1,69 @@
+import math
+
+import numpy as np
+import pytest
+
+from projectile.core.Environment import Environment
+from projectile.core.Events import Event
+from projectile.core.Launcher import Launcher
+from projectile.core.Position import Position
+from projectile.forces.ThrustForce import ThrustForce
+
+SURFACE = 80
+CROSSING = 500
+
+
+@pytest.fixture(scope="module", params=[("euler", 0.1), ("dopri5", 0.5)], ids=["euler", "dopri5"])
+def flight(request):
+    """Flight which burns out at 5s, crosses 500m on the way up and down, peaks at ~715m and lands after ~24s."""
+    integrator, dt = request.param
+    launcher = Launcher(1.2, 0.3, dt=dt, environment=Environment(surface_altitude=lambda pos: SURFACE),
+                        thrust=ThrustForce(500, lambda t: 100, 150, 101325, 1), integrator=integrator,
+                        event_altitudes=[CROSSING], verbose=False)
+    return launcher.launch(1000, Position(math.radians(45), math.radians(15), SURFACE), 100)
+
+
+def step_around(flight, time: float) -> (int, int):
+    """Indices of the records before and after the time."""
+    times = flight.trajectory.column("time")
+    after = int(np.searchsorted(times, time))
+    return after - 1, after
+
+
+def test_impact_on_surface(flight):
+    impact = flight.impact.data
+    assert impact.altitude == pytest.approx(SURFACE, abs=1e-3)
+    last = flight.trajectory.point(-1)  # Launcher writes the impact instead of the step below ground
+    assert last.time == impact.time
+    assert last.altitude == pytest.approx(SURFACE, abs=1e-3)
+    assert flight.trajectory.column("altitude")[:-1].min() > SURFACE - 1e-3
+
+
+def test_apogee(flight):
+    apogee = flight.apogee.data
+    before, after = step_around(flight, apogee.time)
+    vz = flight.trajectory.column("Vz")
+    assert vz[before] > 0 >= vz[after]
+    # vertical speed is interpolated linearly, so it's only as close to 0 as one step's change allows
+    assert abs(apogee.z_speed) < vz[before] - vz[after]
+    assert apogee.altitude >= flight.trajectory.column("altitude").max() - 1e-6
+
+
+def test_burnout(flight):
+    burnout, = flight.burnouts
+    assert burnout.detail == 0
+    assert burnout.time == pytest.approx(5, abs=1e-6)  # 500kg at 100kg/s
+    assert burnout.data.remaining_fuel == pytest.approx(0, abs=1e-6)
+
+
+def test_crossings_inside_their_steps(flight):
+    crossings = flight.crossings(CROSSING)
+    assert len(crossings) == 2
+    altitudes = flight.trajectory.column("altitude")
+    times = flight.trajectory.column("time")
+    for crossing in crossings:
+        assert crossing.kind == Event.ALTITUDE
+        assert crossing.data.altitude == pytest.approx(CROSSING, abs=1e-3)
+        before, after = step_around(flight, crossing.time)
+        assert times[before] < crossing.time <= times[after]
+        assert (altitudes[before] - CROSSING) * (altitudes[after] - CROSSING) <= 0
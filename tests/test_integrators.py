@@ -0,0 +1,25 @@
+import math
+
+import pytest
+
+from projectile.core.Environment import Environment
+from projectile.core.Launcher import Launcher
+from projectile.core.Position import Position
+from projectile.core.Sweep import long_range_fuel_flow
+from projectile.forces.ThrustForce import ThrustForce, follow_path
+
+
+def fly_from_rest(integrator: str) -> dict:
+    """Long range rocket launched from rest at 45 degrees, its thrust following its path."""
+    env = Environment(surface_altitude=lambda pos: 80)
+    thrust = ThrustForce(5000, long_range_fuel_flow, 150, 250000, 15, follow_path)
+    launcher = Launcher(math.pi / 4, 0, dt=0.1, environment=env, thrust=thrust, integrator=integrator, verbose=False)
+    return launcher.launch(10000, Position(0, math.radians(15), 80), velocity=0).summary()
+
+
+@pytest.mark.parametrize("integrator", ["euler", "rk4", "verlet", "dopri5"])
+def test_launch_from_rest(integrator):
+    # with pitch and yaw reset to 0 at rest, thrust went horizontal and the flight ended within the first step
+    summary = fly_from_rest(integrator)
+    assert summary["flight_time"] > 300
+    assert summary["max_altitude"] > 100000
@@ -0,0 +1,21 @@
+import math
+
+from projectile.core.Launcher import Launcher
+from projectile.core.Position import Position
+from projectile.forces.ThrustForce import ThrustForce
+
+
+def impact(coast: bool):
+    """Impact of the kepler_coast scenario's sounding rocket (apogee ~530km)."""
+    launcher = Launcher(1.35, 0.3, dt=0.05, thrust=ThrustForce(3000, lambda t: 60, 2500, 101325, 0.1),
+                        integrator="dopri5", cartesian=True, kepler_coast=coast, verbose=False)
+    return launcher.launch(1000, Position(math.radians(50), math.radians(15), 0), 100,
+                           lambda axis, pitch, yaw: 0.5).impact.data
+
+
+def test_coast_close_to_stepped_flight():
+    # not equivalent: stepped flights take the centrifugal force at earth_radius, see KeplerCoast
+    stepped, coasted = impact(False), impact(True)
+    assert abs(coasted.time - stepped.time) < 0.1
+    assert abs(coasted.latitude - stepped.latitude) * 6378137 < 300
+    assert abs(coasted.longitude - stepped.longitude) * 6378137 * math.cos(stepped.latitude) < 300
@@ -0,0 +1,40 @@
+import re
+import zipfile
+
+import numpy as np
+
+from projectile.data.LodKmzWriter import LodKmzWriter
+
+
+def regions(filename: str) -> list:
+    """West and east (degrees) of every Region in the KMZ."""
+    boxes = []
+    with zipfile.ZipFile(filename) as kmz:
+        for name in kmz.namelist():
+            kml = kmz.read(name).decode()
+            boxes += [(float(west), float(east)) for east, west in
+                      re.findall(r"<east>([^<]+)</east><west>([^<]+)</west>", kml)]
+    return boxes
+
+
+def test_track_across_antimeridian(tmp_path):
+    # eastward from 170E to 170W, written in chunks which don't line up with tiles
+    count = 5000
+    rows = np.zeros([count, 11])
+    rows[:, 0] = np.arange(count)
+    rows[:, 2] = np.radians(10)
+    rows[:, 3] = (np.radians(np.linspace(170, 190, count)) + np.pi) % (2 * np.pi) - np.pi
+    rows[:, 4] = 1000
+    filename = str(tmp_path / "flight.kmz")
+    writer = LodKmzWriter(filename, tile_rows=100)
+    for chunk in np.array_split(rows, 7):
+        writer.write_rows(chunk)
+    writer.close()
+    boxes = regions(filename)
+    assert boxes
+    for west, east in boxes:
+        width = (east - west) % 360
+        assert width <= 20 + 1e-9  # not the whole Earth
+        assert west >= 170 - 1e-9 or west < -170 + 1e-9
+        assert east <= -170 + 1e-9 or east > 170 - 1e-9
+    assert any(west > east for west, east in boxes)  # tiles across the antimeridian
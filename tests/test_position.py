@@ -0,0 +1,54 @@
+import math
+
+import pytest
+
+from projectile.core.Environment import Environment
+from projectile.core.Position import Position
+from projectile.forces.ThrustForce import ThrustForce
+
+ANGLE_BOUND = 5e-11  # rad, over the first 50s of the flight
+ALTITUDE_BOUND = 2.5e-4  # m
+
+
+class UncompensatedPosition(Position):
+    def move(self, dlat, dlon, dalt) -> None:
+        self.lat += dlat
+        self.lon += dlon
+        self.alt += dalt
+
+
+def fly(position: Position, steps=5000) -> list:
+    """Positions of the float_precision scenario's flight after each of its first steps."""
+    env = Environment(surface_altitude=lambda p: 80)
+    pr = env.create_projectile(8000, position, lambda axis, pitch, yaw: 20, lambda axis, pitch, yaw: 0.1)
+    pr.launch_at_angle(0.9, 0.3, 0)
+    pr.add_thrust(ThrustForce(3500, lambda t: 600 if t < 1 else 300 if t < 3 else 100, 150, 200000, 12))
+    trajectory = []
+    for _ in range(steps):
+        pr.advance(0.01)
+        trajectory.append((pr.position.lat, pr.position.lon, pr.position.alt))
+    return trajectory
+
+
+def deviations(trajectory: list, reference: list) -> list:
+    """Largest difference of latitude, longitude and altitude from the reference."""
+    return [max(abs(float(a[i] - b[i])) for a, b in zip(trajectory, reference)) for i in range(3)]
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return fly(Position(math.radians(50), math.radians(45), 80, "float128"))
+
+
+def test_compensated_float64_matches_float128(reference):
+    # measured: 3e-12 and 2e-11 rad, 9e-5m; without compensation 7e-11 and 9e-11 rad, 5e-4m
+    lat, lon, alt = deviations(fly(Position(math.radians(50), math.radians(45), 80)), reference)
+    assert lat < ANGLE_BOUND and lon < ANGLE_BOUND
+    assert alt < ALTITUDE_BOUND
+
+
+def test_uncompensated_float64_deviates(reference):
+    # what the bounds above guard against: plain float64 sums drift well past them
+    lat, lon, alt = deviations(fly(UncompensatedPosition(math.radians(50), math.radians(45), 80)), reference)
+    assert lat > ANGLE_BOUND and lon > ANGLE_BOUND
+    assert alt > ALTITUDE_BOUND
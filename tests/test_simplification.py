@@ -0,0 +1,28 @@
+import numpy as np
+
+from projectile.data.DataPoints import PROJECTILE_COLUMNS
+from projectile.data.KmlWriter import KmlWriter
+from projectile.util import douglas_peucker
+
+
+def test_douglas_peucker_edge_cases():
+    assert douglas_peucker(np.zeros([0, 3]), 1).tolist() == []
+    assert douglas_peucker(np.zeros([1, 3]), 1).tolist() == [0]
+    line = np.column_stack([np.arange(10.0), np.zeros(10), np.zeros(10)])
+    line[4, 1] = 5
+    assert douglas_peucker(line, 3).tolist() == [0, 4, 9]
+
+
+def test_kml_writer_takes_empty_and_single_row_chunks(tmp_path):
+    rows = np.zeros([5, len(PROJECTILE_COLUMNS)])
+    rows[:, 0] = np.arange(5)
+    rows[:, 2] = np.linspace(0, 1e-3, 5)
+    rows[:, 4] = 100
+    filename = str(tmp_path / "flight.kml")
+    writer = KmlWriter(filename, tolerance=1)
+    writer.write_header()
+    for chunk in (rows[:0], rows[:1], rows[1:1], rows[1:]):
+        writer.write_rows(chunk)
+    writer.close()
+    with open(filename) as file:
+        assert file.read().count("<LineString>") == 1  # the points are on a straight line
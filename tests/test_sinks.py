@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from projectile.data.DataPoints import PROJECTILE_COLUMNS
+from projectile.data.Sinks import Decimator, DecimationPolicy, ErrorBounded, EveryKth, TimeInterval
+
+LATITUDE, LONGITUDE, ALTITUDE = (PROJECTILE_COLUMNS.index(name) for name in ("latitude", "longitude", "altitude"))
+
+
+class Collector:
+    """Sink which keeps the rows it gets."""
+    def __init__(self):
+        self.rows = []
+
+    def write_header(self):
+        pass
+
+    def write_rows(self, rows: np.ndarray):
+        self.rows.append(np.array(rows))
+
+    def close(self):
+        pass
+
+    def array(self) -> np.ndarray:
+        return np.concatenate(self.rows) if self.rows else np.zeros([0, len(PROJECTILE_COLUMNS)])
+
+
+def flight_rows(rng: np.random.Generator, count=3000) -> np.ndarray:
+    """Rows of a wandering flight, with uneven time steps."""
+    rows = np.zeros([count, len(PROJECTILE_COLUMNS)])
+    rows[:, 0] = np.cumsum(rng.uniform(0.001, 0.05, count))
+    for column, scale in ((LATITUDE, 2e-9), (LONGITUDE, 2e-9), (ALTITUDE, 0.01)):
+        rows[:, column] = np.cumsum(np.cumsum(rng.normal(0, scale, count)))
+    return rows
+
+
+def decimate(policy: DecimationPolicy, rows: np.ndarray, rng: np.random.Generator, pinned=()) -> np.ndarray:
+    """Rows kept by the policy, with the rows passed in chunks of random sizes."""
+    sink = Collector()
+    decimator = Decimator(sink, policy, pinned=set(pinned))
+    bounds = np.sort(rng.choice(np.arange(1, len(rows)), 12, replace=False))
+    for chunk in np.split(rows, bounds):
+        decimator.write_rows(chunk)
+    decimator.close()
+    return sink.array()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_error_bounded_within_tolerance(seed):
+    rng = np.random.default_rng(seed)
+    rows = flight_rows(rng)
+    tolerances = {"latitude": 1e-7, "longitude": 2e-7, "altitude": 0.5}
+    kept = decimate(ErrorBounded(tolerances), rows, rng)
+    assert len(kept) < len(rows) / 3
+    assert kept[0, 0] == rows[0, 0] and kept[-1, 0] == rows[-1, 0]
+    for name, tolerance in tolerances.items():
+        column = PROJECTILE_COLUMNS.index(name)
+        interpolated = np.interp(rows[:, 0], kept[:, 0], kept[:, column])
+        assert np.abs(interpolated - rows[:, column]).max() <= tolerance * (1 + 1e-9)
+
+
+@pytest.mark.parametrize("policy", [lambda: EveryKth(7), lambda: TimeInterval(0.5),
+                                    lambda: ErrorBounded({"altitude": 5.0})], ids=["every_kth", "time", "error"])
+def test_pinned_first_and_last_rows_kept(policy):
+    rng = np.random.default_rng(1)
+    rows = flight_rows(rng)
+    pinned = rows[rng.choice(len(rows), 20, replace=False), 0]
+    kept = decimate(policy(), rows, rng, pinned)
+    assert len(kept) < len(rows)
+    for time in [rows[0, 0], rows[-1, 0], *pinned]:
+        assert np.count_nonzero(kept[:, 0] == time) == 1
+    assert np.all(np.diff(kept[:, 0]) > 0)
+
+
+def test_time_interval_across_chunks():
+    rng = np.random.default_rng(2)
+    rows = flight_rows(rng)
+    rows[:, 0] = 3 + np.arange(len(rows)) * 0.013
+    interval = 0.25
+    kept = decimate(TimeInterval(interval), rows, rng)
+    # the first row at or after each multiple of the interval from the first row, and the last row
+    slots = np.floor((rows[:, 0] - rows[0, 0]) / interval + 1e-9)
+    expected = rows[np.concatenate([[True], slots[1:] != slots[:-1]])]
+    if expected[-1, 0] != rows[-1, 0]:
+        expected = np.concatenate([expected, rows[-1:]])
+    assert np.array_equal(kept, expected)
+
+
+def test_policy_needs_select():
+    with pytest.raises(TypeError):
+        DecimationPolicy()
@@ -0,0 +1,26 @@
+import pytest
+
+from projectile.core.Sweep import parse_values, grid
+
+
+def test_ranges_exclude_stop():
+    assert parse_values("8:20:4") == [8, 12, 16]
+    assert parse_values("1:1.3:0.1") == pytest.approx([1.0, 1.1, 1.2])
+    assert parse_values("0:1:0.25") == [0, 0.25, 0.5, 0.75]
+    assert parse_values("10:4:-3") == [10, 7]
+    assert parse_values("5:5:1") == []
+
+
+def test_zero_step_rejected():
+    with pytest.raises(ValueError, match="Step"):
+        parse_values("1:2:0")
+
+
+def test_lists_and_text():
+    assert parse_values("1,2.5,-3") == [1, 2.5, -3]
+    assert parse_values(".bz2") == [".bz2"]
+    assert parse_values("scenario_data/x/") == ["scenario_data/x/"]
+
+
+def test_grid():
+    assert grid(pitch=[30, 45], yaw=[0]) == [{"pitch": 30, "yaw": 0}, {"pitch": 45, "yaw": 0}]